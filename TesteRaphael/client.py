@@ -16,6 +16,7 @@ class ChatClient:
         self.socket = socket.socket(socket.AF_INET, socket.SOCK_STREAM)
         self.running = False
         self.secret_key = os.urandom(32)  # Chave AES-256
+        self.cipher = Cipher(algorithms.AES(self.secret_key), modes.CFB(b'\0' * 16))  # Reutilizado em todas as mensagens
         self.message_queue = queue.Queue()
         self.receive_thread = None
         self.lock = threading.Lock()
@@ -46,8 +47,7 @@ class ChatClient:
             self.socket.send(encrypted_secret_key)
             
             # Enviar nome de usuário criptografado
-            cipher = Cipher(algorithms.AES(self.secret_key), modes.CFB(b'\0' * 16))
-            encryptor = cipher.encryptor()
+            encryptor = self.cipher.encryptor()
             encrypted_username = encryptor.update(username.encode('utf-8')) + encryptor.finalize()
             self.socket.send(encrypted_username)
             
@@ -93,8 +93,7 @@ class ChatClient:
                 self.display_messages()
                     
                 # Criptografar mensagem
-                cipher = Cipher(algorithms.AES(self.secret_key), modes.CFB(b'\0' * 16))
-                encryptor = cipher.encryptor()
+                encryptor = self.cipher.encryptor()
                 encrypted_message = encryptor.update(message.encode('utf-8')) + encryptor.finalize()
                 self.socket.send(encrypted_message)
             
@@ -111,8 +110,7 @@ class ChatClient:
                     break
                     
                 # Decriptografar mensagem
-                cipher = Cipher(algorithms.AES(self.secret_key), modes.CFB(b'\0' * 16))
-                decryptor = cipher.decryptor()
+                decryptor = self.cipher.decryptor()
                 message = decryptor.update(encrypted_message) + decryptor.finalize()
                 
                 try:
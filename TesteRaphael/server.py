@@ -93,6 +93,7 @@ class ChatServer:
             
             # Receber nome do usuário criptografado
             encrypted_username = client_socket.recv(1024)
+            # Objeto Cipher criado uma vez por cliente e reutilizado em todas as mensagens
             cipher = Cipher(algorithms.AES(secret_key), modes.CFB(b'\0' * 16))
             decryptor = cipher.decryptor()
             username = decryptor.update(encrypted_username) + decryptor.finalize()
@@ -102,7 +103,8 @@ class ChatServer:
             with self.clients_lock:
                 self.clients[client_socket] = {
                     'username': username,
-                    'secret_key': secret_key
+                    'secret_key': secret_key,
+                    'cipher': cipher
                 }
             
             # Iniciar thread para receber mensagens do cliente
@@ -145,8 +147,7 @@ class ChatServer:
                 client_info = self.clients[client_socket]
             
             # Decriptografar mensagem
-            cipher = Cipher(algorithms.AES(client_info['secret_key']), modes.CFB(b'\0' * 16))
-            decryptor = cipher.decryptor()
+            decryptor = client_info['cipher'].decryptor()
             message = decryptor.update(encrypted_message) + decryptor.finalize()
             message = message.decode('utf-8')
             
@@ -165,8 +166,7 @@ class ChatServer:
             if client_socket != sender_socket:
                 try:
                     # Criptografar mensagem com a chave do cliente
-                    cipher = Cipher(algorithms.AES(client_info['secret_key']), modes.CFB(b'\0' * 16))
-                    encryptor = cipher.encryptor()
+                    encryptor = client_info['cipher'].encryptor()
                     encrypted_message = encryptor.update(message.encode()) + encryptor.finalize()
                     client_socket.send(encrypted_message)
                 except Exception as e:
@@ -0,0 +1,71 @@
+# shared/compression.py
+import lzma
+import zlib
+
+# Corpos menores que isto não compensam a compressão
+MIN_COMPRESS_SIZE = 1024
+# Só é enviado comprimido o que encolher ao menos para esta fração do original
+MAX_COMPRESSED_RATIO = 0.9
+# Amostra usada para decidir se um arquivo é compressível: alguns trechos espalhados
+SAMPLE_SLICES = 4
+SAMPLE_SLICE_SIZE = 1024
+
+def _zlib_decompress(data, max_size):
+    decompressor = zlib.decompressobj()
+    out = decompressor.decompress(data, max_size)
+    if decompressor.unconsumed_tail or not decompressor.eof:
+        raise ValueError("Dados comprimidos inválidos ou maiores que o limite")
+    return out
+
+def _lzma_decompress(data, max_size):
+    decompressor = lzma.LZMADecompressor()
+    out = decompressor.decompress(data, max_size)
+    if not decompressor.eof:
+        raise ValueError("Dados comprimidos inválidos ou maiores que o limite")
+    return out
+
+# Codecs por nome: (comprimir(dados), descomprimir(dados, tamanho máximo))
+CODECS = {
+    'zlib': (lambda data: zlib.compress(data, 1), _zlib_decompress),
+    'lzma': (lambda data: lzma.compress(data, preset=1), _lzma_decompress),
+}
+# Preferência padrão do cliente: zlib é rápido o bastante para não limitar a transferência
+DEFAULT_COMPRESSION = ['zlib', 'lzma']
+
+def register_codec(name, compress, decompress):
+    """Acrescenta um codec (por exemplo, um mais rápido de fora da biblioteca padrão)"""
+    CODECS[name] = (compress, decompress)
+
+def choose_codec(offered):
+    """Primeiro codec da lista do cliente que este lado conhece; None se nenhum"""
+    for name in offered or []:
+        if name in CODECS:
+            return name
+    return None
+
+class Compressor:
+    """Compressão negociada de uma sessão, aplicada antes da cifra"""
+
+    def __init__(self, name):
+        self.name = name
+        self._compress, self._decompress = CODECS[name]
+
+    def probe(self, data):
+        """Comprime rapidamente alguns trechos de data para estimar se vale a pena"""
+        if len(data) < MIN_COMPRESS_SIZE:
+            return False
+        step = max(SAMPLE_SLICE_SIZE, len(data) // SAMPLE_SLICES)
+        sample = b''.join(bytes(data[i:i + SAMPLE_SLICE_SIZE]) for i in range(0, len(data), step))
+        return len(zlib.compress(sample, 1)) <= len(sample) * MAX_COMPRESSED_RATIO
+
+    def compress(self, data):
+        """Corpo comprimido, ou None se for pequeno demais ou não encolher o suficiente"""
+        if len(data) < MIN_COMPRESS_SIZE:
+            return None
+        packed = self._compress(data)
+        if len(packed) > len(data) * MAX_COMPRESSED_RATIO:
+            return None
+        return packed
+
+    def decompress(self, data, max_size):
+        return self._decompress(data, max_size)
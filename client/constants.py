@@ -1,6 +1,14 @@
 # shared/constants.py
 import json
 
-HEADER_SIZE = 10
 ENCODING = 'utf-8'
-SYMMETRIC_CIPHERS = ['AES', 'DES', 'Blowfish']  # 3 tipos de criptografia simétrica
\ No newline at end of file
+SYMMETRIC_CIPHERS = ['AES', 'DES', 'Blowfish', 'AES-GCM', 'ChaCha20-Poly1305']  # Tipos de criptografia simétrica
+AEAD_CIPHERS = ['AES-GCM', 'ChaCha20-Poly1305']  # Autenticadas, em ordem de preferência
+DH_CURVES = ['SECP384R1', 'X25519']  # Curvas da troca Diffie-Hellman; X25519 é a mais rápida
+CHUNK_SIZE = 64 * 1024  # Tamanho de cada bloco na transferência de arquivos
+
+
+# Retomada de sessão: rótulos do HKDF (iguais no cliente e no servidor) e tamanho dos nonces
+RESUMPTION_INFO = b'resumption secret'
+RESUMED_SESSION_INFO = b'resumed session'
+RESUME_NONCE_SIZE = 16
\ No newline at end of file
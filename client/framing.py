@@ -0,0 +1,234 @@
+# shared/framing.py
+import asyncio
+import contextlib
+import json
+import os
+import select
+import socket
+import struct
+import threading
+import time
+from constants import ENCODING, CHUNK_SIZE
+
+# Cabeçalho binário fixo: tipo (1 byte), flags (1 byte), id da requisição (4 bytes), tamanho do corpo (4 bytes)
+FRAME_HEADER = struct.Struct('!BBII')
+FRAME_HEADER_SIZE = FRAME_HEADER.size
+# Dados associados das cifras AEAD: amarram cada quadro cifrado ao seu tipo, flags e requisição
+FRAME_AAD = struct.Struct('!BBI')
+MAX_FRAME_SIZE = 16 * 1024 * 1024
+
+# Tipos de quadro
+FRAME_CONTROL = 1    # JSON em texto claro (autenticação e troca de chaves)
+FRAME_ENCRYPTED = 2  # JSON de controle criptografado com a chave de sessão
+FRAME_DATA = 3       # Bloco binário criptografado (conteúdo de arquivo)
+
+# Flags de quadro
+FLAG_STORED = 0x01   # Bloco já cifrado em disco com a chave do arquivo; não passa pela cifra de sessão
+FLAG_COMPRESSED = 0x02  # Corpo comprimido com o codec da sessão antes de ser cifrado
+
+# Corpos pequenos vão junto com o cabeçalho em um único envio
+_COALESCE_LIMIT = 64 * 1024
+
+class FrameError(Exception):
+    pass
+
+def frame_aad(frame_type, stream, flags=0):
+    return FRAME_AAD.pack(frame_type, flags, stream)
+
+def send_frame(sock, frame_type, payload, flags=0, stream=0):
+    """Envia um quadro: cabeçalho binário seguido do corpo bruto"""
+    if len(payload) > MAX_FRAME_SIZE:
+        raise FrameError("Quadro maior que o limite permitido")
+    header = FRAME_HEADER.pack(frame_type, flags, stream, len(payload))
+    if len(payload) <= _COALESCE_LIMIT:
+        sock.sendall(header + payload)
+    else:
+        sock.sendall(header)
+        sock.sendall(payload)
+
+def seal_frame_into(buffer, frame_type, data, session, stream=0, compress=False):
+    """Monta em buffer um quadro com data cifrado pela sessão; retorna o tamanho total.
+
+    Com compress, data passa antes pelo codec negociado na sessão, se encolher.
+    """
+    flags = 0
+    if compress and session.compressor is not None:
+        packed = session.compressor.compress(data)
+        if packed is not None:
+            data, flags = packed, FLAG_COMPRESSED
+    view = memoryview(buffer)
+    length = session.seal_into(data, view[FRAME_HEADER_SIZE:], frame_aad(frame_type, stream, flags))
+    if length > MAX_FRAME_SIZE:
+        raise FrameError("Quadro maior que o limite permitido")
+    FRAME_HEADER.pack_into(buffer, 0, frame_type, flags, stream, length)
+    return FRAME_HEADER_SIZE + length
+
+def sealed_frame(frame_type, data, session, stream=0, compress=False):
+    """Quadro cifrado pronto para envio, montado em uma única alocação"""
+    buffer = bytearray(FRAME_HEADER_SIZE + session.buffer_size(len(data)))
+    size = seal_frame_into(buffer, frame_type, data, session, stream, compress)
+    return memoryview(buffer)[:size]
+
+def open_frame(session, frame_type, flags, stream, payload):
+    """Decifra o corpo de um quadro e desfaz a compressão, se marcada"""
+    data = session.open(payload, frame_aad(frame_type, stream, flags))
+    if flags & FLAG_COMPRESSED:
+        if session.compressor is None:
+            raise FrameError("Quadro comprimido sem compressão negociada")
+        data = session.compressor.decompress(data, MAX_FRAME_SIZE)
+    return data
+
+def compression_plan(session, chunks):
+    """Gera (bloco, comprimir) com uma decisão por arquivo, tirada da amostra do primeiro bloco"""
+    compress = None
+    for chunk in chunks:
+        if compress is None:
+            compress = session.compressor is not None and session.compressor.probe(chunk)
+        yield chunk, compress
+
+class FrameChannel:
+    """Conexão com leitura de quadros em buffer reutilizável (recv_into).
+
+    Várias threads podem enviar ao mesmo tempo (cada quadro sai inteiro, sob
+    um lock); a leitura fica com uma única thread. Com send_timeout, um envio
+    que fica parado mais que isso (o outro lado não lê) encerra a conexão.
+    """
+
+    def __init__(self, sock, buffer_size=CHUNK_SIZE + 1024, send_timeout=None):
+        self.sock = sock
+        # Cada quadro sai inteiro em um envio; o algoritmo de Nagle só atrasaria o próximo
+        sock.setsockopt(socket.IPPROTO_TCP, socket.TCP_NODELAY, 1)
+        if send_timeout is not None:
+            # Vale para o quadro inteiro (sendall); na leitura, o prazo esgotado só recomeça a espera
+            sock.settimeout(send_timeout)
+        self._send_lock = threading.Lock()
+        self._send_buffer = bytearray(buffer_size)
+        self._header = bytearray(FRAME_HEADER_SIZE)
+        self._header_view = memoryview(self._header)
+        self._buffer = bytearray(buffer_size)
+        self._view = memoryview(self._buffer)
+
+    @contextlib.contextmanager
+    def _sending(self):
+        with self._send_lock:
+            try:
+                yield
+            except OSError:
+                # Um quadro enviado pela metade desalinha a conexão: fecha os dois sentidos,
+                # o que também libera a thread de leitura
+                try:
+                    self.sock.shutdown(socket.SHUT_RDWR)
+                except OSError:
+                    pass
+                raise
+
+    def send(self, frame_type, payload, flags=0, stream=0):
+        with self._sending():
+            send_frame(self.sock, frame_type, payload, flags, stream)
+
+    def send_sealed(self, frame_type, data, session, stream=0, compress=False):
+        """Cifra data direto no buffer de envio reutilizável e envia o quadro de uma vez"""
+        with self._sending():
+            needed = FRAME_HEADER_SIZE + session.buffer_size(len(data))
+            if needed > len(self._send_buffer):
+                self._send_buffer = bytearray(needed)
+            size = seal_frame_into(self._send_buffer, frame_type, data, session, stream, compress)
+            with memoryview(self._send_buffer) as view:
+                self.sock.sendall(view[:size])
+
+    def send_file(self, frame_type, f, offset, count, stream=0, flags=0):
+        """Envia count bytes de f (já no formato do corpo) como um quadro, via os.sendfile.
+
+        O conteúdo vai do cache de páginas direto para o socket, sem passar pelo Python.
+        """
+        if count > MAX_FRAME_SIZE:
+            raise FrameError("Quadro maior que o limite permitido")
+        with self._sending():
+            self.sock.sendall(FRAME_HEADER.pack(frame_type, flags, stream, count))
+            timeout = self.sock.gettimeout()
+            deadline = time.monotonic() + timeout if timeout is not None else None
+            sent = 0
+            while sent < count:
+                try:
+                    n = os.sendfile(self.sock.fileno(), f.fileno(), offset + sent, count - sent)
+                except BlockingIOError:
+                    # Socket com prazo é não bloqueante por baixo: espera poder enviar, até o prazo
+                    remaining = deadline - time.monotonic()
+                    if remaining <= 0 or not select.select([], [self.sock], [], remaining)[1]:
+                        raise socket.timeout("Envio parado além do prazo")
+                    continue
+                if n == 0:
+                    raise ConnectionError("Arquivo terminou antes do fim do quadro")
+                sent += n
+
+    def recv(self):
+        """Recebe um quadro completo; retorna (tipo, flags, id, corpo) ou None se a conexão fechou.
+
+        O corpo é uma memoryview sobre o buffer interno e só é válido até a próxima chamada.
+        """
+        if not self._recv_into(self._header_view, FRAME_HEADER_SIZE):
+            return None
+        frame_type, flags, stream, length = FRAME_HEADER.unpack(self._header)
+        if length > MAX_FRAME_SIZE:
+            raise FrameError("Quadro maior que o limite permitido")
+        if length > len(self._buffer):
+            self._grow(length)
+        if length and not self._recv_into(self._view, length):
+            raise ConnectionError("Conexão encerrada no meio de um quadro")
+        return frame_type, flags, stream, self._view[:length]
+
+    def _grow(self, length):
+        size = len(self._buffer)
+        while size < length:
+            size *= 2
+        self._buffer = bytearray(min(size, MAX_FRAME_SIZE))
+        self._view = memoryview(self._buffer)
+
+    def _recv_into(self, view, length):
+        received = 0
+        while received < length:
+            try:
+                count = self.sock.recv_into(view[received:length])
+            except socket.timeout:
+                continue
+            if not count:
+                if received:
+                    raise ConnectionError("Conexão encerrada no meio de um quadro")
+                return False
+            received += count
+        return True
+
+async def read_frame_async(reader):
+    """Versão asyncio de FrameChannel.recv sobre um StreamReader"""
+    try:
+        header = await reader.readexactly(FRAME_HEADER_SIZE)
+    except asyncio.IncompleteReadError as e:
+        if e.partial:
+            raise ConnectionError("Conexão encerrada no meio de um quadro")
+        return None
+    frame_type, flags, stream, length = FRAME_HEADER.unpack(header)
+    if length > MAX_FRAME_SIZE:
+        raise FrameError("Quadro maior que o limite permitido")
+    try:
+        payload = await reader.readexactly(length)
+    except asyncio.IncompleteReadError:
+        raise ConnectionError("Conexão encerrada no meio de um quadro")
+    return frame_type, flags, stream, payload
+
+async def write_frame_async(writer, frame_type, payload, flags=0, stream=0):
+    """Versão asyncio de send_frame; aguarda o escoamento do buffer de escrita"""
+    if len(payload) > MAX_FRAME_SIZE:
+        raise FrameError("Quadro maior que o limite permitido")
+    header = FRAME_HEADER.pack(frame_type, flags, stream, len(payload))
+    if len(payload) <= _COALESCE_LIMIT:
+        writer.write(header + payload)
+    else:
+        writer.write(header)
+        writer.write(payload)
+    await writer.drain()
+
+def encode_json(data):
+    return json.dumps(data).encode(ENCODING)
+
+def decode_json(payload):
+    return json.loads(str(payload, ENCODING))
\ No newline at end of file
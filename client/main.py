@@ -1,23 +1,276 @@
 # client/main.py
+import io
+import os
 import socket
 import json
-from crypto_utils import CryptoUtils
+import hashlib
+import itertools
+import threading
+import time
+from concurrent.futures import Future, ThreadPoolExecutor
+from cryptography.hazmat.primitives import hashes, serialization
+from cryptography.hazmat.primitives.kdf.hkdf import HKDF
+from cryptography.hazmat.backends import default_backend
+from crypto_utils import CryptoUtils, SessionCipher
+from key_pool import get_key_pool
+from bundle import iter_bundle, BundleReader
+from chunk_cipher import ChunkCipher, stored_chunk_count
+from delta import compute_delta
+from compression import DEFAULT_COMPRESSION
 from constants import *
+from framing import *
+
+# Arquivos a partir deste tamanho são enviados como delta sobre a versão do servidor
+DELTA_MIN_SIZE = 1024 * 1024
+# O delta é abandonado quando os bytes novos passam desta fração do arquivo
+DELTA_MAX_LITERAL_RATIO = 0.5
+# Transferências paralelas: conexões por arquivo e menor trecho que justifica uma conexão a mais
+PARALLEL_CONNECTIONS = 4
+PARALLEL_MIN_PART = 4 * 1024 * 1024
+# Ticket com menos que isto de validade é renovado antes de abrir conexões paralelas
+TICKET_REFRESH_MARGIN = 60
+
+class PendingRequest:
+    """Requisição enviada que aguarda resposta; resolvida pela thread leitora"""
+
+    def __init__(self, transform):
+        self.future = Future()
+        self.transform = transform
+        self.done = False
+
+    def on_response(self, response):
+        self.done = True
+        self.future.set_result(self.transform(response))
+
+    def on_chunk(self, chunk):
+        raise FrameError("Bloco de dados inesperado")
+
+    def on_stored_chunk(self, chunk):
+        raise FrameError("Bloco de dados inesperado")
+
+    def fail(self, error):
+        self.done = True
+        if not self.future.done():
+            self.future.set_exception(error)
+
+class PendingDownload(PendingRequest):
+    """Download em andamento: o cabeçalho traz o tamanho e os blocos vão direto para o arquivo.
+
+    Se o arquivo estiver cifrado em disco no servidor, o cabeçalho traz também
+    a chave do arquivo e os blocos chegam como estão guardados (FLAG_STORED).
+    Um trecho recusado pelo cabeçalho falha na hora, mas continua registrado
+    (draining) descartando os blocos que o servidor ainda envia até o último.
+    """
+
+    def __init__(self, save_path, part=None):
+        super().__init__(None)
+        self.save_path = save_path
+        # (posição, tamanho, tamanho total) quando é um trecho de um download paralelo
+        self.part = part
+        self.file = None
+        self.remaining = 0
+        self.cipher = None
+        self.index = 0
+        self.chunk_count = 0
+        self.draining = False
+
+    def on_response(self, response):
+        if self.draining:
+            # Erro do servidor no meio dos blocos descartados: nada mais chega para esta requisição
+            self.done = True
+            return
+        if self.file is not None:
+            # Erro do servidor no meio do envio: descarta o arquivo parcial
+            self._close()
+            return super().fail(ConnectionError("Download interrompido pelo servidor"))
+        if response['status'] != 'success':
+            self.done = True
+            return self.future.set_result(False)
+        self.remaining = response['size']
+        if self.part is not None:
+            _, length, total = self.part
+            if (length is not None and response['size'] != length) or (total is not None and response.get('total') != total):
+                super().fail(ValueError("Arquivo alterado no servidor durante o download"))
+                return self._drain(response)
+        self.file = self._open_file()
+        storage = response.get('storage')
+        if storage is not None:
+            # Mesmo um arquivo vazio tem o bloco final, que encerra o download
+            self.cipher = ChunkCipher(bytes.fromhex(storage['key']))
+            self.chunk_count = stored_chunk_count(self.remaining, storage['chunk_size'])
+        elif self.remaining == 0:
+            self._finish()
+
+    def _open_file(self):
+        if self.part is None:
+            return open(self.save_path, 'wb')
+        # Trecho: grava na sua posição, em um arquivo que já existe
+        f = open(self.save_path, 'r+b')
+        f.seek(self.part[0])
+        return f
+
+    def _drain(self, response):
+        self.draining = True
+        storage = response.get('storage')
+        if storage is not None:
+            self.chunk_count = stored_chunk_count(self.remaining, storage['chunk_size'])
+        self.done = storage is None and self.remaining == 0
+
+    def on_chunk(self, chunk):
+        if self.draining and self.chunk_count == 0:
+            self.remaining -= len(chunk)
+            self.done = self.remaining <= 0
+            return
+        if self.file is None or self.cipher is not None or len(chunk) > self.remaining:
+            raise FrameError("Bloco de download inesperado")
+        self.file.write(chunk)
+        self.remaining -= len(chunk)
+        if self.remaining == 0:
+            self._finish()
+
+    def on_stored_chunk(self, chunk):
+        if self.draining and self.index < self.chunk_count:
+            self.index += 1
+            self.done = self.index == self.chunk_count
+            return
+        if self.cipher is None or self.index >= self.chunk_count:
+            raise FrameError("Bloco de download inesperado")
+        last = self.index == self.chunk_count - 1
+        data = self.cipher.open(self.index, last, chunk)
+        if len(data) > self.remaining:
+            raise FrameError("Bloco de download inesperado")
+        self.file.write(data)
+        self.remaining -= len(data)
+        self.index += 1
+        if last:
+            if self.remaining:
+                raise FrameError("Arquivo cifrado menor que o tamanho anunciado")
+            self._finish()
+
+    def _finish(self):
+        self.file.close()
+        self.done = True
+        self.future.set_result(True)
+
+    def _close(self):
+        if self.file is not None:
+            self.file.close()
+
+    def fail(self, error):
+        self._close()
+        super().fail(error)
+
+class PendingRangeRead(PendingDownload):
+    """Trecho de um arquivo lido para a memória; o resultado são os bytes, ou None se o arquivo não existir"""
+
+    def __init__(self, offset):
+        super().__init__(None, (offset, None, None))
+
+    def on_response(self, response):
+        if self.file is None and not self.draining and response['status'] != 'success':
+            self.done = True
+            return self.future.set_result(None)
+        super().on_response(response)
+
+    def _open_file(self):
+        return io.BytesIO()
+
+    def _finish(self):
+        data = self.file.getvalue()
+        self.file.close()
+        self.done = True
+        self.future.set_result(data)
+
+class PendingBatchDownload(PendingRequest):
+    """Download em pacote: o manifesto traz o status de cada arquivo e o fluxo é separado por BundleReader"""
+
+    def __init__(self, save_dir):
+        super().__init__(None)
+        self.save_dir = save_dir
+        self.reader = None
+        self.results = {}
+        self.found = []
+        self.file = None
+
+    def on_response(self, response):
+        if self.reader is not None or response['status'] != 'success':
+            self._close()
+            return super().fail(ConnectionError("Download em pacote recusado ou interrompido pelo servidor"))
+        for entry in response['files']:
+            self.results[entry['filename']] = entry['status']
+        self.found = [entry for entry in response['files'] if entry['status'] == 'success']
+        self.reader = BundleReader(
+            [entry['size'] for entry in self.found],
+            response.get('compression'),
+            self._on_data,
+            self._on_end
+        )
+        self._check_complete()
+
+    def on_chunk(self, chunk):
+        if self.reader is None:
+            raise FrameError("Bloco de download inesperado")
+        self.reader.feed(chunk)
+        self._check_complete()
+
+    def _open(self, index):
+        if self.file is None:
+            # Só o nome base: o servidor não escolhe onde gravar no cliente
+            filename = os.path.basename(self.found[index]['filename'])
+            self.file = open(os.path.join(self.save_dir, filename), 'wb')
+        return self.file
+
+    def _on_data(self, index, data):
+        self._open(index).write(data)
+
+    def _on_end(self, index):
+        self._open(index).close()
+        self.file = None
+
+    def _check_complete(self):
+        if self.reader.complete:
+            self.done = True
+            self.future.set_result(self.results)
+
+    def _close(self):
+        if self.file is not None:
+            self.file.close()
+            self.file = None
+
+    def fail(self, error):
+        self._close()
+        super().fail(error)
 
 class FileClient:
-    def __init__(self, host='localhost', port=5000):
+    # Chaves públicas dos servidores já carregadas neste processo, por host:porta
+    _server_keys = {}
+    
+    def __init__(self, host='localhost', port=5000, ticket=None, known_servers_path='known_servers.json',
+                 compression=DEFAULT_COMPRESSION):
         self.host = host
         self.port = port
+        # Codecs aceitos em ordem de preferência; vazio desliga a compressão antes da cifra
+        self.compression = list(compression or [])
         self.socket = socket.socket(socket.AF_INET, socket.SOCK_STREAM)
+        self.channel = FrameChannel(self.socket)
         self.username = None
         self.symmetric_key = None
         self.cipher_type = None
+        self.session = None
+        # Ticket de retomada recebido do servidor; pode ser passado para a próxima conexão
+        self.ticket = ticket
+        self.known_servers_path = known_servers_path
+        # Requisições em andamento por id; o id 0 fica para o handshake
+        self._pending = {}
+        self._pending_lock = threading.Lock()
+        self._request_ids = itertools.count(1)
+        self._reader = None
     
     def connect(self):
         self.socket.connect((self.host, self.port))
         print(f"Conectado ao servidor {self.host}:{self.port}")
     
-    def register(self, username, password, algorithm='sha256'):
+    def register(self, username, password, algorithm='scrypt'):
         self._send_data({
             'action': 'register',
             'username': username,
@@ -38,26 +291,84 @@ class FileClient:
             return True
         return False
     
-    def perform_key_exchange(self, method='DH', cipher_type='AES'):
-        self.cipher_type = cipher_type
+    def resume(self, ticket=None):
+        """Retoma a sessão de um ticket; dispensa login e troca de chaves"""
+        ticket = ticket or self.ticket
+        if not ticket or ticket['expires'] <= time.time():
+            return False
+        
+        client_nonce = os.urandom(RESUME_NONCE_SIZE)
+        self._send_data({
+            'action': 'resume',
+            'ticket': ticket['ticket'],
+            'nonce': client_nonce.hex(),
+            'compression': self.compression
+        })
+        response = self._receive_data()
+        if response['status'] != 'resumed':
+            # Ticket expirado ou de chave já rotacionada: segue com login na mesma conexão
+            self.ticket = None
+            return False
+        
+        self.symmetric_key = CryptoUtils.derive_key(
+            ticket['secret'],
+            RESUMED_SESSION_INFO,
+            salt=client_nonce + bytes.fromhex(response['nonce'])
+        )
+        self.username = ticket['username']
+        self.cipher_type = response['cipher_type']
+        self.session = SessionCipher(self.symmetric_key, self.cipher_type, response.get('compression'))
+        self._store_ticket(response)
+        self._start_reader()
+        return True
+    
+    def _store_ticket(self, response):
+        if 'ticket' not in response:
+            return
+        if 'secret' in response:
+            secret = bytes.fromhex(response['secret'])
+        else:
+            secret = CryptoUtils.derive_key(self.symmetric_key, RESUMPTION_INFO)
+        self.ticket = {
+            'ticket': response['ticket'],
+            'secret': secret,
+            'username': self.username,
+            'expires': time.time() + response['ticket_lifetime']
+        }
+    
+    def refresh_ticket(self):
+        """Pede um ticket novo na sessão em andamento; o segredo vem na resposta cifrada"""
+        response = self._request({'action': 'ticket'})
+        if response['status'] != 'success':
+            return False
+        self._store_ticket(response)
+        return True
+    
+    def perform_key_exchange(self, method='DH', cipher_type='AES-GCM', curve='SECP384R1'):
+        # Cifra escolhida primeiro, seguida das AEAD como alternativa caso o servidor não a suporte
+        ciphers = [cipher_type] + [c for c in AEAD_CIPHERS if c != cipher_type]
         
         if method == 'DH':
-            # Diffie-Hellman
-            private_key = CryptoUtils.generate_dh_parameters()
+            # Diffie-Hellman com chave efêmera já gerada em segundo plano
+            private_key = get_key_pool(curve).get()
             public_key = private_key.public_key()
             
             # Envia chave pública para o servidor
             self._send_data({
                 'method': 'DH',
+                'curve': curve,
                 'public_key': public_key.public_bytes(
                     encoding=serialization.Encoding.PEM,
                     format=serialization.PublicFormat.SubjectPublicKeyInfo
                 ).decode(),
-                'cipher_type': cipher_type
+                'cipher_type': cipher_type,
+                'ciphers': ciphers,
+                'compression': self.compression
             })
             
-            # Recebe chave pública do servidor
-            server_public_key = self._receive_data()['public_key']
+            # Recebe chave pública do servidor junto com a confirmação
+            response = self._receive_data()
+            server_public_key = response['public_key']
             peer_public_key = serialization.load_pem_public_key(
                 server_public_key.encode(),
                 backend=default_backend()
@@ -80,87 +391,530 @@ class FileClient:
             self.symmetric_key = kdf.derive(shared_key)
             
         elif method == 'PKI':
-            # Usando RSA para enviar chave simétrica
-            private_key, public_key = CryptoUtils.generate_rsa_key_pair()
-            symmetric_key = CryptoUtils.generate_symmetric_key(cipher_type)
+            # Chave simétrica cifrada com a chave pública de identidade do servidor
+            # Chave de 256 bits serve para qualquer cifra que o servidor escolher
+            symmetric_key = CryptoUtils.generate_symmetric_key('AES')
+            server_key = self._get_server_key()
+            
+            if server_key is None:
+                # Primeira conexão com este servidor: pede a chave pública
+                self._send_data({
+                    'method': 'PKI',
+                    'cipher_type': cipher_type,
+                    'ciphers': ciphers,
+                    'compression': self.compression
+                })
+                response = self._receive_data()
+                if response['status'] != 'server_key':
+                    return False
+                server_key = self._store_server_key(response['public_key'], response['fingerprint'])
             
-            # Envia chave simétrica criptografada
+            fingerprint, public_key = server_key
             self._send_data({
                 'method': 'PKI',
-                'public_key': public_key.public_bytes(
-                    encoding=serialization.Encoding.PEM,
-                    format=serialization.PublicFormat.SubjectPublicKeyInfo
-                ).decode(),
-                'encrypted_key': CryptoUtils.encrypt_asymmetric(symmetric_key, public_key),
-                'cipher_type': cipher_type
+                'fingerprint': fingerprint,
+                'encrypted_key': CryptoUtils.encrypt_asymmetric(symmetric_key, public_key).hex(),
+                'cipher_type': cipher_type,
+                'ciphers': ciphers,
+                'compression': self.compression
             })
             
             self.symmetric_key = symmetric_key
+            
+            # Confirmação do servidor
+            response = self._receive_data()
+            if response['status'] == 'server_key':
+                # O servidor trocou de chave de identidade: pode ser um intermediário
+                raise ValueError(f"A chave do servidor {self.host}:{self.port} mudou; "
+                                 f"remova-a de {self.known_servers_path} se a troca for legítima")
         
-        # Confirmação do servidor
-        response = self._receive_data()
-        return response.get('status') == 'key_exchange_complete'
+        # A cifra da sessão é montada uma única vez e reutilizada em todas as mensagens
+        self.cipher_type = response.get('cipher_type', cipher_type)
+        self.session = SessionCipher(self.symmetric_key, self.cipher_type, response.get('compression'))
+        self._store_ticket(response)
+        if response.get('status') != 'key_exchange_complete':
+            return False
+        self._start_reader()
+        return True
+    
+    def _get_server_key(self):
+        """Retorna (impressão digital, chave pública) do servidor já conhecido, ou None"""
+        address = f"{self.host}:{self.port}"
+        if address not in self._server_keys:
+            entry = self._load_known_servers().get(address)
+            if entry is None:
+                return None
+            self._server_keys[address] = self._parse_server_key(entry['public_key'], entry['fingerprint'])
+        return self._server_keys[address]
+    
+    def _store_server_key(self, public_pem, fingerprint):
+        server_key = self._parse_server_key(public_pem, fingerprint)
+        address = f"{self.host}:{self.port}"
+        known_servers = self._load_known_servers()
+        known_servers[address] = {'public_key': public_pem, 'fingerprint': fingerprint}
+        # Grava em arquivo temporário e renomeia para não deixar o arquivo pela metade
+        tmp_path = f"{self.known_servers_path}.{os.getpid()}.tmp"
+        with open(tmp_path, 'w') as f:
+            json.dump(known_servers, f, indent=2)
+        os.replace(tmp_path, self.known_servers_path)
+        self._server_keys[address] = server_key
+        return server_key
+    
+    def _load_known_servers(self):
+        try:
+            with open(self.known_servers_path) as f:
+                return json.load(f)
+        except FileNotFoundError:
+            return {}
     
-    def upload_file(self, filename):
+    @staticmethod
+    def _parse_server_key(public_pem, fingerprint):
+        public_key = serialization.load_pem_public_key(public_pem.encode(), backend=default_backend())
+        if CryptoUtils.public_key_fingerprint(public_key) != fingerprint:
+            raise ValueError("Impressão digital da chave do servidor não confere")
+        return fingerprint, public_key
+    
+    def upload_file(self, filename, delta=True):
+        # Arquivos grandes que já existem no servidor vão como delta; o resto vai inteiro
+        if delta and os.path.getsize(filename) >= DELTA_MIN_SIZE:
+            result = self.upload_delta(filename)
+            if result is not None:
+                return result
+        return self.upload_file_async(filename).result()
+    
+    def upload_delta(self, filename):
+        """Envia só o que mudou em relação à versão do servidor, no estilo do rsync.
+
+        Retorna None quando o delta não se aplica: arquivo ausente no servidor,
+        conteúdo diferente demais ou versão do servidor alterada no meio do caminho.
+        """
+        name = os.path.basename(filename)
+        stream, future = self._register(PendingRequest(lambda r: r))
+        self._send_encrypted_message({
+            'action': 'signatures',
+            'filename': name
+        }, stream)
+        remote = future.result()
+        if remote['status'] != 'success' or not remote['signatures']:
+            return None
+        
+        max_literal = int(os.path.getsize(filename) * DELTA_MAX_LITERAL_RATIO)
         with open(filename, 'rb') as f:
-            file_data = f.read()
+            delta = compute_delta(f, remote['signatures'], remote['block_size'], max_literal)
+        if delta is None:
+            return None
+        ops, digest = delta
+        
+        # Cópias apontam para blocos do servidor; os dados novos seguem em blocos com o mesmo id
+        stream, future = self._register(PendingRequest(lambda r: r['status']))
+        self._send_encrypted_message({
+            'action': 'upload_delta',
+            'filename': name,
+            'block_size': remote['block_size'],
+            'ops': [op if op[0] == 'copy' else ['data', op[2]] for op in ops],
+            'sha256': digest,
+            'size': os.path.getsize(filename)
+        }, stream)
+        with open(filename, 'rb', buffering=0) as f:
+            self._send_chunks(self._read_ranges(f, ops), stream)
         
-        response = self._send_encrypted_data({
+        status = future.result()
+        if status == 'delta_mismatch':
+            return None
+        return status == 'upload_success'
+    
+    def _read_ranges(self, f, ops):
+        """Blocos dos trechos novos do delta, na ordem das operações"""
+        for op in ops:
+            if op[0] == 'data':
+                f.seek(op[1])
+                yield from self._read_chunks(f, op[2])
+    
+    @staticmethod
+    def _read_chunks(f, length=None):
+        """Lê f (até length bytes) com readinto em um único buffer; cada bloco só vale até o próximo"""
+        buffer = bytearray(CHUNK_SIZE)
+        view = memoryview(buffer)
+        while length is None or length > 0:
+            size = f.readinto(view[:CHUNK_SIZE if length is None else min(CHUNK_SIZE, length)])
+            if not size:
+                if length is not None:
+                    raise ValueError("Arquivo alterado durante o envio")
+                break
+            if length is not None:
+                length -= size
+            yield view[:size]
+    
+    def _send_chunks(self, chunks, stream):
+        # A amostra do primeiro bloco decide se o arquivo vai comprimido antes da cifra
+        for chunk, compress in compression_plan(self.session, chunks):
+            self._send_encrypted_chunk(chunk, stream, compress)
+    
+    def upload_file_async(self, filename):
+        """Envia o arquivo sem esperar a confirmação; retorna um Future com o resultado"""
+        stream, future = self._register(PendingRequest(lambda r: r['status'] == 'upload_success'))
+        # Cabeçalho com nome e tamanho; o conteúdo segue em blocos de CHUNK_SIZE com o mesmo id
+        self._send_encrypted_message({
             'action': 'upload',
-            'filename': filename.split('/')[-1],
-            'file_data': file_data.decode('latin1')  # Para garantir que todos os bytes sejam preservados
-        })
+            'filename': os.path.basename(filename),
+            'size': os.path.getsize(filename)
+        }, stream)
         
-        return response['status'] == 'upload_success'
+        # Lê sempre no mesmo buffer; o bloco é cifrado direto no buffer de envio
+        with open(filename, 'rb', buffering=0) as f:
+            self._send_chunks(self._read_chunks(f), stream)
+        return future
     
-    def download_file(self, filename, save_path=None):
-        response = self._send_encrypted_data({
+    def download_file(self, filename, save_path=None, resume=False):
+        """resume continua um download interrompido a partir do tamanho do arquivo local"""
+        if resume and os.path.exists(save_path or filename):
+            return self._resume_download(filename, save_path or filename)
+        return self.download_file_async(filename, save_path).result()
+    
+    def _resume_download(self, filename, save_path):
+        entry = self._remote_entry(filename)
+        if entry is None:
+            return False
+        offset = os.path.getsize(save_path)
+        if offset < entry['size']:
+            part = self._download_part_async(filename, save_path, offset, entry['size'] - offset, entry['size'])
+            if not part.result():
+                return False
+        # A parte local pode ser de outra versão: confere com o hash do índice (desconhecido
+        # só para arquivos gravados antes do índice existir)
+        if offset <= entry['size'] and entry['sha256'] in (None, self._file_hash(save_path)):
+            return True
+        return self.download_file_async(filename, save_path).result()
+    
+    @staticmethod
+    def _file_hash(path):
+        digest = hashlib.sha256()
+        with open(path, 'rb') as f:
+            for data in iter(lambda: f.read(CHUNK_SIZE), b''):
+                digest.update(data)
+        return digest.hexdigest()
+    
+    def download_range(self, filename, offset, length=None):
+        return self.download_range_async(filename, offset, length).result()
+    
+    def download_range_async(self, filename, offset, length=None):
+        """Future com length bytes (ou até o fim) a partir de offset; None se o arquivo não existir"""
+        stream, future = self._register(PendingRangeRead(offset))
+        request = {'action': 'download', 'filename': filename, 'offset': offset}
+        if length is not None:
+            request['length'] = length
+        self._send_encrypted_message(request, stream)
+        return future
+    
+    def download_file_async(self, filename, save_path=None):
+        stream, future = self._register(PendingDownload(save_path or filename))
+        self._send_encrypted_message({
             'action': 'download',
             'filename': filename
-        })
+        }, stream)
+        return future
+    
+    def upload_parallel(self, filename, connections=PARALLEL_CONNECTIONS):
+        """Envia trechos do arquivo por várias conexões ao mesmo tempo (ver upload_resumable)"""
+        if len(self._split_ranges(os.path.getsize(filename), connections)) == 1:
+            return self.upload_file(filename)
+        return self.upload_resumable(filename, connections)
+    
+    def upload_resumable(self, filename, connections=1):
+        """Envia o arquivo como upload em partes, que sobrevive à queda da conexão.
         
-        if response['status'] == 'success':
-            if not save_path:
-                save_path = filename
+        O servidor grava cada trecho na sua posição de um arquivo já alocado,
+        registra o que já recebeu e só publica o arquivo, de uma vez, quando
+        tudo chegou. Chamada de novo para o mesmo arquivo local (mesmo tamanho
+        e data de modificação), envia só os trechos que faltam.
+        """
+        stat = os.stat(filename)
+        response = self._request({
+            'action': 'upload_begin',
+            'filename': os.path.basename(filename),
+            'size': stat.st_size,
+            'tag': f"{stat.st_size}:{stat.st_mtime_ns}"
+        })
+        if response['status'] != 'success':
+            return False
+        upload_id = response['upload_id']
+        ranges = [part for start, length in response['missing']
+                  for part in self._split_ranges(length, connections, start)]
+        if ranges and not self._send_ranges(filename, upload_id, ranges, connections):
+            return False
+        return self._request({'action': 'upload_commit', 'upload_id': upload_id})['status'] == 'upload_success'
+    
+    def _send_ranges(self, filename, upload_id, ranges, connections):
+        """Reparte os trechos entre esta conexão e até connections - 1 conexões extras"""
+        sessions = self._open_sessions(min(connections, len(ranges)) - 1)
+        clients = [self] + sessions
+        try:
+            # Uma thread por conexão: leitura, compressão e cifra dos trechos correm em paralelo
+            with ThreadPoolExecutor(len(clients)) as executor:
+                futures = [executor.submit(client._upload_ranges, filename, upload_id, ranges[i::len(clients)])
+                           for i, client in enumerate(clients)]
+                return all([future.result() for future in futures])
+        finally:
+            for client in sessions:
+                client.close()
+    
+    def _upload_ranges(self, filename, upload_id, ranges):
+        # Todos os trechos seguem sem esperar confirmação; as respostas são conferidas no fim
+        futures = [self._upload_range_async(filename, upload_id, offset, length) for offset, length in ranges]
+        return all([future.result() for future in futures])
+    
+    def _upload_range_async(self, filename, upload_id, offset, length):
+        stream, future = self._register(PendingRequest(lambda r: r['status'] == 'upload_success'))
+        self._send_encrypted_message({
+            'action': 'upload_range',
+            'upload_id': upload_id,
+            'offset': offset,
+            'length': length
+        }, stream)
+        with open(filename, 'rb', buffering=0) as f:
+            f.seek(offset)
+            self._send_chunks(self._read_chunks(f, length), stream)
+        return future
+    
+    def download_parallel(self, filename, save_path=None, connections=PARALLEL_CONNECTIONS):
+        """Baixa trechos do arquivo por várias conexões ao mesmo tempo, cada um gravado na sua posição"""
+        save_path = save_path or filename
+        entry = self._remote_entry(filename)
+        if entry is None:
+            return False
+        size = entry['size']
+        ranges = self._split_ranges(size, connections)
+        sessions = self._open_sessions(len(ranges) - 1)
+        if not sessions:
+            return self.download_file(filename, save_path)
+        try:
             with open(save_path, 'wb') as f:
-                f.write(response['file_data'].encode('latin1'))
-            return True
-        return False
+                f.truncate(size)
+            futures = [client._download_part_async(filename, save_path, offset, length, size)
+                       for client, (offset, length) in zip([self] + sessions, ranges)]
+            return all([future.result() for future in futures])
+        finally:
+            for client in sessions:
+                client.close()
     
-    def list_files(self):
-        response = self._send_encrypted_data({
-            'action': 'list'
-        })
+    def _download_part_async(self, filename, save_path, offset, length, total):
+        stream, future = self._register(PendingDownload(save_path, (offset, length, total)))
+        self._send_encrypted_message({
+            'action': 'download',
+            'filename': filename,
+            'offset': offset,
+            'length': length
+        }, stream)
+        return future
+    
+    def _remote_entry(self, filename):
+        """Tamanho, mtime e SHA-256 do arquivo no servidor, pelo índice da listagem; None se não existir"""
+        page = self.list_page(filename, limit=1, details=True)
+        entries = page.get('entries') or []
+        if entries and entries[0]['name'] == filename:
+            return entries[0]
+        return None
+    
+    @staticmethod
+    def _split_ranges(size, connections, start=0):
+        """Divide [start, start + size) em até connections trechos contíguos, alinhados a CHUNK_SIZE"""
+        parts = max(1, min(connections, size // PARALLEL_MIN_PART))
+        if parts == 1:
+            return [(start, size)]
+        part = -(-size // parts)
+        part = -(-part // CHUNK_SIZE) * CHUNK_SIZE
+        return [(start + offset, min(part, size - offset)) for offset in range(0, size, part)]
+    
+    def _open_sessions(self, count):
+        """Conexões extras retomadas com o ticket desta sessão, sem senha nem troca de chaves.
         
-        if response['status'] == 'success':
-            return response['files']
-        return []
+        Renova o ticket se estiver perto de expirar. Se ainda assim alguma
+        conexão não puder ser retomada, retorna [] e a transferência segue
+        só pela conexão atual.
+        """
+        if count <= 0:
+            return []
+        if not self.ticket or self.ticket['expires'] - time.time() < TICKET_REFRESH_MARGIN:
+            if not self.refresh_ticket():
+                return []
+        sessions = []
+        try:
+            for _ in range(count):
+                client = FileClient(self.host, self.port, self.ticket, self.known_servers_path, self.compression)
+                sessions.append(client)
+                client.connect()
+                if not client.resume():
+                    raise ConnectionError("Não foi possível abrir uma conexão paralela")
+        except ConnectionError as e:
+            print(f"{e}; seguindo só com a conexão atual")
+            for client in sessions:
+                client.close()
+            return []
+        except BaseException:
+            for client in sessions:
+                client.close()
+            raise
+        return sessions
+    
+    def upload_batch(self, filenames, compress=True):
+        return self.upload_batch_async(filenames, compress).result()
+    
+    def upload_batch_async(self, filenames, compress=True):
+        """Envia vários arquivos em um único pacote; o Future traz o status de cada um"""
+        compression = 'zlib' if compress else None
+        files = [(path, os.path.getsize(path)) for path in filenames]
+        stream, future = self._register(PendingRequest(lambda r: r.get('results', {})))
+        self._send_encrypted_message({
+            'action': 'upload_batch',
+            'files': [{'filename': os.path.basename(path), 'size': size} for path, size in files],
+            'compression': compression
+        }, stream)
+        self._send_chunks(iter_bundle(files, compression), stream)
+        return future
+    
+    def download_batch(self, filenames, save_dir='.', compress=True):
+        return self.download_batch_async(filenames, save_dir, compress).result()
+    
+    def download_batch_async(self, filenames, save_dir='.', compress=True):
+        stream, future = self._register(PendingBatchDownload(save_dir))
+        self._send_encrypted_message({
+            'action': 'download_batch',
+            'filenames': list(filenames),
+            'compression': 'zlib' if compress else None
+        }, stream)
+        return future
+    
+    def list_files(self, prefix=''):
+        """Todos os nomes (com o prefixo), percorrendo as páginas da listagem"""
+        files = []
+        after = None
+        while True:
+            page = self.list_page(prefix, after)
+            files.extend(page['files'])
+            after = page.get('next')
+            if after is None:
+                return files
+    
+    def list_files_async(self, prefix=''):
+        """Future com os nomes da primeira página; para listas longas use list_page"""
+        stream, future = self._register(
+            PendingRequest(lambda r: r['files'] if r['status'] == 'success' else [])
+        )
+        self._send_encrypted_message({
+            'action': 'list',
+            'prefix': prefix
+        }, stream)
+        return future
+    
+    def list_page(self, prefix='', after=None, limit=None, details=False):
+        return self.list_page_async(prefix, after, limit, details).result()
+    
+    def list_page_async(self, prefix='', after=None, limit=None, details=False):
+        """Future com {'files', 'next'} (e 'entries' com tamanho, mtime e hash se details)"""
+        stream, future = self._register(
+            PendingRequest(lambda r: r if r['status'] == 'success' else {'files': [], 'next': None})
+        )
+        request = {'action': 'list', 'prefix': prefix, 'details': details}
+        if after is not None:
+            request['after'] = after
+        if limit is not None:
+            request['limit'] = limit
+        self._send_encrypted_message(request, stream)
+        return future
+    
+    def storage_stats(self):
+        """Deduplicação no servidor: blocos, bytes em disco, bytes representados e economia"""
+        return self.storage_stats_async().result()
+    
+    def storage_stats_async(self):
+        stream, future = self._register(
+            PendingRequest(lambda r: r['stats'] if r['status'] == 'success' else None)
+        )
+        self._send_encrypted_message({
+            'action': 'storage_stats'
+        }, stream)
+        return future
+    
+    def _request(self, data):
+        """Envia uma ação de resposta única e espera a resposta"""
+        stream, future = self._register(PendingRequest(lambda r: r))
+        self._send_encrypted_message(data, stream)
+        return future.result()
+    
+    def _register(self, request):
+        """Reserva um id para a requisição antes de enviá-la"""
+        with self._pending_lock:
+            stream = next(self._request_ids)
+            self._pending[stream] = request
+        return stream, request.future
+    
+    def _start_reader(self):
+        self._reader = threading.Thread(target=self._read_responses, daemon=True)
+        self._reader.start()
+    
+    def _read_responses(self):
+        """Thread leitora: entrega cada quadro à requisição com o mesmo id"""
+        try:
+            while True:
+                frame_type, flags, stream, payload = self._receive_any_frame()
+                with self._pending_lock:
+                    request = self._pending.get(stream)
+                if request is None:
+                    raise FrameError(f"Resposta para requisição desconhecida: {stream}")
+                
+                if frame_type == FRAME_ENCRYPTED:
+                    request.on_response(decode_json(open_frame(self.session, FRAME_ENCRYPTED, flags, stream, payload)))
+                elif frame_type == FRAME_DATA and flags & FLAG_STORED:
+                    # Protegido pela chave do arquivo, recebida no cabeçalho cifrado pela sessão
+                    request.on_stored_chunk(bytes(payload))
+                elif frame_type == FRAME_DATA:
+                    request.on_chunk(open_frame(self.session, FRAME_DATA, flags, stream, payload))
+                else:
+                    raise FrameError(f"Tipo de quadro inesperado: {frame_type}")
+                
+                if request.done:
+                    with self._pending_lock:
+                        del self._pending[stream]
+        except Exception as e:
+            # Conexão perdida: todas as requisições pendentes falham com o mesmo erro
+            with self._pending_lock:
+                pending, self._pending = self._pending, {}
+            for request in pending.values():
+                request.fail(e)
     
     def _send_data(self, data):
-        json_data = json.dumps(data).encode(ENCODING)
-        self.socket.send(f"{len(json_data):<{HEADER_SIZE}}".encode(ENCODING))
-        self.socket.send(json_data)
+        self.channel.send(FRAME_CONTROL, encode_json(data))
     
     def _receive_data(self):
-        raw_length = self.socket.recv(HEADER_SIZE)
-        if not raw_length:
+        payload = self._receive_frame(FRAME_CONTROL)
+        if payload is None:
             return None
-        length = int(raw_length.decode(ENCODING).strip())
-        data = self.socket.recv(length)
-        return json.loads(data.decode(ENCODING))
+        return decode_json(payload)
+    
+    def _receive_frame(self, expected_type):
+        frame_type, flags, stream, payload = self._receive_any_frame()
+        if frame_type != expected_type:
+            raise FrameError(f"Tipo de quadro inesperado: {frame_type}")
+        return payload
+    
+    def _receive_any_frame(self):
+        frame = self.channel.recv()
+        if frame is None:
+            raise ConnectionError("Conexão encerrada pelo servidor")
+        return frame
     
-    def _send_encrypted_data(self, data):
-        json_data = json.dumps(data).encode(ENCODING)
-        encrypted_data = CryptoUtils.encrypt_symmetric(json_data, self.symmetric_key, self.cipher_type)
-        self._send_data({'data': encrypted_data})
-        return self._receive_encrypted_data()
+    def _send_encrypted_message(self, data, stream):
+        self.channel.send_sealed(FRAME_ENCRYPTED, encode_json(data), self.session, stream, compress=True)
     
-    def _receive_encrypted_data(self):
-        encrypted_data = self._receive_data()['data']
-        decrypted_data = CryptoUtils.decrypt_symmetric(encrypted_data, self.symmetric_key, self.cipher_type)
-        return json.loads(decrypted_data.decode(ENCODING))
+    def _send_encrypted_chunk(self, chunk, stream, compress=False):
+        self.channel.send_sealed(FRAME_DATA, chunk, self.session, stream, compress)
     
     def close(self):
+        # shutdown acorda a thread leitora, que ainda pode estar bloqueada no recv
+        try:
+            self.socket.shutdown(socket.SHUT_RDWR)
+        except OSError:
+            pass
         self.socket.close()
 
 if __name__ == "__main__":
@@ -184,19 +938,23 @@ if __name__ == "__main__":
     
     # Troca de chaves
     print("Escolha o método de troca de chaves:")
-    print("1. Diffie-Hellman")
+    print("1. Diffie-Hellman (SECP384R1)")
     print("2. RSA (PKI)")
-    method_choice = input("Escolha (1/2): ")
-    method = 'DH' if method_choice == '1' else 'PKI'
+    print("3. Diffie-Hellman (X25519, mais rápido)")
+    method_choice = input("Escolha (1/2/3): ")
+    method = 'PKI' if method_choice == '2' else 'DH'
+    curve = 'X25519' if method_choice == '3' else 'SECP384R1'
     
     print("Escolha o algoritmo de criptografia simétrica:")
-    print("1. AES (recomendado)")
+    print("1. AES")
     print("2. DES")
     print("3. Blowfish")
-    cipher_choice = input("Escolha (1/2/3): ")
+    print("4. AES-GCM (recomendado)")
+    print("5. ChaCha20-Poly1305")
+    cipher_choice = input("Escolha (1/2/3/4/5): ")
     cipher_type = SYMMETRIC_CIPHERS[int(cipher_choice)-1]
     
-    if not client.perform_key_exchange(method, cipher_type):
+    if not client.perform_key_exchange(method, cipher_type, curve):
         print("Falha na troca de chaves.")
         exit()
     
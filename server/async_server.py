@@ -0,0 +1,247 @@
+# server/async_server.py
+import asyncio
+import socket
+from concurrent.futures import ThreadPoolExecutor
+from main import FileServer, UploadRejected, MAX_AUTH_ATTEMPTS, MAX_KEY_EXCHANGE_ATTEMPTS, MAX_IN_FLIGHT, UPLOAD_ACTIONS
+from flush_scheduler import DEFAULT_SYNC_WINDOW
+from constants import *
+from framing import *
+from bundle import BUNDLE_COMPRESSIONS
+
+class AsyncFileServer(FileServer):
+    """Motor asyncio: um único laço de eventos atende todas as conexões.
+
+    A criptografia pesada (ECDH, RSA, hash de senha e cifragem dos blocos)
+    e o acesso ao disco rodam em um executor para não travar o laço.
+    """
+
+    def __init__(self, host='localhost', port=5000, backlog=socket.SOMAXCONN, reuse_port=False,
+                 encrypt_at_rest=False, dedup=False, sync_window=DEFAULT_SYNC_WINDOW, max_workers=None):
+        super().__init__(host, port, backlog, reuse_port, encrypt_at_rest, dedup, sync_window)
+        self.executor = ThreadPoolExecutor(max_workers=max_workers)
+
+    def start(self, server_socket=None):
+        asyncio.run(self._serve(server_socket or self.create_server_socket()))
+
+    async def _serve(self, server_socket):
+        server = await asyncio.start_server(self.handle_client_async, sock=server_socket)
+        print(f"Servidor (asyncio) iniciado em {self.host}:{self.port}")
+        async with server:
+            await server.serve_forever()
+
+    async def _run_blocking(self, func, *args):
+        loop = asyncio.get_running_loop()
+        return await loop.run_in_executor(self.executor, func, *args)
+
+    async def handle_client_async(self, reader, writer):
+        addr = writer.get_extra_info('peername')
+        print(f"Conexão estabelecida com {addr}")
+        username = None
+
+        try:
+            # Autenticação; um ticket válido já traz a sessão e dispensa a troca de chaves
+            session = None
+            for _ in range(MAX_AUTH_ATTEMPTS):
+                auth_data = await self._receive_data_async(reader)
+                if auth_data is None:
+                    return
+                session, response, username = await self._run_blocking(self._authenticate, auth_data)
+                await self._send_data_async(writer, response)
+                if username:
+                    break
+            if not username:
+                return
+
+            # Negociação de chaves
+            for _ in range(MAX_KEY_EXCHANGE_ATTEMPTS):
+                if session is not None:
+                    break
+                key_exchange_data = await self._receive_data_async(reader)
+                if key_exchange_data is None:
+                    return
+                session, response = await self._run_blocking(
+                    self._negotiate_session, username, key_exchange_data
+                )
+                await self._send_data_async(writer, response)
+            if session is None:
+                return
+
+            # Loop principal: requisições com id próprio, respondidas fora de ordem
+            await self._serve_requests_async(reader, writer, session, username)
+
+        except Exception as e:
+            print(f"Erro com cliente {addr}: {e}")
+        finally:
+            writer.close()
+            if username:
+                print(f"Conexão encerrada com {username}@{addr}")
+            else:
+                print(f"Conexão encerrada com {addr}")
+
+    async def _serve_requests_async(self, reader, writer, session, username):
+        """Versão asyncio de _serve_requests: cada requisição vira uma tarefa"""
+        uploads = {}
+        discarded = set()
+        tasks = set()
+        in_flight = asyncio.Semaphore(MAX_IN_FLIGHT)
+        try:
+            while True:
+                frame = await read_frame_async(reader)
+                if frame is None:
+                    break
+                frame_type, flags, stream, payload = frame
+
+                if frame_type == FRAME_DATA:
+                    if stream in discarded:
+                        continue
+                    upload = uploads.get(stream)
+                    if upload is None:
+                        raise FrameError(f"Bloco de upload para requisição desconhecida: {stream}")
+                    try:
+                        done = await self._run_blocking(self._decrypt_and_write, upload, payload, session, flags, stream)
+                    except UploadRejected as e:
+                        del uploads[stream]
+                        discarded.add(stream)
+                        await self._run_blocking(upload['writer'].abort)
+                        await self._send_encrypted_data_async(
+                            writer, self._reject_upload(username, stream, e), session, stream
+                        )
+                        continue
+                    if done:
+                        del uploads[stream]
+                        await self._send_encrypted_data_async(writer, self._upload_response(upload), session, stream)
+                    continue
+
+                if frame_type != FRAME_ENCRYPTED:
+                    raise FrameError(f"Tipo de quadro inesperado: {frame_type}")
+                data = decode_json(open_frame(session, FRAME_ENCRYPTED, flags, stream, payload))
+
+                if data['action'] in UPLOAD_ACTIONS:
+                    discarded.discard(stream)
+                    try:
+                        upload, done = await self._run_blocking(self._start_upload, username, data)
+                    except UploadRejected as e:
+                        discarded.add(stream)
+                        await self._send_encrypted_data_async(
+                            writer, self._reject_upload(username, stream, e), session, stream
+                        )
+                        continue
+                    if done:
+                        await self._send_encrypted_data_async(writer, self._upload_response(upload), session, stream)
+                    else:
+                        uploads[stream] = upload
+                else:
+                    await in_flight.acquire()
+                    task = asyncio.create_task(self._run_request_async(writer, session, username, stream, data))
+                    tasks.add(task)
+                    task.add_done_callback(tasks.discard)
+                    task.add_done_callback(lambda _: in_flight.release())
+        finally:
+            for task in tasks:
+                task.cancel()
+            for upload in uploads.values():
+                await self._run_blocking(upload['writer'].abort)
+
+    async def _run_request_async(self, writer, session, username, stream, data):
+        try:
+            if data['action'] == 'download':
+                f = await self._run_blocking(self.file_manager.open_download, username, data['filename'])
+                if f is None:
+                    response = {'status': 'file_not_found'}
+                elif self._sends_stored(f, data):
+                    await self._send_stored_async(writer, f, session, stream)
+                    return
+                else:
+                    await self._handle_download_async(writer, f, data, session, stream)
+                    return
+            elif data['action'] == 'download_batch':
+                compression = data.get('compression')
+                if compression not in BUNDLE_COMPRESSIONS:
+                    raise ValueError("Compression not supported")
+                entries = await self._run_blocking(
+                    self.file_manager.get_batch_files, username, data['filenames']
+                )
+                try:
+                    await self._send_encrypted_data_async(writer, self._batch_header(entries, compression), session, stream)
+                    await self._send_chunks_async(writer, self._bundle_chunks(entries, compression), session, stream)
+                finally:
+                    await self._run_blocking(self._close_batch, entries)
+                return
+            else:
+                response = await self._run_blocking(self._process_action, username, data, session)
+            await self._send_encrypted_data_async(writer, response, session, stream)
+        except Exception as e:
+            print(f"Erro na requisição {stream} de {username}: {e}")
+            try:
+                await self._send_encrypted_data_async(writer, {'status': 'error'}, session, stream)
+            except OSError:
+                pass  # Conexão já encerrada
+
+    async def _handle_download_async(self, writer, f, data, session, stream):
+        try:
+            header, offset, length = self._download_header(data, f.size)
+            await self._send_encrypted_data_async(writer, header, session, stream)
+            # O gerador lê com readinto no próprio buffer; cada bloco é cifrado antes da próxima leitura
+            chunks = self.file_manager.read_chunks(f, offset=offset, length=length)
+            await self._send_chunks_async(writer, chunks, session, stream)
+        finally:
+            await self._run_blocking(f.close)
+
+    async def _send_chunks_async(self, writer, chunks, session, stream):
+        """Lê, comprime (se compensar) e cifra cada bloco no executor; o laço só escreve"""
+        chunks = compression_plan(session, chunks)
+        try:
+            while True:
+                frame = await self._run_blocking(self._next_sealed, chunks, session, stream)
+                if frame is None:
+                    break
+                writer.write(frame)
+                await writer.drain()
+        finally:
+            await self._run_blocking(chunks.close)
+
+    async def _send_stored_async(self, writer, stored, session, stream):
+        # Sem sendfile: o transporte não aceita outras escritas durante loop.sendfile
+        try:
+            await self._send_encrypted_data_async(writer, self._stored_header(stored), session, stream)
+            for offset, length in stored.chunk_ranges():
+                chunk = await self._run_blocking(stored.read_chunk, offset, length)
+                await write_frame_async(writer, FRAME_DATA, chunk, flags=FLAG_STORED, stream=stream)
+        finally:
+            await self._run_blocking(stored.close)
+
+    @staticmethod
+    def _decrypt_and_write(upload, encrypted_data, session, flags, stream):
+        chunk = open_frame(session, FRAME_DATA, flags, stream, encrypted_data)
+        return FileServer._write_upload_chunk(upload, chunk)
+
+    @staticmethod
+    def _next_sealed(chunks, session, stream):
+        """Próximo bloco de compression_plan já como quadro cifrado; None no fim"""
+        item = next(chunks, None)
+        if item is None:
+            return None
+        chunk, compress = item
+        return sealed_frame(FRAME_DATA, chunk, session, stream, compress)
+
+    async def _receive_frame_async(self, reader, expected_type):
+        frame = await read_frame_async(reader)
+        if frame is None:
+            return None
+        frame_type, flags, stream, payload = frame
+        if frame_type != expected_type:
+            raise FrameError(f"Tipo de quadro inesperado: {frame_type}")
+        return payload
+
+    async def _receive_data_async(self, reader):
+        payload = await self._receive_frame_async(reader, FRAME_CONTROL)
+        if payload is None:
+            return None
+        return decode_json(payload)
+
+    async def _send_data_async(self, writer, data):
+        await write_frame_async(writer, FRAME_CONTROL, encode_json(data))
+
+    async def _send_encrypted_data_async(self, writer, data, session, stream):
+        writer.write(sealed_frame(FRAME_ENCRYPTED, encode_json(data), session, stream, compress=True))
+        await writer.drain()
@@ -1,61 +1,182 @@
 # server/auth.py
+import queue
 import sqlite3
-from crypto_utils import CryptoUtils
+import threading
+import time
+from collections import OrderedDict
+from contextlib import contextmanager
+from password_hasher import PasswordHasher
+
+# Espera pelo lock do SQLite quando vários processos acessam users.db
+DB_TIMEOUT = 30
+# Conexões ociosas mantidas no pool; acima disso as conexões extras são fechadas
+POOL_SIZE = 16
+# Statements preparados mantidos em cache por conexão
+CACHED_STATEMENTS = 32
+
+# Cache de usuários: validade das entradas positivas e negativas (segundos) e tamanho máximo
+CACHE_TTL = 300
+NEGATIVE_CACHE_TTL = 30
+CACHE_SIZE = 10000
+
+# SQL fixo para que o cache de statements de cada conexão seja reaproveitado
+INSERT_USER_SQL = 'INSERT OR IGNORE INTO users (username, password_hash, algorithm, params) VALUES (?, ?, ?, ?)'
+SELECT_USER_SQL = 'SELECT password_hash, algorithm, params FROM users WHERE username = ?'
+UPDATE_HASH_SQL = 'UPDATE users SET password_hash = ?, algorithm = ?, params = ? WHERE username = ?'
+
+class ConnectionPool:
+    """Pool de conexões SQLite compartilhado pelas threads do servidor.
+
+    Cada conexão é usada por uma thread por vez, mas pode ser devolvida por
+    uma thread e retirada por outra (check_same_thread=False).
+    """
+
+    def __init__(self, db_path, size=POOL_SIZE):
+        self.db_path = db_path
+        self._idle = queue.LifoQueue(maxsize=size)
+
+    def _connect(self):
+        conn = sqlite3.connect(
+            self.db_path,
+            timeout=DB_TIMEOUT,
+            check_same_thread=False,
+            cached_statements=CACHED_STATEMENTS
+        )
+        # WAL permite leituras concorrentes com uma escrita; NORMAL basta com WAL
+        conn.execute('PRAGMA journal_mode=WAL')
+        conn.execute('PRAGMA synchronous=NORMAL')
+        conn.execute(f'PRAGMA busy_timeout={DB_TIMEOUT * 1000}')
+        return conn
+
+    @contextmanager
+    def connection(self):
+        try:
+            conn = self._idle.get_nowait()
+        except queue.Empty:
+            conn = self._connect()
+
+        try:
+            yield conn
+        except BaseException:
+            conn.rollback()
+            raise
+        finally:
+            try:
+                self._idle.put_nowait(conn)
+            except queue.Full:
+                conn.close()
+
+class UserCache:
+    """Cache LRU com TTL das linhas de usuários, na memória do processo.
+
+    Usuários inexistentes também entram no cache (por menos tempo), o que
+    absorve rajadas de tentativas com nomes inválidos sem consultar o banco.
+    negative_ttl 0 desliga essas entradas.
+    """
+
+    def __init__(self, ttl=CACHE_TTL, negative_ttl=NEGATIVE_CACHE_TTL, max_size=CACHE_SIZE):
+        self.ttl = ttl
+        self.negative_ttl = negative_ttl
+        self.max_size = max_size
+        self._entries = OrderedDict()
+        self._lock = threading.Lock()
+
+    def _entry(self, username):
+        entry = self._entries.get(username)
+        if entry is None:
+            return None
+        if entry['expires'] < time.monotonic():
+            del self._entries[username]
+            return None
+        self._entries.move_to_end(username)
+        return entry
+
+    def get(self, username):
+        """Retorna (encontrado, linha); linha None significa usuário inexistente"""
+        with self._lock:
+            entry = self._entry(username)
+            if entry is None:
+                return False, None
+            return True, entry['row']
+
+    def put(self, username, row):
+        ttl = self.ttl if row is not None else self.negative_ttl
+        if not ttl:
+            return
+        with self._lock:
+            self._entries[username] = {'row': row, 'expires': time.monotonic() + ttl}
+            self._entries.move_to_end(username)
+            while len(self._entries) > self.max_size:
+                self._entries.popitem(last=False)
+
+    def invalidate(self, username):
+        with self._lock:
+            self._entries.pop(username, None)
 
 class AuthManager:
-    def __init__(self, db_path='users.db'):
+    def __init__(self, db_path='users.db', hasher=None, cache=None):
         self.db_path = db_path
+        self.pool = ConnectionPool(db_path)
+        self.hasher = hasher or PasswordHasher()
+        self.cache = cache or UserCache()
         self._init_db()
 
     def _init_db(self):
-        conn = sqlite3.connect(self.db_path)
-        cursor = conn.cursor()
-        cursor.execute('''
-            CREATE TABLE IF NOT EXISTS users (
-                username TEXT PRIMARY KEY,
-                password_hash BLOB,
-                algorithm TEXT
-            )
-        ''')
-        conn.commit()
-        conn.close()
-
-    def register_user(self, username, password, algorithm='sha256'):
-        conn = sqlite3.connect(self.db_path)
-        cursor = conn.cursor()
-        
-        # Verifica se usuário já existe
-        cursor.execute('SELECT username FROM users WHERE username = ?', (username,))
-        if cursor.fetchone():
-            conn.close()
-            return False
-        
-        # Cria hash da senha
-        password_hash = CryptoUtils.hash_password(password, algorithm)
-        
-        # Armazena usuário
-        cursor.execute('''
-            INSERT INTO users (username, password_hash, algorithm)
-            VALUES (?, ?, ?)
-        ''', (username, password_hash, algorithm))
-        
-        conn.commit()
-        conn.close()
-        return True
+        with self.pool.connection() as conn:
+            conn.execute('''
+                CREATE TABLE IF NOT EXISTS users (
+                    username TEXT PRIMARY KEY,
+                    password_hash BLOB,
+                    algorithm TEXT,
+                    params TEXT
+                )
+            ''')
+            # Bancos criados antes dos parâmetros de custo por usuário não têm a coluna params
+            columns = [row[1] for row in conn.execute('PRAGMA table_info(users)')]
+            if 'params' not in columns:
+                try:
+                    conn.execute('ALTER TABLE users ADD COLUMN params TEXT')
+                except sqlite3.OperationalError:
+                    pass  # Outro processo worker já fez a migração
+            conn.commit()
+
+    def close(self):
+        self.hasher.close()
+
+    def register_user(self, username, password, algorithm=None):
+        # Cria hash da senha com a KDF (fora do GIL, no pool de processos)
+        password_hash, algorithm, params = self.hasher.hash(password, algorithm)
+
+        # Um único INSERT OR IGNORE: nenhuma linha inserida significa que o usuário já existe
+        with self.pool.connection() as conn:
+            cursor = conn.execute(INSERT_USER_SQL, (username, password_hash, algorithm, params))
+            conn.commit()
+        # Descarta uma possível entrada negativa do mesmo nome
+        self.cache.invalidate(username)
+        return cursor.rowcount == 1
+
+    def _get_user(self, username):
+        found, row = self.cache.get(username)
+        if not found:
+            with self.pool.connection() as conn:
+                row = conn.execute(SELECT_USER_SQL, (username,)).fetchone()
+            self.cache.put(username, row)
+        return row
 
     def authenticate_user(self, username, password):
-        conn = sqlite3.connect(self.db_path)
-        cursor = conn.cursor()
-        
-        cursor.execute('''
-            SELECT password_hash, algorithm FROM users WHERE username = ?
-        ''', (username,))
-        
-        result = cursor.fetchone()
-        conn.close()
-        
+        result = self._get_user(username)
         if not result:
             return False
-            
-        stored_hash, algorithm = result
-        return CryptoUtils.verify_password(stored_hash, password, algorithm)
\ No newline at end of file
+
+        stored_hash, algorithm, params = result
+        if not self.hasher.verify(stored_hash, password, algorithm, params):
+            return False
+
+        # Linhas antigas (md5/sha1/sha256 ou custo desatualizado) são refeitas com a senha em mãos
+        if self.hasher.needs_rehash(algorithm, params):
+            password_hash, algorithm, params = self.hasher.hash(password)
+            with self.pool.connection() as conn:
+                conn.execute(UPDATE_HASH_SQL, (password_hash, algorithm, params, username))
+                conn.commit()
+            self.cache.put(username, (password_hash, algorithm, params))
+        return True
@@ -0,0 +1,81 @@
+# server/benchmark_crypto.py
+import os
+import sys
+import timeit
+from cryptography.hazmat.primitives.ciphers import Cipher, algorithms, modes
+from cryptography.hazmat.primitives.ciphers.aead import AESGCM, ChaCha20Poly1305
+from cryptography.hazmat.primitives import padding
+from cryptography.hazmat.backends import default_backend
+from crypto_utils import SessionCipher
+from constants import SYMMETRIC_CIPHERS
+
+# Tamanhos de mensagem: de chat (64 B, 1 KB) a blocos de arquivo (64 KB, 1 MB)
+PAYLOAD_SIZES = [64, 1024, 64 * 1024, 1024 * 1024]
+
+# Caminho antigo, mantido aqui só como base da comparação: a cada mensagem o tipo
+# é resolvido, o algoritmo e o Cipher são criados e o conteúdo passa por PKCS7
+_LEGACY_ALGORITHMS = {
+    'AES': (algorithms.AES, 32),
+    'DES': (algorithms.TripleDES, 24),
+    'Blowfish': (algorithms.Blowfish, 56),
+}
+_LEGACY_AEAD = {'AES-GCM': AESGCM, 'ChaCha20-Poly1305': ChaCha20Poly1305}
+
+def legacy_encrypt(data, key, cipher_type):
+    if cipher_type in _LEGACY_AEAD:
+        nonce = os.urandom(12)
+        return nonce + _LEGACY_AEAD[cipher_type](key).encrypt(nonce, data, None)
+    algorithm_class, key_size = _LEGACY_ALGORITHMS[cipher_type]
+    algorithm = algorithm_class(key[:key_size])
+    iv = os.urandom(algorithm.block_size // 8)
+    encryptor = Cipher(algorithm, modes.CFB(iv), backend=default_backend()).encryptor()
+    padder = padding.PKCS7(128).padder()
+    padded_data = padder.update(data) + padder.finalize()
+    return iv + encryptor.update(padded_data) + encryptor.finalize()
+
+def legacy_decrypt(encrypted_data, key, cipher_type):
+    if cipher_type in _LEGACY_AEAD:
+        return _LEGACY_AEAD[cipher_type](key).decrypt(encrypted_data[:12], encrypted_data[12:], None)
+    algorithm_class, key_size = _LEGACY_ALGORITHMS[cipher_type]
+    algorithm = algorithm_class(key[:key_size])
+    iv_size = algorithm.block_size // 8
+    decryptor = Cipher(algorithm, modes.CFB(encrypted_data[:iv_size]), backend=default_backend()).decryptor()
+    decrypted = decryptor.update(encrypted_data[iv_size:]) + decryptor.finalize()
+    unpadder = padding.PKCS7(128).unpadder()
+    return unpadder.update(decrypted) + unpadder.finalize()
+
+def measure(func, payload_size):
+    """Retorna o tempo médio por chamada em microssegundos"""
+    number = max(10, min(20000, 2 * 1024 * 1024 // payload_size))
+    best = min(timeit.repeat(func, number=number, repeat=3))
+    return best / number * 1e6
+
+def benchmark_cipher(cipher_type):
+    key = os.urandom(32)
+    session = SessionCipher(key, cipher_type)
+    results = []
+
+    for size in PAYLOAD_SIZES:
+        data = os.urandom(size)
+        sealed = session.seal(data)
+
+        # Caminho antigo: cifra reconstruída e PKCS7 a cada mensagem
+        per_message = measure(lambda: legacy_decrypt(legacy_encrypt(data, key, cipher_type), key, cipher_type), size)
+        # Cifra da sessão criada uma única vez
+        cached = measure(lambda: session.open(session.seal(data)), size)
+        results.append((size, per_message, cached))
+
+    assert session.open(sealed) == data
+    assert legacy_decrypt(legacy_encrypt(data, key, cipher_type), key, cipher_type) == data
+    return results
+
+def main():
+    ciphers = sys.argv[1:] or SYMMETRIC_CIPHERS
+    print(f"{'cifra':<20}{'tamanho':>10}{'por mensagem (us)':>20}{'sessão (us)':>14}{'MB/s sessão':>14}")
+    for cipher_type in ciphers:
+        for size, per_message, cached in benchmark_cipher(cipher_type):
+            throughput = size / cached  # bytes por microssegundo == MB/s
+            print(f"{cipher_type:<20}{size:>10}{per_message:>20.2f}{cached:>14.2f}{throughput:>14.1f}")
+
+if __name__ == "__main__":
+    main()
\ No newline at end of file
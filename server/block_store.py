@@ -0,0 +1,303 @@
+# server/block_store.py
+import fcntl
+import hashlib
+import json
+import os
+import tempfile
+from contextlib import contextmanager
+from cryptography.exceptions import InvalidTag
+from auth import ConnectionPool
+from constants import CHUNK_SIZE, ENCODING
+
+# Arquivo de usuário que, em vez do conteúdo, traz a lista de blocos que o compõem
+MANIFEST_MAGIC = b'CRDMAN02'
+# Depois do identificador: nonce + tag da chave mestra sobre o JSON do manifesto
+MANIFEST_TAG_SIZE = 12 + 16
+# Maior manifesto aceito (~70 bytes por bloco); um arquivo maior que comece com MANIFEST_MAGIC
+# é conteúdo comum e não é lido inteiro a cada abertura
+MAX_MANIFEST_SIZE = 64 * 1024 * 1024
+# Lock entre processos para ler o manifesto antigo e publicar o novo como um passo só
+LOCK_FILENAME = '.manifest.lock'
+
+ADD_REF_SQL = 'INSERT INTO blocks (hash, size, refcount) VALUES (?, ?, 1) ON CONFLICT(hash) DO UPDATE SET refcount = refcount + 1'
+RETAIN_SQL = 'UPDATE blocks SET refcount = refcount + 1 WHERE hash = ?'
+RELEASE_SQL = 'UPDATE blocks SET refcount = refcount - 1 WHERE hash = ?'
+ORPHAN_SQL = 'SELECT hash FROM blocks WHERE hash = ? AND refcount <= 0'
+DELETE_SQL = 'DELETE FROM blocks WHERE hash = ?'
+STATS_SQL = 'SELECT COUNT(*), COALESCE(SUM(size), 0), COALESCE(SUM(size * refcount), 0) FROM blocks'
+
+class BlockStore:
+    """Blocos endereçados pelo SHA-256 do conteúdo, com contagem de referências.
+
+    Cada bloco é gravado uma única vez em blocks/<2 primeiros dígitos>/<hash>,
+    não importa quantos arquivos (de quantos usuários) o usem. As contagens
+    ficam em um banco SQLite compartilhado pelos processos worker. Os
+    manifestos são autenticados com a chave mestra: um arquivo enviado por
+    um usuário nunca passa por manifesto, mesmo que comece com MANIFEST_MAGIC.
+    """
+
+    def __init__(self, master_key, base_dir='server_blocks', flusher=None):
+        self.master_key = master_key
+        self.base_dir = base_dir
+        self.flusher = flusher
+        os.makedirs(base_dir, exist_ok=True)
+        self.pool = ConnectionPool(os.path.join(base_dir, 'blocks.db'))
+        self._init_db()
+
+    def _init_db(self):
+        with self.pool.connection() as conn:
+            conn.execute('''
+                CREATE TABLE IF NOT EXISTS blocks (
+                    hash TEXT PRIMARY KEY,
+                    size INTEGER NOT NULL,
+                    refcount INTEGER NOT NULL
+                )
+            ''')
+            conn.commit()
+
+    def block_path(self, digest):
+        return os.path.join(self.base_dir, digest[:2], digest)
+
+    def put(self, data, written=None):
+        """Guarda um bloco (se ainda não existir) e registra uma referência; retorna o hash.
+
+        Se o bloco for gravado agora, o caminho dele é acrescentado a written.
+        """
+        digest = hashlib.sha256(data).hexdigest()
+        # A referência vem antes da gravação: a coleta nunca apaga um bloco referenciado
+        with self.pool.connection() as conn:
+            conn.execute(ADD_REF_SQL, (digest, len(data)))
+            conn.commit()
+        path = self.block_path(digest)
+        if not os.path.exists(path):
+            self._write_block(path, data)
+            if written is not None:
+                written.append(path)
+        return digest
+
+    def sync_blocks(self, paths):
+        """Leva ao disco os blocos novos de um upload antes que um manifesto aponte para eles"""
+        if self.flusher is not None and paths:
+            self.flusher.sync(files=paths, directories={os.path.dirname(path) for path in paths})
+
+    @staticmethod
+    def _write_block(path, data):
+        directory = os.path.dirname(path)
+        os.makedirs(directory, exist_ok=True)
+        # Publicado com link: se outro upload gravou o mesmo bloco antes, o conteúdo é idêntico
+        fd, tmp_path = tempfile.mkstemp(prefix='.block-', dir=directory)
+        try:
+            with os.fdopen(fd, 'wb') as f:
+                f.write(data)
+            os.link(tmp_path, path)
+        except FileExistsError:
+            pass
+        finally:
+            os.remove(tmp_path)
+
+    def get(self, digest):
+        with open(self.block_path(digest), 'rb') as f:
+            data = f.read()
+        if hashlib.sha256(data).hexdigest() != digest:
+            raise ValueError(f"Bloco corrompido: {digest}")
+        return data
+
+    def retain(self, digests):
+        """Uma referência a mais em cada hash de blocos que já existem (ver ManifestFile.pin)"""
+        if not digests:
+            return
+        with self.pool.connection() as conn:
+            conn.executemany(RETAIN_SQL, [(digest,) for digest in digests])
+            conn.commit()
+
+    def release(self, digests):
+        """Libera uma referência de cada hash; blocos sem referências saem do disco"""
+        if not digests:
+            return
+        with self.pool.connection() as conn:
+            conn.execute('BEGIN IMMEDIATE')
+            orphans = set()
+            for digest in digests:
+                conn.execute(RELEASE_SQL, (digest,))
+                if conn.execute(ORPHAN_SQL, (digest,)).fetchone():
+                    orphans.add(digest)
+            # Apagados ainda com o lock de escrita: um put concorrente espera e regrava o bloco
+            for digest in orphans:
+                conn.execute(DELETE_SQL, (digest,))
+                try:
+                    os.remove(self.block_path(digest))
+                except FileNotFoundError:
+                    pass
+            conn.commit()
+
+    @contextmanager
+    def _manifest_lock(self, directory):
+        with open(os.path.join(directory, LOCK_FILENAME), 'a') as lock:
+            fcntl.flock(lock, fcntl.LOCK_EX)
+            try:
+                yield
+            finally:
+                fcntl.flock(lock, fcntl.LOCK_UN)
+
+    def replace_file(self, temp_path, final_path):
+        """os.replace que libera os blocos do manifesto substituído, se o arquivo antigo for um"""
+        with self._manifest_lock(os.path.dirname(final_path)):
+            old = self.read_manifest(final_path)
+            os.replace(temp_path, final_path)
+        if old is not None:
+            self.release(old['blocks'])
+
+    def open_manifest(self, path):
+        """ManifestFile para ler o conteúdo, ou None se o arquivo não for um manifesto"""
+        manifest = self.read_manifest(path)
+        if manifest is None:
+            return None
+        return ManifestFile(self, manifest['blocks'], manifest['size'], manifest['chunk_size'])
+
+    def seal_manifest(self, manifest):
+        """Conteúdo do arquivo que guarda manifest"""
+        body = json.dumps(manifest).encode(ENCODING)
+        return MANIFEST_MAGIC + self.master_key.wrap(b'', body) + body
+
+    def read_manifest(self, path):
+        """Manifesto gravado por seal_manifest, ou None se o arquivo não for um (ou não existir)"""
+        try:
+            with open(path, 'rb') as f:
+                if f.read(len(MANIFEST_MAGIC)) != MANIFEST_MAGIC:
+                    return None
+                if os.fstat(f.fileno()).st_size > MAX_MANIFEST_SIZE:
+                    return None
+                tag = f.read(MANIFEST_TAG_SIZE)
+                body = f.read()
+        except FileNotFoundError:
+            return None
+        try:
+            self.master_key.unwrap(tag, body)
+        except (InvalidTag, ValueError):
+            return None
+        return json.loads(body.decode(ENCODING))
+
+    def stats(self):
+        """Blocos guardados, bytes em disco e bytes que os manifestos representam"""
+        with self.pool.connection() as conn:
+            blocks, stored, logical = conn.execute(STATS_SQL).fetchone()
+        return {
+            'blocks': blocks,
+            'stored_bytes': stored,
+            'logical_bytes': logical,
+            'saved_bytes': logical - stored,
+            'dedup_ratio': logical / stored if stored else 1.0
+        }
+
+class DedupUploadWriter:
+    """Divide o conteúdo em blocos de tamanho fixo guardados no BlockStore.
+
+    O UploadWriter recebe só o manifesto (tamanho e lista de hashes), que
+    substitui o arquivo do usuário no commit.
+    """
+
+    def __init__(self, writer, store, chunk_size=CHUNK_SIZE):
+        self.writer = writer
+        self.store = store
+        self.chunk_size = chunk_size
+        self.blocks = []
+        self.size = 0
+        self._pending = bytearray()
+        self._written = []
+
+    def _put(self, data):
+        self.blocks.append(self.store.put(bytes(data), self._written))
+        self.size += len(data)
+
+    def write(self, data):
+        self._pending += data
+        while len(self._pending) >= self.chunk_size:
+            self._put(self._pending[:self.chunk_size])
+            del self._pending[:self.chunk_size]
+
+    def _write_manifest(self):
+        if self._pending:
+            self._put(self._pending)
+            self._pending.clear()
+        manifest = {'size': self.size, 'chunk_size': self.chunk_size, 'blocks': self.blocks}
+        self.writer.write(self.store.seal_manifest(manifest))
+
+    def prepare(self):
+        # Os blocos novos vão ao disco junto com o manifesto, antes que ele seja publicado
+        self._write_manifest()
+        files, directories = self.writer.prepare()
+        return files + self._written, directories + [os.path.dirname(path) for path in self._written]
+
+    def publish(self):
+        return self.writer.publish()
+
+    def commit(self):
+        self._write_manifest()
+        self.store.sync_blocks(self._written)
+        self.writer.commit()
+
+    def abort(self):
+        self.writer.abort()
+        self.store.release(self.blocks)
+        self.blocks = []
+
+class ManifestFile:
+    """Leitura sequencial do conteúdo de um manifesto, bloco a bloco"""
+
+    def __init__(self, store, blocks, size, chunk_size):
+        self.store = store
+        self.blocks = blocks
+        self.size = size
+        self.chunk_size = chunk_size
+        self._next_index = 0
+        self._data = memoryview(b'')
+        self._pinned = False
+
+    def pin(self):
+        """Segura os blocos até o close, mesmo que outro upload substitua o manifesto e os libere.
+
+        Deve ser chamado enquanto o manifesto ainda é o atual (com o lock de leitura do arquivo).
+        """
+        self.store.retain(self.blocks)
+        self._pinned = True
+
+    def seek(self, offset):
+        """Posiciona a leitura em offset do conteúdo (sempre a partir do início)"""
+        index, skip = divmod(offset, self.chunk_size)
+        self._next_index = index
+        self._data = memoryview(b'')
+        if skip and index < len(self.blocks):
+            self._data = memoryview(self.store.get(self.blocks[index]))[skip:]
+            self._next_index += 1
+        return offset
+
+    def read(self, size=-1):
+        out = bytearray()
+        while size < 0 or len(out) < size:
+            if not self._data:
+                if self._next_index >= len(self.blocks):
+                    break
+                self._data = memoryview(self.store.get(self.blocks[self._next_index]))
+                self._next_index += 1
+                continue
+            piece = self._data if size < 0 else self._data[:size - len(out)]
+            out += piece
+            self._data = self._data[len(piece):]
+        return bytes(out)
+
+    def readinto(self, buffer):
+        data = self.read(len(buffer))
+        buffer[:len(data)] = data
+        return len(data)
+
+    def close(self):
+        self._data = memoryview(b'')
+        if self._pinned:
+            self._pinned = False
+            self.store.release(self.blocks)
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, exc_type, exc, tb):
+        self.close()
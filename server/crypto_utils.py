@@ -1,19 +1,110 @@
 # server/crypto_utils.py
 from cryptography.hazmat.primitives.ciphers import Cipher, algorithms, modes
+from cryptography.hazmat.primitives.ciphers.aead import AESGCM, ChaCha20Poly1305
 from cryptography.hazmat.primitives import hashes, hmac
 from cryptography.hazmat.primitives.kdf.hkdf import HKDF
-from cryptography.hazmat.primitives.asymmetric import ec, rsa
+from cryptography.hazmat.primitives.asymmetric import ec, rsa, x25519
+from cryptography.hazmat.primitives.asymmetric import padding as asym_padding
 from cryptography.hazmat.primitives.kdf.pbkdf2 import PBKDF2HMAC
 from cryptography.hazmat.primitives import serialization
-from cryptography.hazmat.primitives import padding
 from cryptography.hazmat.backends import default_backend
 import os, hashlib
+from compression import Compressor
+
+# Algoritmo e tamanho máximo de chave (em bytes) de cada cifra simétrica em modo CFB
+_SYMMETRIC_ALGORITHMS = {
+    'AES': (algorithms.AES, 32),
+    'DES': (algorithms.TripleDES, 24),
+    'Blowfish': (algorithms.Blowfish, 56),
+}
+
+# Cifras autenticadas (AEAD): cifram e autenticam em uma única passada, sem padding
+_AEAD_ALGORITHMS = {
+    'AES-GCM': AESGCM,
+    'ChaCha20-Poly1305': ChaCha20Poly1305,
+}
+AEAD_NONCE_SIZE = 12
+AEAD_TAG_SIZE = 16
+
+class SessionCipher:
+    """Cifra simétrica de uma sessão, criada uma vez na troca de chaves.
+
+    Resolve o tipo de cifra e prepara a chave só na construção; seal/open
+    apenas sorteiam o IV (ou nonce) e cifram a mensagem. As cifras AEAD
+    rejeitam com InvalidTag qualquer mensagem adulterada. compression é o
+    codec negociado, aplicado pelos quadros antes de cifrar.
+    """
+
+    def __init__(self, key, cipher_type='AES', compression=None):
+        self.cipher_type = cipher_type
+        self.compressor = Compressor(compression) if compression else None
+        self._aead = None
+        if cipher_type in _AEAD_ALGORITHMS:
+            self._aead = _AEAD_ALGORITHMS[cipher_type](bytes(key[:32]))
+            self._iv_size = AEAD_NONCE_SIZE
+            self.overhead = AEAD_NONCE_SIZE + AEAD_TAG_SIZE
+            self._slack = 0
+        elif cipher_type in _SYMMETRIC_ALGORITHMS:
+            algorithm_class, max_key_size = _SYMMETRIC_ALGORITHMS[cipher_type]
+            # A chave derivada no DH tem 32 bytes; 3DES aceita no máximo 24
+            self._algorithm = algorithm_class(bytes(key[:max_key_size]))
+            self._iv_size = self._algorithm.block_size // 8
+            self.overhead = self._iv_size
+            # update_into exige espaço para um bloco a mais que os dados
+            self._slack = self._iv_size - 1
+        else:
+            raise ValueError("Cipher type not supported")
+        # encrypt_into só existe nas versões mais novas do cryptography
+        self._encrypt_into = getattr(self._aead, 'encrypt_into', None)
+
+    def buffer_size(self, data_size):
+        """Espaço que seal_into precisa para cifrar data_size bytes"""
+        return data_size + self.overhead + self._slack
+
+    def seal(self, data, associated_data=None):
+        """Criptografa uma mensagem; retorna IV (ou nonce) + dados cifrados.
+
+        associated_data é autenticado mas não cifrado (só nas cifras AEAD).
+        """
+        iv = os.urandom(self._iv_size)
+        if self._aead is not None:
+            return iv + self._aead.encrypt(iv, data, associated_data)
+        # CFB é um modo de fluxo: dispensa padding e não altera o tamanho da mensagem
+        encryptor = Cipher(self._algorithm, modes.CFB(iv)).encryptor()
+        return iv + encryptor.update(data) + encryptor.finalize()
+
+    def seal_into(self, data, out, associated_data=None):
+        """Como seal, mas grava IV + dados cifrados direto em out; retorna o tamanho gravado"""
+        # Fatias de um bytearray são cópias: a cifra precisa escrever em uma view do próprio out
+        out = memoryview(out)
+        iv = os.urandom(self._iv_size)
+        size = len(data) + self.overhead
+        out[:self._iv_size] = iv
+        if self._aead is None:
+            encryptor = Cipher(self._algorithm, modes.CFB(iv)).encryptor()
+            encryptor.update_into(data, out[self._iv_size:self._iv_size + len(data) + self._slack])
+            encryptor.finalize()
+        elif self._encrypt_into is not None:
+            self._encrypt_into(iv, data, associated_data, out[self._iv_size:size])
+        else:
+            out[self._iv_size:size] = self._aead.encrypt(iv, data, associated_data)
+        return size
+
+    def open(self, encrypted_data, associated_data=None):
+        """Descriptografa uma mensagem produzida por seal"""
+        iv = encrypted_data[:self._iv_size]
+        if self._aead is not None:
+            return self._aead.decrypt(iv, encrypted_data[self._iv_size:], associated_data)
+        decryptor = Cipher(self._algorithm, modes.CFB(iv)).decryptor()
+        return decryptor.update(encrypted_data[self._iv_size:]) + decryptor.finalize()
 
 class CryptoUtils:
     @staticmethod
     def generate_symmetric_key(cipher_type='AES', key_size=256):
-        """Gera chave simétrica para os 3 tipos de cifra"""
-        if cipher_type == 'AES':
+        """Gera chave simétrica para os tipos de cifra suportados"""
+        if cipher_type in _AEAD_ALGORITHMS:
+            return os.urandom(32)
+        elif cipher_type == 'AES':
             return os.urandom(32) if key_size == 256 else os.urandom(16)
         elif cipher_type == 'DES':
             return os.urandom(8)
@@ -25,55 +116,38 @@ class CryptoUtils:
     @staticmethod
     def encrypt_symmetric(data, key, cipher_type='AES'):
         """Criptografa dados com cifra simétrica"""
-        iv = os.urandom(16)
-        
-        if cipher_type == 'AES':
-            cipher = Cipher(algorithms.AES(key), modes.CFB(iv), backend=default_backend())
-        elif cipher_type == 'DES':
-            cipher = Cipher(algorithms.TripleDES(key), modes.CFB(iv), backend=default_backend())
-        elif cipher_type == 'Blowfish':
-            cipher = Cipher(algorithms.Blowfish(key), modes.CFB(iv), backend=default_backend())
-        else:
-            raise ValueError("Cipher type not supported")
-        
-        encryptor = cipher.encryptor()
-        padder = padding.PKCS7(128).padder()
-        padded_data = padder.update(data) + padder.final()
-        encrypted = encryptor.update(padded_data) + encryptor.final()
-        
-        return iv + encrypted
+        return SessionCipher(key, cipher_type).seal(data)
 
     @staticmethod
     def decrypt_symmetric(encrypted_data, key, cipher_type='AES'):
         """Descriptografa dados com cifra simétrica"""
-        iv = encrypted_data[:16]
-        data = encrypted_data[16:]
-        
-        if cipher_type == 'AES':
-            cipher = Cipher(algorithms.AES(key), modes.CFB(iv), backend=default_backend())
-        elif cipher_type == 'DES':
-            cipher = Cipher(algorithms.TripleDES(key), modes.CFB(iv), backend=default_backend())
-        elif cipher_type == 'Blowfish':
-            cipher = Cipher(algorithms.Blowfish(key), modes.CFB(iv), backend=default_backend())
-        else:
-            raise ValueError("Cipher type not supported")
-        
-        decryptor = cipher.decryptor()
-        decrypted = decryptor.update(data) + decryptor.final()
-        
-        unpadder = padding.PKCS7(128).unpadder()
-        unpadded_data = unpadder.update(decrypted) + unpadder.final()
-        
-        return unpadded_data
+        return SessionCipher(key, cipher_type).open(encrypted_data)
+
+    @staticmethod
+    def derive_key(secret, info, salt=None, length=32):
+        """Deriva uma chave de um segredo com HKDF-SHA256"""
+        return HKDF(
+            algorithm=hashes.SHA256(),
+            length=length,
+            salt=salt,
+            info=info,
+            backend=default_backend()
+        ).derive(secret)
 
     @staticmethod
-    def generate_dh_parameters():
+    def generate_dh_parameters(curve='SECP384R1'):
         """Gera parâmetros para Diffie-Hellman"""
-        return ec.generate_private_key(ec.SECP384R1(), default_backend())
+        if curve == 'X25519':
+            return x25519.X25519PrivateKey.generate()
+        elif curve == 'SECP384R1':
+            return ec.generate_private_key(ec.SECP384R1(), default_backend())
+        raise ValueError("Curve not supported")
 
     @staticmethod
     def perform_dh_key_exchange(private_key, peer_public_key):
         """Realiza troca de chaves Diffie-Hellman"""
+        if isinstance(private_key, x25519.X25519PrivateKey):
+            return private_key.exchange(peer_public_key)
         return private_key.exchange(ec.ECDH(), peer_public_key)
 
     @staticmethod
@@ -87,13 +161,22 @@ class CryptoUtils:
         public_key = private_key.public_key()
         return private_key, public_key
 
+    @staticmethod
+    def public_key_fingerprint(public_key):
+        """Impressão digital SHA-256 (hex) da chave pública em DER"""
+        der = public_key.public_bytes(
+            encoding=serialization.Encoding.DER,
+            format=serialization.PublicFormat.SubjectPublicKeyInfo
+        )
+        return hashlib.sha256(der).hexdigest()
+
     @staticmethod
     def encrypt_asymmetric(data, public_key):
         """Criptografa com chave pública (PKI)"""
         return public_key.encrypt(
             data,
-            padding.OAEP(
-                mgf=padding.MGF1(algorithm=hashes.SHA256()),
+            asym_padding.OAEP(
+                mgf=asym_padding.MGF1(algorithm=hashes.SHA256()),
                 algorithm=hashes.SHA256(),
                 label=None
             )
@@ -104,8 +187,8 @@ class CryptoUtils:
         """Descriptografa com chave privada (PKI)"""
         return private_key.decrypt(
             encrypted_data,
-            padding.OAEP(
-                mgf=padding.MGF1(algorithm=hashes.SHA256()),
+            asym_padding.OAEP(
+                mgf=asym_padding.MGF1(algorithm=hashes.SHA256()),
                 algorithm=hashes.SHA256(),
                 label=None
             )
@@ -0,0 +1,120 @@
+# shared/delta.py
+import hashlib
+import math
+import zlib
+from constants import CHUNK_SIZE
+
+# Tamanho de bloco das assinaturas: raiz do tamanho do arquivo (como no rsync), dentro destes limites
+MIN_DELTA_BLOCK = 2048
+MAX_DELTA_BLOCK = CHUNK_SIZE
+# Acima disso o bloco cresce para que a lista de assinaturas caiba em um quadro
+MAX_SIGNATURES = 65536
+# Bytes do hash forte de cada bloco; o arquivo inteiro ainda é conferido com SHA-256
+STRONG_HASH_SIZE = 16
+
+# Módulo do Adler-32: o checksum fraco é o mesmo de zlib.adler32, que calcula blocos novos em C
+_ADLER_MOD = 65521
+
+def delta_block_size(size):
+    block = min(MAX_DELTA_BLOCK, max(MIN_DELTA_BLOCK, math.isqrt(size) // 1024 * 1024))
+    return max(block, -(-size // MAX_SIGNATURES))
+
+def strong_hash(block):
+    return hashlib.sha256(block).hexdigest()[:2 * STRONG_HASH_SIZE]
+
+def file_signatures(f, block_size):
+    """Assinatura de cada bloco de f: [checksum fraco, hash forte]"""
+    signatures = []
+    while True:
+        block = f.read(block_size)
+        if not block:
+            break
+        signatures.append([zlib.adler32(block), strong_hash(block)])
+    return signatures
+
+def compute_delta(f, signatures, block_size, max_literal=None):
+    """Compara f com as assinaturas da cópia do servidor, com checksum deslizante.
+
+    Retorna (operações, SHA-256 de f); cada operação é ['copy', primeiro
+    bloco, quantidade] ou ['data', posição em f, tamanho]. Retorna None se os
+    bytes novos passarem de max_literal e não valer a pena enviar o delta.
+    """
+    # O último bloco da cópia, se menor, nunca coincide com uma janela completa
+    index = {}
+    for number, (weak, strong) in enumerate(signatures):
+        index.setdefault(weak, {}).setdefault(strong, number)
+
+    ops = []
+    literal = 0
+    digest = hashlib.sha256()
+
+    def add_data(offset, length):
+        nonlocal literal
+        if length:
+            literal += length
+            if ops and ops[-1][0] == 'data':
+                ops[-1][2] += length
+            else:
+                ops.append(['data', offset, length])
+
+    def add_copy(number):
+        if ops and ops[-1][0] == 'copy' and ops[-1][1] + ops[-1][2] == number:
+            ops[-1][2] += 1
+        else:
+            ops.append(['copy', number, 1])
+
+    buffer = bytearray()
+    base = 0            # Posição em f de buffer[0]
+    pos = 0             # Início da janela em buffer
+    literal_start = 0   # Posição em f do primeiro byte ainda sem operação
+    weak = None
+    eof = False
+    while True:
+        # A janela precisa de um byte além do bloco para deslizar
+        if len(buffer) - pos <= block_size and not eof:
+            del buffer[:pos]
+            base += pos
+            pos = 0
+            data = f.read(max(CHUNK_SIZE, block_size))
+            if data:
+                buffer += data
+                digest.update(data)
+            else:
+                eof = True
+            continue
+        if len(buffer) - pos < block_size:
+            break
+
+        if weak is None:
+            weak = zlib.adler32(buffer[pos:pos + block_size])
+        candidates = index.get(weak)
+        if candidates:
+            number = candidates.get(strong_hash(buffer[pos:pos + block_size]))
+            if number is not None:
+                add_data(literal_start, base + pos - literal_start)
+                add_copy(number)
+                pos += block_size
+                literal_start = base + pos
+                weak = None
+                continue
+
+        # Desliza byte a byte até o próximo checksum conhecido ou o fim do buffer
+        end = len(buffer) - block_size
+        if pos >= end:
+            break
+        a, b = weak & 0xffff, weak >> 16
+        while True:
+            old, new = buffer[pos], buffer[pos + block_size]
+            a = (a - old + new) % _ADLER_MOD
+            b = (b - block_size * old + a - 1) % _ADLER_MOD
+            pos += 1
+            if pos >= end or ((b << 16) | a) in index:
+                break
+        weak = (b << 16) | a
+        if max_literal is not None and base + pos - literal_start + literal > max_literal:
+            return None
+
+    add_data(literal_start, base + len(buffer) - literal_start)
+    if max_literal is not None and literal > max_literal:
+        return None
+    return ops, digest.hexdigest()
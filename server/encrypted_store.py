@@ -0,0 +1,181 @@
+# server/encrypted_store.py
+import os
+import struct
+from cryptography.exceptions import InvalidTag
+from cryptography.hazmat.primitives.ciphers import Cipher, algorithms, modes
+from cryptography.hazmat.primitives.ciphers.aead import AESGCM
+from chunk_cipher import ChunkCipher, STORED_CHUNK_OVERHEAD
+from constants import CHUNK_SIZE
+from keyfile import load_or_create
+
+# Cabeçalho do formato cifrado: identificador e tamanho do bloco, seguidos da chave do arquivo embrulhada
+MAGIC = b'CRDENC01'
+_HEADER = struct.Struct('!8sI')
+WRAPPED_KEY_SIZE = 12 + 32 + 16
+HEADER_SIZE = _HEADER.size + WRAPPED_KEY_SIZE
+
+class MasterKey:
+    """Chave mestra do servidor; só embrulha e desembrulha as chaves de cada arquivo"""
+
+    def __init__(self, path='master.key'):
+        self._aead = AESGCM(load_or_create(path, lambda: AESGCM.generate_key(256)))
+
+    def wrap(self, key, header):
+        nonce = os.urandom(12)
+        return nonce + self._aead.encrypt(nonce, key, header)
+
+    def unwrap(self, wrapped, header):
+        return self._aead.decrypt(wrapped[:12], wrapped[12:], header)
+
+class EncryptedUploadWriter:
+    """Cifra o conteúdo em blocos antes de passá-lo ao UploadWriter.
+
+    Cada arquivo (e cada nova versão dele) recebe uma chave aleatória própria,
+    guardada no cabeçalho embrulhada pela chave mestra. O último bloco fica em
+    memória até o commit, quando é gravado marcado como final.
+    """
+
+    def __init__(self, writer, master_key, chunk_size=CHUNK_SIZE):
+        self.writer = writer
+        self.chunk_size = chunk_size
+        key = AESGCM.generate_key(256)
+        self._cipher = ChunkCipher(key)
+        self._pending = bytearray()
+        self._index = 0
+        header = _HEADER.pack(MAGIC, chunk_size)
+        writer.write(header + master_key.wrap(key, header))
+
+    def _write_chunk(self, data, last):
+        self.writer.write(self._cipher.seal(self._index, last, data))
+        self._index += 1
+
+    def write(self, data):
+        self._pending += data
+        while len(self._pending) > self.chunk_size:
+            self._write_chunk(self._pending[:self.chunk_size], False)
+            del self._pending[:self.chunk_size]
+
+    def prepare(self):
+        self._write_chunk(self._pending, True)
+        return self.writer.prepare()
+
+    def publish(self):
+        return self.writer.publish()
+
+    def commit(self):
+        self._write_chunk(self._pending, True)
+        self.writer.commit()
+
+    def abort(self):
+        self.writer.abort()
+
+class StagingCipher:
+    """AES-CTR pela posição no arquivo: cifra trechos de um upload em partes em qualquer ordem.
+
+    Sem autenticação: o arquivo de montagem nunca sai do servidor e, no
+    commit, o conteúdo é decifrado e regravado no formato de StoredFile.
+    """
+
+    def __init__(self, key):
+        self._algorithm = algorithms.AES(key)
+
+    def apply(self, offset, data):
+        """Cifra (ou decifra) data, que ocupa a posição offset do arquivo"""
+        block, skip = divmod(offset, 16)
+        encryptor = Cipher(self._algorithm, modes.CTR(block.to_bytes(16, 'big'))).encryptor()
+        return encryptor.update(bytes(skip) + bytes(data))[skip:]
+
+class StoredFile:
+    """Arquivo no formato cifrado, aberto para leitura.
+
+    As posições dos blocos saem do tamanho fixo, sem índice separado:
+    chunk_ranges dá os blocos como estão no disco (para envio sem recifrar)
+    e read/readinto devolvem o conteúdo já decifrado.
+    """
+
+    def __init__(self, f, key, chunk_size, file_size):
+        self.file = f
+        self.key = key
+        self.chunk_size = chunk_size
+        self._cipher = ChunkCipher(key)
+        self._stored_chunk_size = chunk_size + STORED_CHUNK_OVERHEAD
+        body = file_size - HEADER_SIZE
+        self.chunk_count = -(-body // self._stored_chunk_size)
+        self.size = body - self.chunk_count * STORED_CHUNK_OVERHEAD
+        self._file_size = file_size
+        self._next_index = 0
+        self._plain = memoryview(b'')
+
+    @classmethod
+    def open(cls, path, master_key):
+        """Retorna o StoredFile, ou None se o arquivo não estiver no formato cifrado"""
+        f = open(path, 'rb', buffering=0)
+        try:
+            data = os.pread(f.fileno(), HEADER_SIZE, 0)
+            if len(data) == HEADER_SIZE and data.startswith(MAGIC):
+                header = data[:_HEADER.size]
+                _, chunk_size = _HEADER.unpack(header)
+                # Um arquivo comum que comece com MAGIC não passa na autenticação da chave
+                key = master_key.unwrap(data[_HEADER.size:], header)
+                file_size = os.fstat(f.fileno()).st_size
+                if file_size > HEADER_SIZE and chunk_size > 0:
+                    return cls(f, key, chunk_size, file_size)
+        except InvalidTag:
+            pass
+        except BaseException:
+            f.close()
+            raise
+        f.close()
+        return None
+
+    def chunk_ranges(self):
+        """(posição, tamanho) de cada bloco cifrado no arquivo"""
+        for index in range(self.chunk_count):
+            offset = HEADER_SIZE + index * self._stored_chunk_size
+            yield offset, min(self._stored_chunk_size, self._file_size - offset)
+
+    def read_chunk(self, offset, length):
+        return os.pread(self.file.fileno(), length, offset)
+
+    def seek(self, offset):
+        """Posiciona a leitura em offset do conteúdo decifrado (sempre a partir do início)"""
+        index, skip = divmod(offset, self.chunk_size)
+        self._next_index = index
+        self._plain = memoryview(b'')
+        if skip and index < self.chunk_count:
+            self._plain = memoryview(self._next_chunk())[skip:]
+        return offset
+
+    def _next_chunk(self):
+        index = self._next_index
+        offset = HEADER_SIZE + index * self._stored_chunk_size
+        data = self.read_chunk(offset, min(self._stored_chunk_size, self._file_size - offset))
+        self._next_index += 1
+        return self._cipher.open(index, index == self.chunk_count - 1, data)
+
+    def read(self, size=-1):
+        out = bytearray()
+        while size < 0 or len(out) < size:
+            if not self._plain:
+                if self._next_index >= self.chunk_count:
+                    break
+                self._plain = memoryview(self._next_chunk())
+                continue
+            piece = self._plain if size < 0 else self._plain[:size - len(out)]
+            out += piece
+            self._plain = self._plain[len(piece):]
+        return bytes(out)
+
+    def readinto(self, buffer):
+        data = self.read(len(buffer))
+        buffer[:len(data)] = data
+        return len(data)
+
+    def close(self):
+        self.file.close()
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, exc_type, exc, tb):
+        self.close()
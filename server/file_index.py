@@ -0,0 +1,136 @@
+# server/file_index.py
+import os
+import time
+from auth import ConnectionPool
+
+# Banco do índice dentro do diretório do usuário; o '.' o esconde da listagem
+INDEX_FILENAME = '.index.db'
+# Poucos acessos simultâneos ao índice de um mesmo usuário
+INDEX_POOL_SIZE = 2
+# Maior página devolvida por uma listagem
+LIST_PAGE_SIZE = 1000
+# Maior caractere Unicode: nome + isto é o limite superior dos nomes com um prefixo
+_MAX_CHAR = '\U0010ffff'
+
+UPSERT_FILE_SQL = '''
+    INSERT INTO files (name, size, mtime, sha256) VALUES (?, ?, ?, ?)
+    ON CONFLICT(name) DO UPDATE SET size = excluded.size, mtime = excluded.mtime, sha256 = excluded.sha256
+'''
+BACKFILL_SQL = 'INSERT OR IGNORE INTO files (name, size, mtime, sha256) VALUES (?, ?, ?, ?)'
+LIST_SQL = 'SELECT name, size, mtime, sha256 FROM files WHERE name > ? AND name >= ? AND name < ? ORDER BY name LIMIT ?'
+GET_UPLOAD_SQL = 'SELECT name, size, key FROM uploads WHERE id = ?'
+FIND_UPLOAD_SQL = 'SELECT id FROM uploads WHERE name = ? AND size = ? AND tag = ? ORDER BY created DESC LIMIT 1'
+
+class FileIndex:
+    """Índice SQLite dos arquivos de um usuário: nome, tamanho, mtime e SHA-256.
+
+    Listagens são consultas por faixa na chave primária, sem tocar no
+    diretório. Um diretório anterior ao índice é varrido uma única vez
+    (scan), na primeira abertura. O mesmo banco guarda o estado dos uploads
+    em partes, visível a todas as conexões e processos worker do usuário.
+    """
+
+    def __init__(self, user_dir, scan):
+        self.pool = ConnectionPool(os.path.join(user_dir, INDEX_FILENAME), size=INDEX_POOL_SIZE)
+        self._init_db(scan)
+
+    def _init_db(self, scan):
+        with self.pool.connection() as conn:
+            conn.execute('''
+                CREATE TABLE IF NOT EXISTS files (
+                    name TEXT PRIMARY KEY,
+                    size INTEGER NOT NULL,
+                    mtime REAL NOT NULL,
+                    sha256 TEXT
+                )
+            ''')
+            conn.execute('CREATE TABLE IF NOT EXISTS meta (key TEXT PRIMARY KEY, value TEXT)')
+            conn.execute('''
+                CREATE TABLE IF NOT EXISTS uploads (
+                    id TEXT PRIMARY KEY,
+                    name TEXT NOT NULL,
+                    size INTEGER NOT NULL,
+                    key TEXT,
+                    tag TEXT,
+                    created REAL NOT NULL
+                )
+            ''')
+            conn.execute('''
+                CREATE TABLE IF NOT EXISTS upload_ranges (
+                    id TEXT NOT NULL,
+                    start INTEGER NOT NULL,
+                    length INTEGER NOT NULL
+                )
+            ''')
+            conn.execute('CREATE INDEX IF NOT EXISTS upload_ranges_id ON upload_ranges (id)')
+            conn.commit()
+            if self._populated(conn):
+                return
+            # Com o lock de escrita: outro processo pode ter feito a varredura enquanto isso
+            conn.execute('BEGIN IMMEDIATE')
+            if not self._populated(conn):
+                # OR IGNORE preserva linhas gravadas por uploads concluídos durante a varredura
+                conn.executemany(BACKFILL_SQL, scan())
+                conn.execute("INSERT INTO meta (key, value) VALUES ('populated', '1')")
+            conn.commit()
+
+    @staticmethod
+    def _populated(conn):
+        return conn.execute("SELECT 1 FROM meta WHERE key = 'populated'").fetchone() is not None
+
+    def put(self, name, size, mtime, sha256):
+        with self.pool.connection() as conn:
+            conn.execute(UPSERT_FILE_SQL, (name, size, mtime, sha256))
+            conn.commit()
+
+    def list(self, prefix='', after=None, limit=LIST_PAGE_SIZE):
+        """Arquivos em ordem de nome, começando depois de after e filtrados por prefix"""
+        with self.pool.connection() as conn:
+            rows = conn.execute(LIST_SQL, (after or '', prefix, prefix + _MAX_CHAR, limit)).fetchall()
+        return [{'name': name, 'size': size, 'mtime': mtime, 'sha256': sha256}
+                for name, size, mtime, sha256 in rows]
+
+    def begin_upload(self, upload_id, name, size, key=None, tag=None):
+        """Registra um upload em partes; key é a chave (embrulhada) do arquivo de montagem
+        e tag identifica a versão do arquivo do cliente, para a retomada"""
+        with self.pool.connection() as conn:
+            conn.execute('INSERT INTO uploads (id, name, size, key, tag, created) VALUES (?, ?, ?, ?, ?, ?)',
+                         (upload_id, name, size, key, tag, time.time()))
+            conn.commit()
+
+    def find_upload(self, name, size, tag):
+        """Id do upload em andamento mais recente do mesmo arquivo do cliente, ou None"""
+        with self.pool.connection() as conn:
+            row = conn.execute(FIND_UPLOAD_SQL, (name, size, tag)).fetchone()
+        return row[0] if row else None
+
+    def expired_uploads(self, created_before):
+        with self.pool.connection() as conn:
+            return [row[0] for row in conn.execute('SELECT id FROM uploads WHERE created < ?', (created_before,))]
+
+    def get_upload(self, upload_id):
+        """{'name', 'size', 'key', 'ranges'} do upload, ou None se não existir"""
+        with self.pool.connection() as conn:
+            row = conn.execute(GET_UPLOAD_SQL, (upload_id,)).fetchone()
+            if row is None:
+                return None
+            ranges = conn.execute('SELECT start, length FROM upload_ranges WHERE id = ?', (upload_id,)).fetchall()
+        name, size, key = row
+        return {'name': name, 'size': size, 'key': key, 'ranges': ranges}
+
+    def record_range(self, upload_id, start, length, row=None):
+        """Registra (ou, com row, estende) um trecho recebido; retorna o row para as próximas chamadas"""
+        with self.pool.connection() as conn:
+            if row is None:
+                row = conn.execute('INSERT INTO upload_ranges (id, start, length) VALUES (?, ?, ?)',
+                                   (upload_id, start, length)).lastrowid
+            else:
+                conn.execute('UPDATE upload_ranges SET length = ? WHERE rowid = ?', (length, row))
+            conn.commit()
+        return row
+
+    def end_upload(self, upload_id):
+        with self.pool.connection() as conn:
+            conn.execute('DELETE FROM upload_ranges WHERE id = ?', (upload_id,))
+            conn.execute('DELETE FROM uploads WHERE id = ?', (upload_id,))
+            conn.commit()
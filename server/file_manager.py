@@ -1,38 +1,797 @@
 # server/file_manager.py
 import os
 import json
+import hashlib
+import tempfile
+import threading
+import time
+from collections import OrderedDict
 from crypto_utils import CryptoUtils
+from constants import CHUNK_SIZE
+from bundle import BundleReader
+from encrypted_store import MasterKey, EncryptedUploadWriter, StagingCipher, StoredFile
+from block_store import BlockStore, DedupUploadWriter, ManifestFile
+from delta import delta_block_size, file_signatures
+from file_index import FileIndex, LIST_PAGE_SIZE
+from flush_scheduler import FlushScheduler, DEFAULT_SYNC_WINDOW
+from lock_manager import LockManager
+
+# Diretórios de usuário ficam em <base>/.users/ab/cd/<sha256 do nome>: nenhum diretório acumula
+# milhares de entradas e nomes de usuário nunca viram caminhos
+SHARD_ROOT = '.users'
+# Diretórios já resolvidos e índices abertos mantidos em memória por processo
+USER_DIR_CACHE_SIZE = 100000
+INDEX_CACHE_SIZE = 256
+# Arquivos de lock (ver LockManager), compartilhados pelos processos worker
+LOCK_DIRNAME = '.locks'
+# Arquivo de montagem de um upload em partes: <diretório do usuário>/.part-<id>
+PART_PREFIX = '.part-'
+# Um trecho em andamento registra o que já está em disco a cada tantos bytes
+CHECKPOINT_INTERVAL = 16 * 1024 * 1024
+# Uploads em partes não concluídos são descartados depois deste tempo (segundos)
+UPLOAD_SESSION_LIFETIME = 7 * 24 * 3600
+
+def _missing(ranges, size):
+    """Trechos [início, tamanho] de [0, size) ainda não cobertos por ranges"""
+    gaps = []
+    end = 0
+    for start, length in sorted(ranges):
+        if start > end:
+            gaps.append([end, start - end])
+        end = max(end, start + length)
+    if end < size:
+        gaps.append([end, size - end])
+    return gaps
+
+class UploadWriter:
+    """Grava em um arquivo temporário e só publica o nome final no commit.
+
+    Com um FlushScheduler, o commit só retorna com o arquivo e o novo nome em disco.
+    O commit também pode ser feito em dois passos, como faz BatchUploadWriter
+    para sincronizar vários arquivos de uma vez: prepare termina a gravação e
+    retorna (arquivos, diretórios) que precisam chegar ao disco antes do nome
+    final; publish troca o nome e retorna o diretório a sincronizar depois.
+    """
+
+    def __init__(self, final_path, replace=os.replace, flusher=None):
+        self.final_path = final_path
+        self.replace = replace
+        self.flusher = flusher
+        fd, self.temp_path = tempfile.mkstemp(prefix='.upload-', dir=os.path.dirname(final_path))
+        self.file = os.fdopen(fd, 'wb')
+
+    def write(self, data):
+        return self.file.write(data)
+
+    def prepare(self):
+        self.file.close()
+        return [self.temp_path], []
+
+    def publish(self):
+        # os.replace é atômico: leitores veem o arquivo antigo ou o novo, nunca um pela metade
+        self.replace(self.temp_path, self.final_path)
+        return os.path.dirname(self.final_path)
+
+    def commit(self):
+        files, directories = self.prepare()
+        if self.flusher is not None:
+            # Conteúdo em disco antes do rename: depois de uma queda o nome nunca aponta para um arquivo pela metade
+            self.flusher.sync(files=files, directories=directories)
+        directory = self.publish()
+        if self.flusher is not None:
+            self.flusher.sync(directories=[directory])
+
+    def abort(self):
+        self.file.close()
+        try:
+            os.remove(self.temp_path)
+        except FileNotFoundError:
+            pass
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, exc_type, exc, tb):
+        if exc_type is None:
+            self.commit()
+        else:
+            self.abort()
+
+class IndexedUploadWriter:
+    """Registra no índice do usuário o tamanho e o SHA-256 do conteúdo publicado.
+
+    lock() retorna o lock de escrita do arquivo: publicação e índice são um
+    passo só para leitores e para outro upload do mesmo nome.
+    """
+
+    def __init__(self, writer, index, name, lock=None):
+        self.writer = writer
+        self.index = index
+        self.name = name
+        self.lock = lock
+        self.size = 0
+        self._hash = hashlib.sha256()
+
+    def write(self, data):
+        self._hash.update(data)
+        self.size += len(data)
+        return self.writer.write(data)
+
+    def commit(self):
+        if self.lock is None:
+            self._commit()
+            return
+        with self.lock():
+            self._commit()
+
+    def _commit(self):
+        self.writer.commit()
+        self._register()
+
+    def _register(self):
+        self.index.put(self.name, self.size, time.time(), self._hash.hexdigest())
+
+    def prepare(self):
+        return self.writer.prepare()
+
+    def publish(self):
+        if self.lock is None:
+            directory = self.writer.publish()
+            self._register()
+            return directory
+        with self.lock():
+            directory = self.writer.publish()
+            self._register()
+            return directory
+
+    def abort(self):
+        self.writer.abort()
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, exc_type, exc, tb):
+        if exc_type is None:
+            self.commit()
+        else:
+            self.abort()
+
+class RangeWriter:
+    """Grava um trecho de um upload em partes no arquivo de montagem com os.pwrite.
+
+    Conexões diferentes gravam trechos diferentes do mesmo arquivo ao mesmo
+    tempo. O que já está em disco é registrado no índice a cada
+    CHECKPOINT_INTERVAL e quando o trecho termina ou a conexão cai, para que
+    o cliente retome dali.
+    """
+
+    def __init__(self, path, index, upload_id, offset, length, cipher=None, flusher=None):
+        self.path = path
+        self.fd = os.open(path, os.O_WRONLY)
+        self.index = index
+        self.upload_id = upload_id
+        self.offset = offset
+        self.length = length
+        self.cipher = cipher
+        self.flusher = flusher
+        self.position = offset
+        self._recorded = offset
+        self._row = None
+
+    def write(self, data):
+        if self.cipher is not None:
+            data = self.cipher.apply(self.position, data)
+        view = memoryview(data)
+        while view:
+            written = os.pwrite(self.fd, view, self.position)
+            self.position += written
+            view = view[written:]
+        if self.position - self._recorded >= CHECKPOINT_INTERVAL:
+            self._checkpoint()
+
+    def _checkpoint(self):
+        # Só conta como recebido o que já chegou ao disco (com o fsync ligado)
+        if self.position == self._recorded:
+            return
+        if self.flusher is not None:
+            self.flusher.sync(files=[self.path])
+        self._row = self.index.record_range(self.upload_id, self.offset, self.position - self.offset, self._row)
+        self._recorded = self.position
+
+    def commit(self):
+        try:
+            self._checkpoint()
+        finally:
+            os.close(self.fd)
+
+    def abort(self):
+        # Conexão perdida no meio do trecho: o que já foi gravado continua valendo para a retomada
+        try:
+            self._checkpoint()
+        finally:
+            os.close(self.fd)
+
+class BatchUploadWriter:
+    """Grava os arquivos de um pacote e publica todos juntos no commit.
+
+    entries é uma lista de (nome, caminho ou None, tamanho); o conteúdo de
+    nomes inválidos (caminho None) é lido e descartado. Cada arquivo é
+    fechado assim que termina; no commit, com um FlushScheduler, o conteúdo
+    de todos vai ao disco em uma sincronização, os nomes são trocados e os
+    diretórios sincronizados em outra, em vez de duas por arquivo.
+    """
+
+    def __init__(self, entries, compression=None, writer_factory=UploadWriter, flusher=None):
+        self.entries = entries
+        self.writer_factory = writer_factory
+        self.flusher = flusher
+        self.results = {}
+        self._writers = {}
+        # (nome, writer, arquivos, diretórios) dos arquivos completos, à espera do commit
+        self._prepared = []
+        self._reader = BundleReader([size for _, _, size in entries], compression, self._on_data, self._on_end)
+
+    @property
+    def complete(self):
+        return self._reader.complete
+
+    def _writer(self, index):
+        writer = self._writers.get(index)
+        if writer is None:
+            writer = self._writers[index] = self.writer_factory(self.entries[index][1])
+        return writer
+
+    def _on_data(self, index, data):
+        if self.entries[index][1] is not None:
+            self._writer(index).write(data)
+
+    def _on_end(self, index):
+        filename, path, _ = self.entries[index]
+        if path is None:
+            self.results[filename] = 'invalid_filename'
+            return
+        writer = self._writer(index)
+        del self._writers[index]
+        try:
+            files, directories = writer.prepare()
+        except BaseException:
+            writer.abort()
+            raise
+        self._prepared.append((filename, writer, files, directories))
+
+    def write(self, data):
+        self._reader.feed(data)
+
+    def commit(self):
+        if not self.complete:
+            raise ValueError("Pacote incompleto")
+        if self.flusher is not None and self._prepared:
+            self.flusher.sync(files=[path for _, _, files, _ in self._prepared for path in files],
+                              directories={path for _, _, _, directories in self._prepared for path in directories})
+        published = set()
+        while self._prepared:
+            filename, writer, _, _ = self._prepared[0]
+            published.add(writer.publish())
+            # Já publicado: um abort daqui em diante não pode mais desfazê-lo
+            del self._prepared[0]
+            self.results[filename] = 'upload_success'
+        if self.flusher is not None and published:
+            self.flusher.sync(directories=published)
+
+    def abort(self):
+        for writer in self._writers.values():
+            writer.abort()
+        self._writers.clear()
+        for _, writer, _, _ in self._prepared:
+            writer.abort()
+        self._prepared = []
+
+class DeltaUploadWriter:
+    """Reconstrói um arquivo a partir da versão atual e de uma lista de operações.
+
+    ['copy', bloco, quantidade] copia blocos da versão atual; ['data', tamanho]
+    consome bytes enviados pelo cliente. O SHA-256 do resultado é conferido no
+    commit: se não bater (a versão atual mudou depois das assinaturas), nada é
+    publicado e status fica 'delta_mismatch'. O mesmo vale se as operações não
+    produzirem exatamente expected_size bytes, conferido antes de qualquer
+    cópia: um pedido pequeno nunca faz o servidor gravar mais que isso.
+    """
+
+    def __init__(self, base, writer, ops, block_size, expected_hash, expected_size=None):
+        for op in ops:
+            valid = op[0] == 'data' and len(op) == 2 or op[0] == 'copy' and len(op) == 3
+            if not valid or any(not isinstance(n, int) or n < 0 for n in op[1:]):
+                raise ValueError("Invalid delta operation")
+        if block_size <= 0:
+            raise ValueError("Invalid delta block size")
+        self.base = base
+        self.writer = writer
+        self.ops = ops
+        self.block_size = block_size
+        self.expected_hash = expected_hash
+        self.literal_size = sum(op[1] for op in ops if op[0] == 'data')
+        self.expected_size = expected_size
+        self.status = 'upload_success'
+        self._next = 0
+        self._literal = 0
+        self._written = 0
+        self._hash = hashlib.sha256()
+        if expected_size is None or self._copy_size() + self.literal_size != expected_size:
+            # Sem cópias: os bytes novos ainda chegam e são descartados
+            self.status = 'delta_mismatch'
+            self._close_base()
+        self._advance()
+
+    def _copy_size(self):
+        """Bytes que as cópias produzem a partir da versão atual (a última pode ser parcial)"""
+        base_size = self.base.size if self.base is not None else 0
+        return sum(max(0, min(op[2] * self.block_size, base_size - op[1] * self.block_size))
+                   for op in self.ops if op[0] == 'copy')
+
+    def _emit(self, data):
+        if self.status != 'upload_success':
+            return
+        self._written += len(data)
+        if self._written > self.expected_size:
+            raise ValueError("Delta maior que o tamanho anunciado")
+        self._hash.update(data)
+        self.writer.write(data)
+
+    def _advance(self):
+        """Executa as cópias até a próxima operação que espera bytes do cliente"""
+        while self._literal == 0 and self._next < len(self.ops):
+            op = self.ops[self._next]
+            self._next += 1
+            if op[0] == 'data':
+                self._literal = op[1]
+            else:
+                self._copy(op[1], op[2])
+
+    def _copy(self, first, count):
+        if self.base is None:
+            self.status = 'delta_mismatch'
+            return
+        self.base.seek(first * self.block_size)
+        remaining = count * self.block_size
+        while remaining > 0:
+            data = self.base.read(min(CHUNK_SIZE, remaining))
+            if not data:
+                break  # Versão atual menor que o esperado; o hash final acusa
+            remaining -= len(data)
+            self._emit(data)
+
+    def write(self, data):
+        data = memoryview(data)
+        while data:
+            if self._literal == 0:
+                raise ValueError("Delta maior que o anunciado")
+            piece = data[:self._literal]
+            self._emit(piece)
+            self._literal -= len(piece)
+            data = data[len(piece):]
+            self._advance()
+
+    def _close_base(self):
+        if self.base is not None:
+            self.base.close()
+            self.base = None
+
+    def commit(self):
+        self._advance()
+        self._close_base()
+        rebuilt = self._written == self.expected_size and self._hash.hexdigest() == self.expected_hash
+        if self.status == 'upload_success' and rebuilt:
+            self.writer.commit()
+        else:
+            self.status = 'delta_mismatch'
+            self.writer.abort()
+
+    def abort(self):
+        self._close_base()
+        self.writer.abort()
 
 class FileManager:
-    def __init__(self, base_dir='server_files'):
+    def __init__(self, base_dir='server_files', encrypt_at_rest=False, master_key_path='master.key',
+                 dedup=False, blocks_dir='server_blocks', sync_window=DEFAULT_SYNC_WINDOW):
+        if encrypt_at_rest and dedup:
+            # Cada arquivo cifrado tem chave própria, então blocos iguais nunca coincidiriam
+            raise ValueError("Encryption at rest and deduplication cannot be combined")
         self.base_dir = base_dir
-        if not os.path.exists(base_dir):
-            os.makedirs(base_dir)
-    
+        # A chave mestra e o repositório de blocos são sempre carregados: arquivos
+        # já guardados em qualquer formato continuam legíveis com os modos desligados
+        self.encrypt_at_rest = encrypt_at_rest
+        self.master_key = MasterKey(master_key_path)
+        self.dedup = dedup
+        # Uploads só são confirmados depois do fsync, feito em lotes; sync_window None desliga o fsync
+        self.flusher = FlushScheduler(sync_window) if sync_window is not None else None
+        self.block_store = BlockStore(self.master_key, blocks_dir, self.flusher)
+        self._user_dirs = {}
+        self._indexes = OrderedDict()
+        self._index_lock = threading.Lock()
+        # exist_ok evita corrida entre processos worker criando o mesmo diretório
+        os.makedirs(base_dir, exist_ok=True)
+        # Chaves: o diretório do usuário e o caminho de cada arquivo
+        self.locks = LockManager(os.path.join(base_dir, LOCK_DIRNAME))
+
     def get_user_dir(self, username):
-        user_dir = os.path.join(self.base_dir, username)
-        if not os.path.exists(user_dir):
-            os.makedirs(user_dir)
+        # Resolvido uma vez por processo; depois disso nenhuma chamada ao sistema de arquivos
+        user_dir = self._user_dirs.get(username)
+        if user_dir is None:
+            user_dir = self._create_user_dir(username)
+            if len(self._user_dirs) >= USER_DIR_CACHE_SIZE:
+                self._user_dirs.clear()
+            self._user_dirs[username] = user_dir
         return user_dir
-    
-    def save_file(self, username, filename, file_data):
+
+    def _create_user_dir(self, username):
+        digest = hashlib.sha256(username.encode()).hexdigest()
+        user_dir = os.path.join(self.base_dir, SHARD_ROOT, digest[:2], digest[2:4], digest)
+        if not os.path.isdir(user_dir):
+            os.makedirs(os.path.dirname(user_dir), exist_ok=True)
+            # Exclusivo: outro worker não cria o diretório novo (vazio) antes do rename
+            with self.locks.acquire(exclusive=[user_dir]):
+                # Layout antigo (<base>/<usuário>) é migrado no primeiro acesso, com um rename
+                if username == os.path.basename(username) and not username.startswith('.'):
+                    try:
+                        os.rename(os.path.join(self.base_dir, username), user_dir)
+                    except OSError:
+                        pass  # Sem diretório antigo, ou outro processo já migrou
+                os.makedirs(user_dir, exist_ok=True)
+        return user_dir
+
+    def _index(self, user_dir):
+        with self._index_lock:
+            index = self._indexes.get(user_dir)
+            if index is not None:
+                self._indexes.move_to_end(user_dir)
+                return index
+        # Fora do lock: a primeira abertura pode varrer um diretório grande
+        index = FileIndex(user_dir, lambda: self._scan(user_dir))
+        with self._index_lock:
+            self._indexes[user_dir] = index
+            while len(self._indexes) > INDEX_CACHE_SIZE:
+                self._indexes.popitem(last=False)
+        return index
+
+    def _scan(self, user_dir):
+        """Linhas do índice para arquivos gravados antes dele existir (hash desconhecido)"""
+        for entry in os.scandir(user_dir):
+            if not entry.name.startswith('.') and entry.is_file():
+                yield entry.name, self._plain_size(entry.path), entry.stat().st_mtime, None
+
+    @staticmethod
+    def _safe_filename(filename):
+        # Usa apenas o nome base para impedir acesso fora do diretório do usuário
+        filename = os.path.basename(filename)
+        if not filename or filename.startswith('.'):
+            # Nomes iniciados por '.' são reservados para arquivos internos do servidor
+            raise ValueError("Invalid filename")
+        return filename
+
+    def get_file_path(self, username, filename):
+        return os.path.join(self.get_user_dir(username), self._safe_filename(filename))
+
+    def _resolve_batch(self, username, filenames):
+        """Resolve vários nomes com uma única consulta ao diretório do usuário"""
         user_dir = self.get_user_dir(username)
-        filepath = os.path.join(user_dir, filename)
-        
-        with open(filepath, 'wb') as f:
-            f.write(file_data.encode('latin1'))  # Revertendo a codificação latin1 usada no cliente
-    
-    def get_file(self, username, filename):
+        paths = []
+        for filename in filenames:
+            try:
+                paths.append(os.path.join(user_dir, self._safe_filename(filename)))
+            except ValueError:
+                paths.append(None)
+        return paths
+
+    def _read_lock(self, paths):
+        """Lock de leitura dos arquivos em paths (e dos seus diretórios de usuário)"""
+        return self.locks.acquire(shared={os.path.dirname(path) for path in paths} | set(paths))
+
+    def _write_lock(self, path):
+        """Lock de escrita de um arquivo: publicação e registro no índice"""
+        return self.locks.acquire(shared=[os.path.dirname(path)], exclusive=[path])
+
+    def _new_writer(self, path):
+        # Substituir um manifesto libera os blocos dele, qualquer que seja o formato novo
+        writer = UploadWriter(path, self.block_store.replace_file, self.flusher)
+        if self.encrypt_at_rest:
+            writer = EncryptedUploadWriter(writer, self.master_key)
+        elif self.dedup:
+            writer = DedupUploadWriter(writer, self.block_store)
+        # Por fora dos demais: tamanho e hash são sempre os do conteúdo original
+        return IndexedUploadWriter(writer, self._index(os.path.dirname(path)), os.path.basename(path),
+                                   lambda: self._write_lock(path))
+
+    def _open_stored_format(self, path):
+        """StoredFile ou ManifestFile conforme o formato do arquivo; None se for um arquivo comum"""
+        stored = StoredFile.open(path, self.master_key)
+        if stored is not None:
+            return stored
+        return self.block_store.open_manifest(path)
+
+    def open_plain(self, path):
+        """Abre para leitura do conteúdo original, decifrando ou remontando os blocos se preciso"""
+        reader = self._open_stored_format(path)
+        return reader if reader is not None else open(path, 'rb', buffering=0)
+
+    def _open_current(self, path):
+        """Abre a versão atual de path com o tamanho do conteúdo em reader.size; None se não existir.
+
+        A abertura é feita com o lock de leitura, então nunca cai entre a
+        publicação de um upload e o registro dele no índice. Depois disso o
+        leitor segue com a versão aberta, mesmo que outro upload a substitua.
+        """
+        with self._read_lock([path]):
+            return self._open_sized(path)
+
+    def _open_sized(self, path):
+        if not os.path.isfile(path):
+            return None
+        reader = self.open_plain(path)
+        if isinstance(reader, ManifestFile):
+            # O lock vale só para a abertura; os blocos precisam durar a leitura inteira
+            reader.pin()
+        if not hasattr(reader, 'size'):
+            reader.size = os.fstat(reader.fileno()).st_size
+        return reader
+
+    def _plain_size(self, path):
+        reader = self._open_stored_format(path)
+        if reader is None:
+            return os.path.getsize(path)
+        with reader:
+            return reader.size
+
+    def open_upload(self, username, filename):
+        return self._new_writer(self.get_file_path(username, filename))
+
+    def open_batch_upload(self, username, files, compression=None):
+        """files: lista de {'filename', 'size'} na ordem em que aparecem no pacote"""
+        paths = self._resolve_batch(username, [f['filename'] for f in files])
+        entries = [(f['filename'], path, f['size']) for f, path in zip(files, paths)]
+        return BatchUploadWriter(entries, compression, self._new_writer, self.flusher)
+
+    def get_batch_files(self, username, filenames):
+        """Retorna [(nome, leitor ou None, tamanho)]; leitor None para nomes inválidos ou ausentes.
+
+        Todos são abertos com um único lock de leitura: o pacote inteiro é de
+        um mesmo instante, e o conteúdo sempre tem o tamanho do manifesto.
+        """
+        paths = self._resolve_batch(username, filenames)
+        entries = []
+        try:
+            with self._read_lock([path for path in paths if path is not None]):
+                for filename, path in zip(filenames, paths):
+                    f = self._open_sized(path) if path is not None else None
+                    entries.append((filename, f, f.size if f is not None else 0))
+        except BaseException:
+            for _, f, _ in entries:
+                if f is not None:
+                    f.close()
+            raise
+        return entries
+
+    def open_delta_upload(self, username, filename, ops, block_size, expected_hash, expected_size=None):
+        """Upload incremental sobre a versão atual do arquivo (ver DeltaUploadWriter)"""
+        filepath = self.get_file_path(username, filename)
+        base = self._open_current(filepath)
+        writer = None
+        try:
+            writer = self._new_writer(filepath)
+            return DeltaUploadWriter(base, writer, ops, block_size, expected_hash, expected_size)
+        except BaseException:
+            if writer is not None:
+                writer.abort()
+            if base is not None:
+                base.close()
+            raise
+
+    def _part_path(self, user_dir, upload_id):
+        return os.path.join(user_dir, PART_PREFIX + upload_id)
+
+    def begin_ranged_upload(self, username, filename, size, tag=None):
+        """Cria o arquivo de montagem, já com o tamanho final, de um upload em partes; retorna o id.
+
+        Com tag (a versão do arquivo no cliente), um upload ainda aberto do
+        mesmo arquivo é reaproveitado e só os trechos que faltam precisam ser enviados.
+        """
+        filename = self._safe_filename(filename)
+        if size < 0:
+            raise ValueError("Invalid size")
+        user_dir = self.get_user_dir(username)
+        index = self._index(user_dir)
+        self._expire_ranged_uploads(user_dir, index)
+        if tag is not None:
+            upload_id = index.find_upload(filename, size, tag)
+            if upload_id is not None:
+                return upload_id
+        upload_id = os.urandom(16).hex()
+        key = None
+        if self.encrypt_at_rest:
+            # Os trechos também ficam cifrados em disco até o commit; a chave vai embrulhada para o índice
+            key = self.master_key.wrap(os.urandom(32), upload_id.encode()).hex()
+        fd = os.open(self._part_path(user_dir, upload_id), os.O_WRONLY | os.O_CREAT | os.O_EXCL, 0o600)
+        try:
+            self._preallocate(fd, size)
+        finally:
+            os.close(fd)
+        if self.flusher is not None:
+            # Os trechos registrados no índice precisam de um arquivo de montagem que sobreviva a uma queda
+            self.flusher.sync(directories=[user_dir])
+        index.begin_upload(upload_id, filename, size, key, tag)
+        return upload_id
+
+    def _expire_ranged_uploads(self, user_dir, index):
+        for upload_id in index.expired_uploads(time.time() - UPLOAD_SESSION_LIFETIME):
+            index.end_upload(upload_id)
+            self._remove_part(user_dir, upload_id)
+
+    def _remove_part(self, user_dir, upload_id):
+        try:
+            os.remove(self._part_path(user_dir, upload_id))
+        except FileNotFoundError:
+            pass
+
+    @staticmethod
+    def _preallocate(fd, size):
+        # Reserva o espaço de uma vez: trechos gravados fora de ordem não fragmentam o arquivo
+        if not size:
+            return
+        try:
+            os.posix_fallocate(fd, 0, size)
+        except (AttributeError, OSError):
+            os.ftruncate(fd, size)
+
+    def _ranged_upload(self, username, upload_id):
+        """(diretório, índice, estado) de um upload em partes; None se o id não existir"""
         user_dir = self.get_user_dir(username)
-        filepath = os.path.join(user_dir, filename)
-        
-        if os.path.exists(filepath):
-            with open(filepath, 'rb') as f:
-                return f.read().decode('latin1')  # Codificando em latin1 para preservar todos os bytes
+        index = self._index(user_dir)
+        upload = index.get_upload(str(upload_id))
+        if upload is None:
+            return None
+        return user_dir, index, upload
+
+    def _staging_cipher(self, upload_id, upload):
+        if upload['key'] is None:
+            return None
+        return StagingCipher(self.master_key.unwrap(bytes.fromhex(upload['key']), upload_id.encode()))
+
+    def open_range_upload(self, username, upload_id, offset, length):
+        """Writer de um trecho do upload em partes, gravado direto na sua posição"""
+        found = self._ranged_upload(username, upload_id)
+        if found is None:
+            raise ValueError("Unknown upload")
+        user_dir, index, upload = found
+        if offset < 0 or length < 0 or offset + length > upload['size']:
+            raise ValueError("Range outside the file")
+        return RangeWriter(self._part_path(user_dir, upload_id), index, upload_id, offset, length,
+                           self._staging_cipher(upload_id, upload), self.flusher)
+
+    def ranged_upload_status(self, username, upload_id):
+        """Tamanho, bytes contíguos já recebidos desde o início e trechos que faltam; None se não existir"""
+        found = self._ranged_upload(username, upload_id)
+        if found is None:
+            return None
+        upload = found[2]
+        missing = _missing(upload['ranges'], upload['size'])
+        return {
+            'size': upload['size'],
+            'offset': missing[0][0] if missing else upload['size'],
+            'missing': missing
+        }
+
+    def commit_ranged_upload(self, username, upload_id):
+        """Publica o upload em partes se todos os trechos chegaram; retorna o status para o cliente"""
+        found = self._ranged_upload(username, upload_id)
+        if found is None:
+            return 'upload_not_found'
+        user_dir, index, upload = found
+        if _missing(upload['ranges'], upload['size']):
+            return 'upload_incomplete'
+        part_path = self._part_path(user_dir, upload_id)
+        final_path = os.path.join(user_dir, upload['name'])
+        cipher = self._staging_cipher(upload_id, upload)
+        if cipher is None and not self.encrypt_at_rest and not self.dedup:
+            # O arquivo de montagem já é o conteúdo final (e já está em disco): basta o rename atômico
+            digest = self._file_hash(part_path)
+            with self._write_lock(final_path):
+                self.block_store.replace_file(part_path, final_path)
+                if self.flusher is not None:
+                    self.flusher.sync(directories=[user_dir])
+                index.put(upload['name'], upload['size'], time.time(), digest)
+        else:
+            # Regravado no formato do modo ativo, como um upload comum
+            with open(part_path, 'rb') as f, self._new_writer(final_path) as writer:
+                position = 0
+                for data in iter(lambda: f.read(CHUNK_SIZE), b''):
+                    writer.write(cipher.apply(position, data) if cipher is not None else data)
+                    position += len(data)
+            os.remove(part_path)
+        index.end_upload(upload_id)
+        return 'upload_success'
+
+    def abort_ranged_upload(self, username, upload_id):
+        found = self._ranged_upload(username, upload_id)
+        if found is None:
+            return
+        user_dir, index, _ = found
+        index.end_upload(upload_id)
+        self._remove_part(user_dir, upload_id)
+
+    @staticmethod
+    def _file_hash(path):
+        digest = hashlib.sha256()
+        with open(path, 'rb') as f:
+            for data in iter(lambda: f.read(CHUNK_SIZE), b''):
+                digest.update(data)
+        return digest.hexdigest()
+
+    def get_signatures(self, username, filename):
+        """Assinaturas dos blocos da versão atual para o delta do cliente; None se não existir"""
+        f = self._open_current(self.get_file_path(username, filename))
+        if f is None:
+            return None
+        block_size = delta_block_size(f.size)
+        with f:
+            signatures = file_signatures(f, block_size)
+        return {'size': f.size, 'block_size': block_size, 'signatures': signatures}
+
+    def open_download(self, username, filename):
+        """Leitor da versão atual do arquivo, com o tamanho em reader.size; None se não existir.
+
+        Um StoredFile (arquivo cifrado em disco) pode ser enviado como está.
+        """
+        return self._open_current(self.get_file_path(username, filename))
+
+    def save_file(self, username, filename, chunks):
+        """Grava o arquivo bloco a bloco conforme os blocos chegam"""
+        with self.open_upload(username, filename) as f:
+            for chunk in chunks:
+                f.write(chunk)
+
+    def get_file_size(self, username, filename):
+        filepath = self.get_file_path(username, filename)
+        if os.path.isfile(filepath):
+            return self._plain_size(filepath)
         return None
-    
-    def list_files(self, username):
+
+    @staticmethod
+    def read_chunks(f, chunk_size=CHUNK_SIZE, offset=0, length=None):
+        """Lê o leitor de open_download (ou length bytes a partir de offset) em blocos com readinto
+        em um único buffer.
+
+        Cada bloco é uma memoryview sobre esse buffer e só vale até o próximo.
+        """
+        buffer = bytearray(chunk_size)
+        view = memoryview(buffer)
+        if offset:
+            f.seek(offset)
+        while length is None or length > 0:
+            size = f.readinto(view[:chunk_size if length is None else min(chunk_size, length)])
+            if not size:
+                break
+            if length is not None:
+                length -= size
+            yield view[:size]
+
+    def storage_stats(self):
+        """Economia de disco da deduplicação, somando os arquivos de todos os usuários"""
+        return self.block_store.stats()
+
+    def list_page(self, username, prefix='', after=None, limit=LIST_PAGE_SIZE):
+        """Uma página da listagem pelo índice; retorna (entradas, cursor da próxima ou None)"""
+        limit = max(1, min(limit, LIST_PAGE_SIZE))
         user_dir = self.get_user_dir(username)
-        if os.path.exists(user_dir):
-            return os.listdir(user_dir)
-        return []
\ No newline at end of file
+        with self.locks.acquire(shared=[user_dir]):
+            entries = self._index(user_dir).list(prefix, after, limit + 1)
+        if len(entries) > limit:
+            return entries[:limit], entries[limit - 1]['name']
+        return entries, None
+
+    def list_files(self, username, prefix=''):
+        names = []
+        after = None
+        while True:
+            entries, after = self.list_page(username, prefix, after)
+            names.extend(entry['name'] for entry in entries)
+            if after is None:
+                return names
\ No newline at end of file
@@ -0,0 +1,145 @@
+# server/flush_scheduler.py
+import ctypes
+import os
+import threading
+import time
+from concurrent.futures import ThreadPoolExecutor
+
+# Espera padrão para juntar mais pedidos em um lote (segundos); 0 não acrescenta latência e
+# ainda agrupa os pedidos que chegam enquanto o lote anterior está sendo sincronizado
+DEFAULT_SYNC_WINDOW = 0.0
+# fsyncs emitidos ao mesmo tempo: o dispositivo e o journal os atendem juntos
+SYNC_THREADS = 16
+
+# fdatasync basta para o conteúdo (e o tamanho) de um arquivo; nem todo sistema o tem
+_datasync = getattr(os, 'fdatasync', os.fsync)
+
+def _load_syncfs():
+    """syncfs(2) da libc (Linux); None onde não existe. O módulo os não o expõe"""
+    try:
+        syncfs = ctypes.CDLL(None, use_errno=True).syncfs
+    except (OSError, AttributeError, TypeError):
+        return None
+    syncfs.argtypes = [ctypes.c_int]
+
+    def sync(fd):
+        if syncfs(fd) != 0:
+            errno = ctypes.get_errno()
+            raise OSError(errno, os.strerror(errno))
+    return sync
+
+_syncfs = _load_syncfs()
+
+class FlushScheduler:
+    """Group commit dos fsyncs de muitos uploads concorrentes.
+
+    Uma thread de fundo junta os pedidos que chegam enquanto o lote anterior
+    é sincronizado (mais os que chegarem dentro de window). No Linux, o lote
+    inteiro, conteúdo dos arquivos e entradas de diretório, vai para o disco
+    com um syncfs por sistema de arquivos, em vez de um fsync por arquivo; o
+    syncfs leva junto o que mais estiver pendente no mesmo sistema de
+    arquivos. Sem syncfs, o conteúdo de cada arquivo é sincronizado na hora,
+    pela thread de quem pede (vários arquivos em paralelo), e só os fsyncs de
+    diretório, compartilhados entre os uploads, entram no lote, uma vez por
+    diretório.
+    """
+
+    def __init__(self, window=DEFAULT_SYNC_WINDOW, syncfs=_syncfs):
+        self.window = window
+        self.syncfs = syncfs
+        self._cond = threading.Condition()
+        self._pending = []
+        self._thread = None
+        self._executor = None
+
+    def _start(self):
+        # Criados no primeiro uso: as threads ficam no processo worker, não no que fez o fork
+        with self._cond:
+            if self._thread is None:
+                self._executor = ThreadPoolExecutor(max_workers=SYNC_THREADS)
+                self._thread = threading.Thread(target=self._run, daemon=True)
+                self._thread.start()
+
+    def sync(self, files=(), directories=()):
+        """Retorna quando o conteúdo de files e as entradas de directories estão em disco"""
+        self._start()
+        files = list(files)
+        if self.syncfs is not None:
+            self._wait_batch(files + list(directories))
+            return
+        if len(files) == 1:
+            errors = [self._sync_file(files[0])]
+        else:
+            errors = list(self._executor.map(self._sync_file, files))
+        for error in errors:
+            if error is not None:
+                raise error
+        if directories:
+            self._wait_batch(directories)
+
+    def _wait_batch(self, paths):
+        request = {'paths': set(paths), 'done': threading.Event(), 'error': None}
+        with self._cond:
+            self._pending.append(request)
+            self._cond.notify()
+        request['done'].wait()
+        if request['error'] is not None:
+            raise request['error']
+
+    def _run(self):
+        while True:
+            with self._cond:
+                while not self._pending:
+                    self._cond.wait()
+            if self.window:
+                time.sleep(self.window)
+            with self._cond:
+                batch, self._pending = self._pending, []
+            self._flush(batch)
+
+    def _flush(self, batch):
+        paths = set().union(*(request['paths'] for request in batch))
+        if self.syncfs is not None:
+            errors = self._sync_filesystems(paths)
+        else:
+            errors = dict(zip(paths, self._executor.map(self._sync_directory, paths)))
+        for request in batch:
+            for path in request['paths']:
+                if errors[path] is not None:
+                    request['error'] = errors[path]
+                    break
+            request['done'].set()
+
+    def _sync_filesystems(self, paths):
+        """Um syncfs por sistema de arquivos do lote; retorna o erro (ou None) de cada caminho"""
+        errors = {}
+        devices = {}
+        for path in paths:
+            try:
+                devices.setdefault(os.stat(path).st_dev, []).append(path)
+            except OSError as e:
+                errors[path] = e
+        for same_device in devices.values():
+            error = self._sync_path(same_device[0], os.O_RDONLY, self.syncfs)
+            errors.update((path, error) for path in same_device)
+        return errors
+
+    @staticmethod
+    def _sync_file(path):
+        return FlushScheduler._sync_path(path, os.O_RDONLY, _datasync)
+
+    @staticmethod
+    def _sync_directory(path):
+        return FlushScheduler._sync_path(path, os.O_RDONLY | getattr(os, 'O_DIRECTORY', 0), os.fsync)
+
+    @staticmethod
+    def _sync_path(path, flags, sync):
+        try:
+            fd = os.open(path, flags)
+            try:
+                sync(fd)
+            finally:
+                os.close(fd)
+        except OSError as e:
+            return e
+        return None
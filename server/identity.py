@@ -0,0 +1,37 @@
+# server/identity.py
+from cryptography.hazmat.primitives import serialization
+from cryptography.hazmat.backends import default_backend
+from crypto_utils import CryptoUtils
+from keyfile import load_or_create
+
+class ServerIdentity:
+    """Par de chaves RSA de longa duração usado no método PKI.
+
+    Gerado uma única vez e guardado em disco; nas execuções seguintes (e em
+    cada processo worker) só é carregado. A chave pública em PEM e a impressão
+    digital ficam prontas para irem direto na resposta do handshake.
+    """
+
+    def __init__(self, key_path='server_key.pem'):
+        self.private_key = self._load_or_create(key_path)
+        self.public_key = self.private_key.public_key()
+        self.public_pem = self.public_key.public_bytes(
+            encoding=serialization.Encoding.PEM,
+            format=serialization.PublicFormat.SubjectPublicKeyInfo
+        ).decode()
+        self.fingerprint = CryptoUtils.public_key_fingerprint(self.public_key)
+
+    @staticmethod
+    def _load_or_create(path):
+        def generate():
+            private_key, _ = CryptoUtils.generate_rsa_key_pair()
+            return private_key.private_bytes(
+                encoding=serialization.Encoding.PEM,
+                format=serialization.PrivateFormat.PKCS8,
+                encryption_algorithm=serialization.NoEncryption()
+            )
+        pem = load_or_create(path, generate)
+        return serialization.load_pem_private_key(pem, password=None, backend=default_backend())
+
+    def decrypt(self, encrypted_key):
+        return CryptoUtils.decrypt_asymmetric(encrypted_key, self.private_key)
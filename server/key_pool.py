@@ -0,0 +1,51 @@
+# shared/key_pool.py
+import queue
+import threading
+from crypto_utils import CryptoUtils
+
+# Chaves efêmeras prontas mantidas por curva
+KEY_POOL_SIZE = 64
+
+class EphemeralKeyPool:
+    """Fila de chaves privadas efêmeras geradas antecipadamente.
+
+    Uma thread em segundo plano mantém a fila cheia, de modo que cada handshake
+    só retira uma chave pronta e faz o ECDH. Cada chave é entregue uma única vez;
+    com a fila vazia (pico de conexões) a chave é gerada na hora.
+    """
+
+    def __init__(self, curve='SECP384R1', size=KEY_POOL_SIZE):
+        self.curve = curve
+        self._keys = queue.Queue(maxsize=size)
+        self._filler = None
+        self._lock = threading.Lock()
+
+    def _fill(self):
+        while True:
+            self._keys.put(CryptoUtils.generate_dh_parameters(self.curve))
+
+    def _start(self):
+        # A thread só nasce no primeiro uso, dentro do processo que vai atender conexões
+        with self._lock:
+            if self._filler is None:
+                self._filler = threading.Thread(target=self._fill, daemon=True)
+                self._filler.start()
+
+    def get(self):
+        """Retorna uma chave privada nunca usada"""
+        if self._filler is None:
+            self._start()
+        try:
+            return self._keys.get_nowait()
+        except queue.Empty:
+            return CryptoUtils.generate_dh_parameters(self.curve)
+
+_pools = {}
+_pools_lock = threading.Lock()
+
+def get_key_pool(curve):
+    """Pool único por curva, compartilhado por todas as conexões do processo"""
+    with _pools_lock:
+        if curve not in _pools:
+            _pools[curve] = EphemeralKeyPool(curve)
+        return _pools[curve]
@@ -0,0 +1,23 @@
+# server/keyfile.py
+import os
+import tempfile
+
+def load_or_create(path, generate):
+    """Lê um arquivo de chave; se ainda não existir, grava generate() de forma atômica.
+
+    O conteúdo vai para um temporário publicado com link: se outro processo
+    worker criar o arquivo primeiro, vale o dele e todos leem a mesma chave.
+    """
+    if not os.path.exists(path):
+        fd, tmp_path = tempfile.mkstemp(prefix='.key-', dir=os.path.dirname(os.path.abspath(path)))
+        try:
+            with os.fdopen(fd, 'wb') as f:
+                f.write(generate())
+            os.chmod(tmp_path, 0o600)
+            os.link(tmp_path, path)
+        except FileExistsError:
+            pass
+        finally:
+            os.remove(tmp_path)
+    with open(path, 'rb') as f:
+        return f.read()
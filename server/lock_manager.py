@@ -0,0 +1,65 @@
+# server/lock_manager.py
+import fcntl
+import hashlib
+import os
+
+# Locks distintos: chaves diferentes quase nunca disputam o mesmo, sem um arquivo por chave
+LOCK_STRIPES = 256
+
+class HeldLocks:
+    """Locks obtidos por LockManager.acquire; liberados em release ou no fim do with"""
+
+    def __init__(self, fds):
+        self.fds = fds
+
+    def release(self):
+        # Fechar o descritor desfaz o flock
+        for fd in self.fds:
+            os.close(fd)
+        self.fds = []
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, exc_type, exc, tb):
+        self.release()
+
+class LockManager:
+    """Locks de leitura/escrita por chave (diretório do usuário ou caminho de um arquivo).
+
+    Cada chave cai em uma de `stripes` faixas, e cada faixa é um arquivo em
+    lock_dir travado com flock: compartilhado para leitores, exclusivo para
+    escritores. Por ser flock, vale entre as threads, o executor do motor
+    asyncio e os processos worker. Um mesmo processo não deve pedir de novo
+    uma faixa que já segura: o flock de outro descritor espera como se fosse
+    outro dono.
+    """
+
+    def __init__(self, lock_dir, stripes=LOCK_STRIPES):
+        self.lock_dir = lock_dir
+        self.stripes = stripes
+        os.makedirs(lock_dir, exist_ok=True)
+
+    def _stripe(self, key):
+        # hash() muda a cada processo; os workers precisam concordar na faixa de cada chave
+        digest = hashlib.blake2b(key.encode(), digest_size=4).digest()
+        return int.from_bytes(digest, 'big') % self.stripes
+
+    def acquire(self, shared=(), exclusive=()):
+        """Trava as chaves pedidas e retorna um HeldLocks.
+
+        Faixas repetidas são travadas uma vez só (exclusivo prevalece) e sempre
+        em ordem crescente, para que dois pedidos nunca esperem um pelo outro.
+        """
+        modes = {self._stripe(key): fcntl.LOCK_SH for key in shared}
+        modes.update((self._stripe(key), fcntl.LOCK_EX) for key in exclusive)
+        held = HeldLocks([])
+        try:
+            for stripe in sorted(modes):
+                fd = os.open(os.path.join(self.lock_dir, str(stripe)), os.O_RDONLY | os.O_CREAT, 0o600)
+                held.fds.append(fd)
+                fcntl.flock(fd, modes[stripe])
+        except BaseException:
+            held.release()
+            raise
+        return held
@@ -1,24 +1,70 @@
 # server/main.py
+import os
 import socket
-import json
 import threading
-from crypto_utils import CryptoUtils
+from concurrent.futures import ThreadPoolExecutor
+from cryptography.hazmat.primitives import hashes, serialization
+from cryptography.hazmat.primitives.kdf.hkdf import HKDF
+from cryptography.hazmat.backends import default_backend
+from crypto_utils import CryptoUtils, SessionCipher
 from auth import AuthManager
 from file_manager import FileManager
+from encrypted_store import StoredFile
+from file_index import LIST_PAGE_SIZE
+from flush_scheduler import DEFAULT_SYNC_WINDOW
+from tickets import TicketManager
+from key_pool import get_key_pool
+from identity import ServerIdentity
+from bundle import iter_bundle, BUNDLE_COMPRESSIONS
+from compression import choose_codec
 from constants import *
+from framing import *
+
+# Tentativas de registro/login/retomada aceitas na mesma conexão
+MAX_AUTH_ATTEMPTS = 3
+# Mensagens de troca de chaves: a segunda é o reenvio do PKI após receber a chave do servidor
+MAX_KEY_EXCHANGE_ATTEMPTS = 2
+# Requisições de uma mesma conexão em andamento ao mesmo tempo no motor asyncio; acima disso a leitura espera
+MAX_IN_FLIGHT = 32
+# Threads que atendem downloads e listagens de todas as conexões
+REQUEST_WORKERS = 32
+# No motor de threads, parte do pool que uma conexão pode ocupar: bem abaixo de
+# REQUEST_WORKERS, para que um cliente que pede muito e não lê não tome o pool todo
+MAX_POOLED_PER_CONNECTION = 4
+# Segundos que um envio pode ficar parado (cliente sem ler) antes de a conexão ser encerrada
+SEND_TIMEOUT = 30
+# Ações cujo conteúdo chega em blocos de dados depois do cabeçalho
+UPLOAD_ACTIONS = ('upload', 'upload_batch', 'upload_delta', 'upload_range')
+
+class UploadRejected(Exception):
+    """Falha de um upload específico: só ele recebe o erro e a conexão continua"""
 
 class FileServer:
-    def __init__(self, host='localhost', port=5000):
+    def __init__(self, host='localhost', port=5000, backlog=socket.SOMAXCONN, reuse_port=False,
+                 encrypt_at_rest=False, dedup=False, sync_window=DEFAULT_SYNC_WINDOW):
         self.host = host
         self.port = port
+        self.backlog = backlog
+        self.reuse_port = reuse_port
         self.auth_manager = AuthManager()
-        self.file_manager = FileManager()
+        self.file_manager = FileManager(encrypt_at_rest=encrypt_at_rest, dedup=dedup, sync_window=sync_window)
+        self.ticket_manager = TicketManager()
+        self.identity = ServerIdentity()
+        self.request_executor = ThreadPoolExecutor(max_workers=REQUEST_WORKERS)
         self.clients = {}
+    
+    def create_server_socket(self):
+        server_socket = socket.socket(socket.AF_INET, socket.SOCK_STREAM)
+        server_socket.setsockopt(socket.SOL_SOCKET, socket.SO_REUSEADDR, 1)
+        if self.reuse_port:
+            # Cada processo worker abre seu próprio socket na mesma porta
+            server_socket.setsockopt(socket.SOL_SOCKET, socket.SO_REUSEPORT, 1)
+        server_socket.bind((self.host, self.port))
+        server_socket.listen(self.backlog)
+        return server_socket
         
-    def start(self):
-        self.server_socket = socket.socket(socket.AF_INET, socket.SOCK_STREAM)
-        self.server_socket.bind((self.host, self.port))
-        self.server_socket.listen(5)
+    def start(self, server_socket=None):
+        self.server_socket = server_socket or self.create_server_socket()
         print(f"Servidor iniciado em {self.host}:{self.port}")
         
         while True:
@@ -28,136 +74,536 @@ class FileServer:
     def handle_client(self, client_socket, addr):
         print(f"Conexão estabelecida com {addr}")
         username = None
+        channel = FrameChannel(client_socket, send_timeout=SEND_TIMEOUT)
         
         try:
-            # Autenticação
-            auth_data = self._receive_data(client_socket)
-            if auth_data.get('action') == 'register':
-                success = self.auth_manager.register_user(
-                    auth_data['username'],
-                    auth_data['password'],
-                    auth_data.get('algorithm', 'sha256')
-                )
-                response = {'status': 'success' if success else 'username_taken'}
-                self._send_data(client_socket, response)
-                return
-                
-            elif auth_data.get('action') == 'login':
-                if self.auth_manager.authenticate_user(auth_data['username'], auth_data['password']):
-                    username = auth_data['username']
-                    response = {'status': 'success'}
-                else:
-                    response = {'status': 'invalid_credentials'}
-                self._send_data(client_socket, response)
-                if response['status'] != 'success':
+            # Autenticação; um ticket válido já traz a sessão e dispensa a troca de chaves
+            session = None
+            for _ in range(MAX_AUTH_ATTEMPTS):
+                auth_data = self._receive_data(channel)
+                if auth_data is None:
                     return
+                session, response, username = self._authenticate(auth_data)
+                self._send_data(channel, response)
+                if username:
+                    break
+            if not username:
+                return
             
             # Negociação de chaves
-            key_exchange_data = self._receive_data(client_socket)
+            for _ in range(MAX_KEY_EXCHANGE_ATTEMPTS):
+                if session is not None:
+                    break
+                key_exchange_data = self._receive_data(channel)
+                if key_exchange_data is None:
+                    return
+                session, response = self._negotiate_session(username, key_exchange_data)
+                self._send_data(channel, response)
+            if session is None:
+                return
             
-            if key_exchange_data['method'] == 'DH':
-                # Diffie-Hellman
-                private_key = CryptoUtils.generate_dh_parameters()
-                public_key = private_key.public_key()
-                
-                # Serializa chave pública para enviar ao cliente
-                peer_public_key = serialization.load_pem_public_key(
-                    key_exchange_data['public_key'].encode(),
-                    backend=default_backend()
-                )
-                
-                shared_key = CryptoUtils.perform_dh_key_exchange(
-                    private_key,
-                    peer_public_key
-                )
+            # Loop principal: requisições com id próprio, respondidas fora de ordem
+            self._serve_requests(channel, session, username)
                 
-                # Deriva uma chave para criptografia
-                kdf = HKDF(
-                    algorithm=hashes.SHA256(),
-                    length=32,
-                    salt=None,
-                    info=b'handshake data',
-                    backend=default_backend()
-                )
-                symmetric_key = kdf.derive(shared_key)
-                
-            elif key_exchange_data['method'] == 'PKI':
-                # Usando RSA para enviar chave simétrica
-                private_key = serialization.load_pem_private_key(
-                    key_exchange_data['private_key'].encode(),
-                    password=None,
-                    backend=default_backend()
-                )
-                symmetric_key = CryptoUtils.decrypt_asymmetric(
-                    key_exchange_data['encrypted_key'],
-                    private_key
-                )
+        except Exception as e:
+            print(f"Erro com cliente {addr}: {e}")
+        finally:
+            client_socket.close()
+            if username:
+                print(f"Conexão encerrada com {username}@{addr}")
+            else:
+                print(f"Conexão encerrada com {addr}")
+    
+    def _authenticate(self, auth_data):
+        """Processa registro, login ou retomada; retorna (sessão retomada ou None, resposta, usuário ou None)"""
+        if auth_data.get('action') == 'register':
+            success = self.auth_manager.register_user(
+                auth_data['username'],
+                auth_data['password'],
+                auth_data.get('algorithm')
+            )
+            return None, {'status': 'success' if success else 'username_taken'}, None
+            
+        elif auth_data.get('action') == 'login':
+            if self.auth_manager.authenticate_user(auth_data['username'], auth_data['password']):
+                return None, {'status': 'success'}, auth_data['username']
+            return None, {'status': 'invalid_credentials'}, None
+        
+        elif auth_data.get('action') == 'resume':
+            return self._resume_session(auth_data)
+        
+        return None, {'status': 'invalid_action'}, None
+    
+    def _resume_session(self, auth_data):
+        """Retoma a sessão de um ticket sem verificar senha nem fazer troca assimétrica"""
+        state = self.ticket_manager.open(bytes.fromhex(auth_data['ticket']))
+        if state is None:
+            return None, {'status': 'invalid_ticket'}, None
+        
+        client_nonce = bytes.fromhex(auth_data['nonce'])
+        server_nonce = os.urandom(RESUME_NONCE_SIZE)
+        symmetric_key = self.ticket_manager.resumed_key(
+            bytes.fromhex(state['secret']), client_nonce, server_nonce
+        )
+        
+        compression = choose_codec(auth_data.get('compression'))
+        response = {
+            'status': 'resumed',
+            'nonce': server_nonce.hex(),
+            'cipher_type': state['cipher_type'],
+            'compression': compression
+        }
+        self._issue_ticket(response, state['username'], state['cipher_type'], symmetric_key)
+        return SessionCipher(symmetric_key, state['cipher_type'], compression), response, state['username']
+    
+    def _issue_ticket(self, response, username, cipher_type, symmetric_key):
+        """Acrescenta à resposta um novo ticket para a próxima conexão"""
+        ticket, _ = self.ticket_manager.issue(username, cipher_type, symmetric_key)
+        response['ticket'] = ticket.hex()
+        response['ticket_lifetime'] = self.ticket_manager.lifetime
+    
+    def _refresh_ticket(self, username, session):
+        """Ticket novo pedido na sessão em andamento, antes que o atual expire.
+        
+        O servidor não guarda a chave da sessão; o ticket leva um segredo novo,
+        que segue na própria resposta, cifrada pela sessão.
+        """
+        ticket, secret = self.ticket_manager.issue(username, session.cipher_type, os.urandom(32))
+        return {
+            'status': 'success',
+            'ticket': ticket.hex(),
+            'ticket_lifetime': self.ticket_manager.lifetime,
+            'secret': secret.hex()
+        }
+    
+    def _negotiate_session(self, username, key_exchange_data):
+        """Deriva a chave de sessão; retorna (SessionCipher ou None, resposta para o cliente)"""
+        response = {'status': 'key_exchange_complete'}
+        
+        if key_exchange_data['method'] == 'DH':
+            # Diffie-Hellman com chave efêmera já gerada em segundo plano
+            curve = key_exchange_data.get('curve', 'SECP384R1')
+            if curve not in DH_CURVES:
+                raise ValueError("Curve not supported")
+            private_key = get_key_pool(curve).get()
+            public_key = private_key.public_key()
+            
+            # Serializa chave pública para enviar ao cliente junto com a confirmação
+            response['public_key'] = public_key.public_bytes(
+                encoding=serialization.Encoding.PEM,
+                format=serialization.PublicFormat.SubjectPublicKeyInfo
+            ).decode()
             
-            # Define o tipo de cifra simétrica
-            cipher_type = key_exchange_data.get('cipher_type', 'AES')
+            peer_public_key = serialization.load_pem_public_key(
+                key_exchange_data['public_key'].encode(),
+                backend=default_backend()
+            )
             
-            # Confirmação para o cliente
-            self._send_data(client_socket, {'status': 'key_exchange_complete'})
+            shared_key = CryptoUtils.perform_dh_key_exchange(
+                private_key,
+                peer_public_key
+            )
             
-            # Loop principal para comandos
+            # Deriva uma chave para criptografia
+            kdf = HKDF(
+                algorithm=hashes.SHA256(),
+                length=32,
+                salt=None,
+                info=b'handshake data',
+                backend=default_backend()
+            )
+            symmetric_key = kdf.derive(shared_key)
+            
+        elif key_exchange_data['method'] == 'PKI':
+            # Chave simétrica cifrada com a chave pública de identidade do servidor
+            if key_exchange_data.get('fingerprint') != self.identity.fingerprint:
+                # Cliente sem a chave (ou com uma antiga): envia a pública e aguarda o reenvio
+                return None, {
+                    'status': 'server_key',
+                    'public_key': self.identity.public_pem,
+                    'fingerprint': self.identity.fingerprint
+                }
+            symmetric_key = self.identity.decrypt(bytes.fromhex(key_exchange_data['encrypted_key']))
+            
+        else:
+            raise ValueError("Key exchange method not supported")
+        
+        # Define o tipo de cifra simétrica; a cifra da sessão é montada uma única vez
+        cipher_type = self._choose_cipher(key_exchange_data)
+        response['cipher_type'] = cipher_type
+        # Compressão antes da cifra: primeiro codec da lista do cliente que o servidor conhece
+        compression = choose_codec(key_exchange_data.get('compression'))
+        response['compression'] = compression
+        self._issue_ticket(response, username, cipher_type, symmetric_key)
+        return SessionCipher(symmetric_key, cipher_type, compression), response
+    
+    def _choose_cipher(self, key_exchange_data):
+        """Escolhe a primeira cifra da lista de preferência do cliente que o servidor suporta"""
+        offered = key_exchange_data.get('ciphers') or [key_exchange_data.get('cipher_type', 'AES')]
+        for cipher_type in offered:
+            if cipher_type in SYMMETRIC_CIPHERS:
+                return cipher_type
+        raise ValueError("Cipher type not supported")
+    
+    def _serve_requests(self, channel, session, username):
+        """Lê quadros e despacha cada requisição pelo seu id.
+
+        Uploads são gravados pela própria thread de leitura à medida que os
+        blocos chegam (podem vir intercalados entre requisições); downloads e
+        demais ações vão para o pool de threads e respondem quando terminam.
+        """
+        uploads = {}
+        # Ids de uploads recusados: os blocos que o cliente ainda enviar são descartados
+        discarded = set()
+        in_flight = threading.BoundedSemaphore(MAX_POOLED_PER_CONNECTION)
+        try:
             while True:
-                data = self._receive_encrypted_data(client_socket, symmetric_key, cipher_type)
+                frame = channel.recv()
+                if frame is None:
+                    break
+                frame_type, flags, stream, payload = frame
                 
-                if data['action'] == 'upload':
-                    file_data = data['file_data']
-                    filename = data['filename']
-                    self.file_manager.save_file(username, filename, file_data)
-                    response = {'status': 'upload_success'}
-                    
-                elif data['action'] == 'download':
-                    filename = data['filename']
-                    file_data = self.file_manager.get_file(username, filename)
-                    if file_data:
-                        response = {'status': 'success', 'file_data': file_data}
-                    else:
-                        response = {'status': 'file_not_found'}
-                        
-                elif data['action'] == 'list':
-                    files = self.file_manager.list_files(username)
-                    response = {'status': 'success', 'files': files}
-                    
-                else:
-                    response = {'status': 'invalid_action'}
+                if frame_type == FRAME_DATA:
+                    if stream in discarded:
+                        continue
+                    upload = uploads.get(stream)
+                    if upload is None:
+                        raise FrameError(f"Bloco de upload para requisição desconhecida: {stream}")
+                    chunk = open_frame(session, FRAME_DATA, flags, stream, payload)
+                    try:
+                        done = self._write_upload_chunk(upload, chunk)
+                    except UploadRejected as e:
+                        del uploads[stream]
+                        discarded.add(stream)
+                        upload['writer'].abort()
+                        self._send_encrypted_data(channel, self._reject_upload(username, stream, e), session, stream)
+                        continue
+                    if done:
+                        del uploads[stream]
+                        self._send_encrypted_data(channel, self._upload_response(upload), session, stream)
+                    continue
                 
-                self._send_encrypted_data(client_socket, response, symmetric_key, cipher_type)
+                if frame_type != FRAME_ENCRYPTED:
+                    raise FrameError(f"Tipo de quadro inesperado: {frame_type}")
+                data = decode_json(open_frame(session, FRAME_ENCRYPTED, flags, stream, payload))
                 
-        except Exception as e:
-            print(f"Erro com cliente {addr}: {e}")
+                if data['action'] in UPLOAD_ACTIONS:
+                    # O conteúdo chega em blocos criptografados com o mesmo id
+                    discarded.discard(stream)
+                    try:
+                        upload, done = self._start_upload(username, data)
+                    except UploadRejected as e:
+                        discarded.add(stream)
+                        self._send_encrypted_data(channel, self._reject_upload(username, stream, e), session, stream)
+                        continue
+                    if done:
+                        self._send_encrypted_data(channel, self._upload_response(upload), session, stream)
+                    else:
+                        uploads[stream] = upload
+                else:
+                    in_flight.acquire()
+                    future = self.request_executor.submit(
+                        self._run_request, channel, session, username, stream, data
+                    )
+                    future.add_done_callback(lambda _: in_flight.release())
         finally:
-            client_socket.close()
-            if username:
-                print(f"Conexão encerrada com {username}@{addr}")
+            for upload in uploads.values():
+                upload['writer'].abort()
+    
+    def _start_upload(self, username, data):
+        """Abre o upload e já confirma os que não têm conteúdo; retorna (upload, concluído).
+
+        Qualquer falha (nome reservado, upload_id desconhecido, delta
+        inválido...) vira UploadRejected.
+        """
+        upload = None
+        try:
+            upload = self._open_upload(username, data)
+            if not self._upload_done(upload):
+                return upload, False
+            upload['writer'].commit()
+            return upload, True
+        except Exception as e:
+            if upload is not None:
+                upload['writer'].abort()
+            raise UploadRejected(e) from e
+    
+    @staticmethod
+    def _reject_upload(username, stream, error):
+        print(f"Upload {stream} de {username} recusado: {error}")
+        return {'status': 'error'}
+    
+    def _open_upload(self, username, data):
+        """Prepara a gravação de um upload; remaining None indica um pacote de vários arquivos"""
+        if data['action'] == 'upload_batch':
+            writer = self.file_manager.open_batch_upload(username, data['files'], data.get('compression'))
+            return {'writer': writer, 'remaining': None}
+        if data['action'] == 'upload_delta':
+            # Só os bytes novos chegam pela rede; as cópias saem da versão atual no servidor
+            # size: tamanho final do arquivo; sem ele (clientes antigos) o delta não se aplica
+            size = data.get('size')
+            writer = self.file_manager.open_delta_upload(
+                username, data['filename'], data['ops'], data['block_size'], data['sha256'],
+                int(size) if size is not None else None
+            )
+            return {'writer': writer, 'remaining': writer.literal_size, 'delta': True}
+        if data['action'] == 'upload_range':
+            # Um trecho de um upload em partes, que pode chegar por outra conexão que as demais
+            offset, length = int(data['offset']), int(data['length'])
+            writer = self.file_manager.open_range_upload(username, data['upload_id'], offset, length)
+            return {'writer': writer, 'remaining': length}
+        return {'writer': self.file_manager.open_upload(username, data['filename']), 'remaining': data['size']}
+    
+    @staticmethod
+    def _upload_done(upload):
+        if upload['remaining'] is None:
+            # Pacote: termina quando todos os arquivos do manifesto chegaram
+            return upload['writer'].complete
+        return upload['remaining'] == 0
+    
+    @staticmethod
+    def _write_upload_chunk(upload, chunk):
+        """Grava um bloco; retorna True quando o upload está completo e confirmado.
+
+        Falhas da gravação viram UploadRejected.
+        """
+        try:
+            if upload['remaining'] is not None:
+                if len(chunk) > upload['remaining']:
+                    raise ValueError("Upload maior que o tamanho anunciado")
+                upload['remaining'] -= len(chunk)
+            upload['writer'].write(chunk)
+            if FileServer._upload_done(upload):
+                upload['writer'].commit()
+                return True
+            return False
+        except Exception as e:
+            raise UploadRejected(e) from e
+    
+    @staticmethod
+    def _upload_response(upload):
+        if upload['remaining'] is None:
+            return {'status': 'success', 'results': upload['writer'].results}
+        if upload.get('delta'):
+            return {'status': upload['writer'].status}
+        return {'status': 'upload_success'}
+    
+    @staticmethod
+    def _batch_header(entries, compression):
+        """Manifesto de um download em pacote, com o status de cada arquivo pedido"""
+        return {
+            'status': 'success',
+            'compression': compression,
+            'files': [
+                {'filename': filename, 'status': 'success' if f is not None else 'file_not_found', 'size': size}
+                for filename, f, size in entries
+            ]
+        }
+    
+    def _run_request(self, channel, session, username, stream, data):
+        """Executa uma requisição no pool e envia a resposta com o mesmo id"""
+        try:
+            if data['action'] == 'download':
+                # Tamanho do cabeçalho e conteúdo vêm da mesma abertura, mesmo com um upload do arquivo em andamento
+                f = self.file_manager.open_download(username, data['filename'])
+                if f is None:
+                    response = {'status': 'file_not_found'}
+                elif self._sends_stored(f, data):
+                    with f:
+                        self._send_stored(channel, f, session, stream)
+                    return
+                else:
+                    # Cabeçalho com o tamanho, seguido do conteúdo em blocos
+                    with f:
+                        header, offset, length = self._download_header(data, f.size)
+                        self._send_encrypted_data(channel, header, session, stream)
+                        chunks = self.file_manager.read_chunks(f, offset=offset, length=length)
+                        for chunk, compress in compression_plan(session, chunks):
+                            self._send_encrypted_chunk(channel, chunk, session, stream, compress)
+                    return
+            elif data['action'] == 'download_batch':
+                # Um único manifesto e um único fluxo com o conteúdo de todos os arquivos encontrados
+                compression = data.get('compression')
+                if compression not in BUNDLE_COMPRESSIONS:
+                    raise ValueError("Compression not supported")
+                entries = self.file_manager.get_batch_files(username, data['filenames'])
+                try:
+                    self._send_encrypted_data(channel, self._batch_header(entries, compression), session, stream)
+                    for chunk, compress in compression_plan(session, self._bundle_chunks(entries, compression)):
+                        self._send_encrypted_chunk(channel, chunk, session, stream, compress)
+                finally:
+                    self._close_batch(entries)
+                return
             else:
-                print(f"Conexão encerrada com {addr}")
+                response = self._process_action(username, data, session)
+            self._send_encrypted_data(channel, response, session, stream)
+        except Exception as e:
+            # A falha fica restrita à requisição; o cliente recebe o erro com o mesmo id
+            print(f"Erro na requisição {stream} de {username}: {e}")
+            try:
+                self._send_encrypted_data(channel, {'status': 'error'}, session, stream)
+            except OSError:
+                pass  # Conexão já encerrada
+    
+    @staticmethod
+    def _is_ranged(data):
+        return 'offset' in data or 'length' in data
+    
+    @staticmethod
+    def _sends_stored(f, data):
+        # Trechos de um arquivo cifrado em disco são decifrados aqui, como os de um arquivo comum
+        return isinstance(f, StoredFile) and not FileServer._is_ranged(data)
+    
+    @staticmethod
+    def _bundle_chunks(entries, compression):
+        """Conteúdo de um download em pacote, lido dos arquivos já abertos por get_batch_files"""
+        files = [(f, size) for _, f, size in entries if f is not None]
+        return iter_bundle(files, compression, open_file=lambda f: f)
+    
+    @staticmethod
+    def _close_batch(entries):
+        for _, f, _ in entries:
+            if f is not None:
+                f.close()
+    
+    @staticmethod
+    def _download_header(data, file_size):
+        """Cabeçalho e trecho (posição, tamanho) de um download; offset/length pedem só parte do arquivo"""
+        offset = min(max(0, int(data.get('offset', 0))), file_size)
+        length = file_size - offset
+        if data.get('length') is not None:
+            length = min(length, max(0, int(data['length'])))
+        header = {'status': 'success', 'size': length}
+        if FileServer._is_ranged(data):
+            header.update(offset=offset, total=file_size)
+        return header, offset, length
+    
+    @staticmethod
+    def _stored_header(stored):
+        # A chave do arquivo só trafega dentro do cabeçalho cifrado pela sessão
+        return {
+            'status': 'success',
+            'size': stored.size,
+            'storage': {'key': stored.key.hex(), 'chunk_size': stored.chunk_size}
+        }
+    
+    def _send_stored(self, channel, stored, session, stream):
+        """Download de um arquivo cifrado em disco: os blocos vão como estão, via sendfile"""
+        self._send_encrypted_data(channel, self._stored_header(stored), session, stream)
+        for offset, length in stored.chunk_ranges():
+            channel.send_file(FRAME_DATA, stored.file, offset, length, stream, flags=FLAG_STORED)
     
-    def _receive_data(self, client_socket):
-        raw_length = client_socket.recv(HEADER_SIZE)
-        if not raw_length:
+    def _process_action(self, username, data, session):
+        """Ações que cabem em uma única resposta, comuns aos dois motores"""
+        if data['action'] == 'list':
+            # Paginada pelo índice do usuário: next é o cursor para pedir a página seguinte
+            entries, next_after = self.file_manager.list_page(
+                username, str(data.get('prefix', '')), data.get('after'), int(data.get('limit', LIST_PAGE_SIZE))
+            )
+            response = {'status': 'success', 'files': [entry['name'] for entry in entries], 'next': next_after}
+            if data.get('details'):
+                response['entries'] = entries
+            return response
+        elif data['action'] == 'signatures':
+            signatures = self.file_manager.get_signatures(username, data['filename'])
+            if signatures is None:
+                return {'status': 'file_not_found'}
+            return {'status': 'success', **signatures}
+        elif data['action'] == 'upload_begin':
+            # Upload em partes: os trechos chegam com upload_range, por uma ou várias conexões;
+            # com tag, um upload interrompido do mesmo arquivo é retomado
+            upload_id = self.file_manager.begin_ranged_upload(
+                username, data['filename'], int(data['size']), data.get('tag')
+            )
+            status = self.file_manager.ranged_upload_status(username, upload_id)
+            return {'status': 'success', 'upload_id': upload_id, **status}
+        elif data['action'] == 'upload_status':
+            status = self.file_manager.ranged_upload_status(username, data['upload_id'])
+            if status is None:
+                return {'status': 'upload_not_found'}
+            return {'status': 'success', **status}
+        elif data['action'] == 'upload_commit':
+            return {'status': self.file_manager.commit_ranged_upload(username, data['upload_id'])}
+        elif data['action'] == 'upload_abort':
+            self.file_manager.abort_ranged_upload(username, data['upload_id'])
+            return {'status': 'success'}
+        elif data['action'] == 'storage_stats':
+            return {'status': 'success', 'stats': self.file_manager.storage_stats()}
+        elif data['action'] == 'ticket':
+            return self._refresh_ticket(username, session)
+        
+        return {'status': 'invalid_action'}
+    
+    def _receive_frame(self, channel, expected_type):
+        frame = channel.recv()
+        if frame is None:
+            return None
+        frame_type, flags, stream, payload = frame
+        if frame_type != expected_type:
+            raise FrameError(f"Tipo de quadro inesperado: {frame_type}")
+        return payload
+    
+    def _receive_data(self, channel):
+        payload = self._receive_frame(channel, FRAME_CONTROL)
+        if payload is None:
             return None
-        length = int(raw_length.decode(ENCODING).strip())
-        data = client_socket.recv(length)
-        return json.loads(data.decode(ENCODING))
-    
-    def _send_data(self, client_socket, data):
-        json_data = json.dumps(data).encode(ENCODING)
-        client_socket.send(f"{len(json_data):<{HEADER_SIZE}}".encode(ENCODING))
-        client_socket.send(json_data)
-    
-    def _receive_encrypted_data(self, client_socket, key, cipher_type):
-        encrypted_data = self._receive_data(client_socket)['data']
-        decrypted_data = CryptoUtils.decrypt_symmetric(encrypted_data, key, cipher_type)
-        return json.loads(decrypted_data.decode(ENCODING))
-    
-    def _send_encrypted_data(self, client_socket, data, key, cipher_type):
-        json_data = json.dumps(data).encode(ENCODING)
-        encrypted_data = CryptoUtils.encrypt_symmetric(json_data, key, cipher_type)
-        self._send_data(client_socket, {'data': encrypted_data})
+        return decode_json(payload)
+    
+    def _send_data(self, channel, data):
+        channel.send(FRAME_CONTROL, encode_json(data))
+    
+    def _send_encrypted_data(self, channel, data, session, stream):
+        # JSON grande (listas, assinaturas) comprime bem; os pequenos vão como estão
+        channel.send_sealed(FRAME_ENCRYPTED, encode_json(data), session, stream, compress=True)
+    
+    def _send_encrypted_chunk(self, channel, chunk, session, stream, compress=False):
+        # Cifrado direto no buffer de envio do canal, junto com o cabeçalho
+        channel.send_sealed(FRAME_DATA, chunk, session, stream, compress)
 
 if __name__ == "__main__":
-    server = FileServer()
-    server.start()
\ No newline at end of file
+    import argparse
+    import functools
+    from encrypted_store import MasterKey
+    
+    parser = argparse.ArgumentParser(description="Servidor de arquivos criptografado")
+    parser.add_argument('--host', default='localhost')
+    parser.add_argument('--port', type=int, default=5000)
+    parser.add_argument('--engine', choices=['threads', 'asyncio'], default='threads',
+                        help="Uma thread por conexão ou laço de eventos asyncio")
+    parser.add_argument('--backlog', type=int, default=socket.SOMAXCONN,
+                        help="Tamanho da fila de conexões pendentes")
+    parser.add_argument('--workers', type=int, default=1,
+                        help="Número de processos worker (pre-fork)")
+    parser.add_argument('--encrypt-at-rest', action='store_true',
+                        help="Grava os novos uploads cifrados em disco com a chave mestra")
+    parser.add_argument('--dedup', action='store_true',
+                        help="Guarda os novos uploads em blocos deduplicados pelo conteúdo")
+    parser.add_argument('--sync-window', type=float, default=DEFAULT_SYNC_WINDOW,
+                        help="Segundos de espera para juntar os fsyncs de uploads concorrentes em um lote")
+    parser.add_argument('--no-fsync', action='store_true',
+                        help="Confirma uploads sem esperar o fsync (mais rápido, sem garantia após uma queda)")
+    args = parser.parse_args()
+    if args.encrypt_at_rest and args.dedup:
+        parser.error("--encrypt-at-rest e --dedup não podem ser usados juntos")
+    
+    if args.engine == 'asyncio':
+        from async_server import AsyncFileServer
+        server_class = AsyncFileServer
+    else:
+        server_class = FileServer
+    
+    server_class = functools.partial(
+        server_class,
+        encrypt_at_rest=args.encrypt_at_rest,
+        dedup=args.dedup,
+        sync_window=None if args.no_fsync else args.sync_window
+    )
+    
+    if args.workers > 1:
+        from prefork import PreforkSupervisor
+        # Gera as chaves uma vez antes do fork; os workers só as carregam
+        ServerIdentity()
+        MasterKey()
+        PreforkSupervisor(server_class, args.workers, args.host, args.port, args.backlog).start()
+    else:
+        server_class(args.host, args.port, args.backlog).start()
\ No newline at end of file
@@ -0,0 +1,107 @@
+# server/password_hasher.py
+import hashlib
+import hmac
+import json
+import multiprocessing
+import os
+import threading
+import time
+from concurrent.futures import ProcessPoolExecutor
+from crypto_utils import CryptoUtils
+
+SALT_SIZE = 16
+# Intervalo com que os processos do pool verificam se o servidor ainda existe
+PARENT_CHECK_INTERVAL = 1.0
+
+# Parâmetros de custo atuais; linhas com parâmetros menores são refeitas no próximo login
+KDF_PARAMS = {
+    'scrypt': {'n': 2 ** 14, 'r': 8, 'p': 1},
+    'pbkdf2_sha256': {'iterations': 600000},
+}
+DEFAULT_SCHEME = 'scrypt'
+# Digests simples com salt da versão anterior; só são aceitos para verificação
+LEGACY_SCHEMES = ('md5', 'sha1', 'sha256')
+
+def _watch_parent(parent_pid):
+    # A fila do pool não fecha se o servidor morrer por sinal; sem isto o processo ficaria órfão
+    while os.getppid() == parent_pid:
+        time.sleep(PARENT_CHECK_INTERVAL)
+    os._exit(0)
+
+def _init_pool_process(parent_pid):
+    threading.Thread(target=_watch_parent, args=(parent_pid,), daemon=True).start()
+
+def _derive(password, salt, scheme, params):
+    if scheme == 'scrypt':
+        n, r, p = params['n'], params['r'], params['p']
+        return hashlib.scrypt(password.encode(), salt=salt, n=n, r=r, p=p,
+                              maxmem=256 * n * r + 1024 * 1024, dklen=32)
+    elif scheme == 'pbkdf2_sha256':
+        return hashlib.pbkdf2_hmac('sha256', password.encode(), salt, params['iterations'])
+    raise ValueError("Algorithm not supported")
+
+def _hash_task(password, scheme, params):
+    salt = os.urandom(SALT_SIZE)
+    return salt + _derive(password, salt, scheme, params)
+
+def _verify_task(stored_hash, password, scheme, params):
+    salt = stored_hash[:SALT_SIZE]
+    return hmac.compare_digest(stored_hash[SALT_SIZE:], _derive(password, salt, scheme, params))
+
+class PasswordHasher:
+    """Hash de senhas com KDF lenta executada em um pool de processos limitado.
+
+    O pool roda fora do GIL, então um pico de logins não trava as threads de
+    E/S; max_pending limita quantos cálculos podem ficar na fila ao mesmo tempo.
+    Com max_workers=0 o cálculo é feito na própria thread.
+    """
+
+    def __init__(self, scheme=DEFAULT_SCHEME, max_workers=None, max_pending=None):
+        if scheme not in KDF_PARAMS:
+            raise ValueError("Algorithm not supported")
+        self.scheme = scheme
+        self.max_workers = (os.cpu_count() or 1) if max_workers is None else max_workers
+        self._pending = threading.BoundedSemaphore(max_pending or max(1, self.max_workers) * 4)
+        self._pool = None
+        self._pool_lock = threading.Lock()
+
+    def _get_pool(self):
+        # Criado sob demanda para que cada processo worker tenha o seu, nunca herdado no fork
+        with self._pool_lock:
+            if self._pool is None:
+                self._pool = ProcessPoolExecutor(
+                    max_workers=self.max_workers,
+                    mp_context=multiprocessing.get_context('spawn'),
+                    initializer=_init_pool_process,
+                    initargs=(os.getpid(),)
+                )
+            return self._pool
+
+    def _run(self, func, *args):
+        if not self.max_workers:
+            return func(*args)
+        with self._pending:
+            return self._get_pool().submit(func, *args).result()
+
+    def close(self):
+        """Encerra o pool; cálculos ainda na fila são cancelados"""
+        with self._pool_lock:
+            pool, self._pool = self._pool, None
+        if pool is not None:
+            pool.shutdown(wait=True, cancel_futures=True)
+
+    def hash(self, password, scheme=None):
+        """Retorna (hash, esquema, parâmetros em JSON) para gravar no banco"""
+        scheme = scheme if scheme in KDF_PARAMS else self.scheme
+        params = KDF_PARAMS[scheme]
+        return self._run(_hash_task, password, scheme, params), scheme, json.dumps(params)
+
+    def verify(self, stored_hash, password, scheme, params):
+        if scheme in LEGACY_SCHEMES:
+            return CryptoUtils.verify_password(stored_hash, password, scheme)
+        return self._run(_verify_task, stored_hash, password, scheme, json.loads(params))
+
+    def needs_rehash(self, scheme, params):
+        if scheme != self.scheme:
+            return True
+        return json.loads(params) != KDF_PARAMS[scheme]
\ No newline at end of file
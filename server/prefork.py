@@ -0,0 +1,85 @@
+# server/prefork.py
+import multiprocessing
+import multiprocessing.connection
+import signal
+import socket
+import sys
+import time
+
+# Intervalo mínimo entre reinícios para não entrar em laço quando um worker falha ao subir
+RESTART_DELAY = 1.0
+
+def _run_worker(server_class, host, port, backlog, listen_socket):
+    if listen_socket is None:
+        server = server_class(host, port, backlog, reuse_port=True)
+    else:
+        server = server_class(host, port, backlog)
+    # O cache de usuários é de cada processo e o registro só invalida o do próprio worker:
+    # uma entrada negativa aqui recusaria por um tempo um usuário recém-criado em outro
+    server.auth_manager.cache.negative_ttl = 0
+    try:
+        server.start(listen_socket)
+    except KeyboardInterrupt:
+        pass
+    finally:
+        # O processo só termina depois de juntar os filhos, inclusive os do pool de hash
+        server.auth_manager.close()
+
+class PreforkSupervisor:
+    """Mantém N processos worker atendendo a mesma porta.
+
+    Com SO_REUSEPORT cada worker abre o próprio socket e o kernel distribui as
+    conexões; sem ele, o supervisor abre o socket e os workers o herdam no fork.
+    users.db e server_files são compartilhados pelo sistema de arquivos.
+    """
+
+    def __init__(self, server_class, workers, host='localhost', port=5000, backlog=socket.SOMAXCONN):
+        self.server_class = server_class
+        self.workers = workers
+        self.host = host
+        self.port = port
+        self.backlog = backlog
+        self.listen_socket = None
+        self.processes = []
+        self.context = multiprocessing.get_context('fork')
+
+    def start(self):
+        if not hasattr(socket, 'SO_REUSEPORT'):
+            self.listen_socket = self.server_class(self.host, self.port, self.backlog).create_server_socket()
+
+        # SIGTERM também passa pelo finally e derruba os workers junto
+        signal.signal(signal.SIGTERM, lambda signum, frame: sys.exit(0))
+        print(f"Supervisor iniciando {self.workers} workers em {self.host}:{self.port}")
+        self.processes = [self._spawn() for _ in range(self.workers)]
+
+        try:
+            while True:
+                # Bloqueia até algum worker terminar e então o substitui
+                sentinels = [process.sentinel for process in self.processes]
+                multiprocessing.connection.wait(sentinels)
+                for i, process in enumerate(self.processes):
+                    if not process.is_alive():
+                        print(f"Worker {process.pid} terminou (código {process.exitcode}); reiniciando")
+                        time.sleep(RESTART_DELAY)
+                        self.processes[i] = self._spawn()
+        except KeyboardInterrupt:
+            print("\nEncerrando workers...")
+        finally:
+            self.stop()
+
+    def stop(self):
+        for process in self.processes:
+            if process.is_alive():
+                process.terminate()
+        for process in self.processes:
+            process.join()
+        if self.listen_socket:
+            self.listen_socket.close()
+
+    def _spawn(self):
+        process = self.context.Process(
+            target=_run_worker,
+            args=(self.server_class, self.host, self.port, self.backlog, self.listen_socket)
+        )
+        process.start()
+        return process
\ No newline at end of file
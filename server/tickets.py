@@ -0,0 +1,86 @@
+# server/tickets.py
+import json
+import os
+import struct
+import time
+from cryptography.hazmat.primitives.ciphers.aead import AESGCM
+from crypto_utils import CryptoUtils, AEAD_NONCE_SIZE
+from constants import ENCODING, RESUMPTION_INFO, RESUMED_SESSION_INFO
+from keyfile import load_or_create
+
+# Validade de um ticket emitido e intervalo de rotação da chave que o protege (segundos)
+TICKET_LIFETIME = 3600
+KEY_ROTATION_INTERVAL = 3600
+SECRET_SIZE = 32
+
+# Rótulo do HKDF para a chave de ticket de cada época
+TICKET_KEY_INFO = b'ticket key'
+
+_EPOCH = struct.Struct('!I')
+
+class TicketManager:
+    """Emite e abre tickets de retomada de sessão.
+
+    O ticket é o estado da sessão (usuário, cifra, segredo de retomada e
+    expiração) cifrado com AES-GCM; o servidor não guarda nada por cliente.
+    A chave de cada época é derivada de um segredo em disco, então todos os
+    processos worker aceitam os tickets uns dos outros e a rotação acontece
+    sozinha a cada KEY_ROTATION_INTERVAL. Tickets da época anterior ainda são
+    aceitos até expirarem.
+    """
+
+    def __init__(self, secret_path='ticket.key', lifetime=TICKET_LIFETIME, rotation_interval=KEY_ROTATION_INTERVAL):
+        self.lifetime = lifetime
+        self.rotation_interval = rotation_interval
+        self._secret = load_or_create(secret_path, lambda: os.urandom(SECRET_SIZE))
+        self._keys = {}
+
+    def _current_epoch(self):
+        return int(time.time() // self.rotation_interval)
+
+    def _key(self, epoch):
+        aead = self._keys.get(epoch)
+        if aead is None:
+            key = CryptoUtils.derive_key(self._secret, TICKET_KEY_INFO + _EPOCH.pack(epoch))
+            aead = AESGCM(key)
+            # Só as duas épocas aceitas precisam ficar em memória
+            self._keys = {e: k for e, k in self._keys.items() if e >= epoch - 1}
+            self._keys[epoch] = aead
+        return aead
+
+    def issue(self, username, cipher_type, session_key):
+        """Cria um ticket para a sessão; retorna (ticket, segredo de retomada)"""
+        resumption_secret = CryptoUtils.derive_key(session_key, RESUMPTION_INFO)
+        state = {
+            'username': username,
+            'cipher_type': cipher_type,
+            'secret': resumption_secret.hex(),
+            'expires': int(time.time()) + self.lifetime
+        }
+        epoch = self._current_epoch()
+        header = _EPOCH.pack(epoch)
+        nonce = os.urandom(AEAD_NONCE_SIZE)
+        ciphertext = self._key(epoch).encrypt(nonce, json.dumps(state).encode(ENCODING), header)
+        return header + nonce + ciphertext, resumption_secret
+
+    def open(self, ticket):
+        """Retorna o estado do ticket, ou None se for inválido, de outra época ou expirado"""
+        if len(ticket) <= _EPOCH.size + AEAD_NONCE_SIZE:
+            return None
+        header = ticket[:_EPOCH.size]
+        epoch, = _EPOCH.unpack(header)
+        if epoch not in (self._current_epoch(), self._current_epoch() - 1):
+            return None
+        nonce = ticket[_EPOCH.size:_EPOCH.size + AEAD_NONCE_SIZE]
+        try:
+            state = json.loads(self._key(epoch).decrypt(nonce, ticket[_EPOCH.size + AEAD_NONCE_SIZE:], header))
+        except Exception:
+            return None
+        if state['expires'] < time.time():
+            return None
+        return state
+
+    @staticmethod
+    def resumed_key(resumption_secret, client_nonce, server_nonce):
+        """Chave da sessão retomada: nova a cada conexão graças aos dois nonces"""
+        return CryptoUtils.derive_key(resumption_secret, RESUMED_SESSION_INFO, salt=client_nonce + server_nonce)
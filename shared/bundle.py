@@ -0,0 +1,95 @@
+# shared/bundle.py
+import zlib
+from constants import CHUNK_SIZE
+
+# Compressões aceitas para o conteúdo de um pacote (None = sem compressão)
+BUNDLE_COMPRESSIONS = (None, 'zlib')
+ZLIB_LEVEL = 6
+
+def iter_bundle(files, compression=None, chunk_size=CHUNK_SIZE, open_file=None):
+    """Gera o conteúdo de um pacote em blocos de até chunk_size bytes.
+
+    files é uma lista de (caminho, tamanho); os arquivos são lidos em sequência,
+    concatenados e, se pedido, comprimidos em um único fluxo zlib. open_file
+    permite trocar a abertura dos arquivos (por exemplo, para decifrá-los).
+    """
+    open_file = open_file or (lambda path: open(path, 'rb'))
+    if compression not in BUNDLE_COMPRESSIONS:
+        raise ValueError("Compression not supported")
+    compressor = zlib.compressobj(ZLIB_LEVEL) if compression == 'zlib' else None
+    buffer = bytearray()
+
+    for path, size in files:
+        with open_file(path) as f:
+            remaining = size
+            while remaining > 0:
+                data = f.read(min(chunk_size, remaining))
+                if not data:
+                    raise ValueError(f"Arquivo menor que o tamanho anunciado: {path}")
+                remaining -= len(data)
+                buffer += compressor.compress(data) if compressor else data
+                while len(buffer) >= chunk_size:
+                    yield bytes(buffer[:chunk_size])
+                    del buffer[:chunk_size]
+
+    if compressor:
+        buffer += compressor.flush()
+    while buffer:
+        yield bytes(buffer[:chunk_size])
+        del buffer[:chunk_size]
+
+class BundleReader:
+    """Separa o fluxo de um pacote nos arquivos do manifesto.
+
+    on_data(índice, pedaço) recebe o conteúdo de cada arquivo em ordem e
+    on_end(índice) é chamado quando o arquivo termina (inclusive os vazios).
+    A descompressão nunca produz mais que o total anunciado no manifesto.
+    """
+
+    def __init__(self, sizes, compression=None, on_data=None, on_end=None):
+        if compression not in BUNDLE_COMPRESSIONS:
+            raise ValueError("Compression not supported")
+        self.sizes = list(sizes)
+        if any(not isinstance(size, int) or size < 0 for size in self.sizes):
+            raise ValueError("Tamanho inválido no manifesto")
+        self.on_data = on_data
+        self.on_end = on_end
+        self._decompressor = zlib.decompressobj() if compression == 'zlib' else None
+        self._left = sum(self.sizes)
+        self.index = -1
+        self.remaining = 0
+        self._advance()
+
+    @property
+    def complete(self):
+        if self.index < len(self.sizes):
+            return False
+        return self._decompressor is None or self._decompressor.eof
+
+    def _advance(self):
+        # Passa para o próximo arquivo com conteúdo, encerrando os que já terminaram
+        while self.remaining == 0 and self.index < len(self.sizes):
+            if self.index >= 0:
+                self.on_end(self.index)
+            self.index += 1
+            if self.index < len(self.sizes):
+                self.remaining = self.sizes[self.index]
+
+    def feed(self, data):
+        if self._decompressor is not None:
+            if self._decompressor.eof:
+                raise ValueError("Dados após o fim do pacote")
+            data = self._decompressor.decompress(data, self._left + 1)
+            if self._decompressor.unconsumed_tail or self._decompressor.unused_data:
+                raise ValueError("Pacote maior que o manifesto")
+
+        view = memoryview(data)
+        if len(view) > self._left:
+            raise ValueError("Pacote maior que o manifesto")
+        self._left -= len(view)
+        while view:
+            piece = view[:self.remaining]
+            self.on_data(self.index, piece)
+            self.remaining -= len(piece)
+            view = view[len(piece):]
+            self._advance()
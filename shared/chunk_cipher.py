@@ -0,0 +1,28 @@
+# shared/chunk_cipher.py
+import os
+import struct
+from cryptography.hazmat.primitives.ciphers.aead import AESGCM
+
+# Cada bloco guardado é nonce + dados cifrados + tag
+STORED_NONCE_SIZE = 12
+STORED_CHUNK_OVERHEAD = STORED_NONCE_SIZE + 16
+
+# Dados associados: posição do bloco e se é o último, contra reordenação e truncamento
+_CHUNK_AAD = struct.Struct('!QB')
+
+def stored_chunk_count(size, chunk_size):
+    """Quantidade de blocos de um arquivo guardado; um arquivo vazio ainda tem o bloco final"""
+    return max(1, -(-size // chunk_size))
+
+class ChunkCipher:
+    """Cifra e decifra os blocos de um arquivo guardado com a chave própria do arquivo"""
+
+    def __init__(self, key):
+        self._aead = AESGCM(key)
+
+    def seal(self, index, last, data):
+        nonce = os.urandom(STORED_NONCE_SIZE)
+        return nonce + self._aead.encrypt(nonce, bytes(data), _CHUNK_AAD.pack(index, last))
+
+    def open(self, index, last, data):
+        return self._aead.decrypt(data[:STORED_NONCE_SIZE], data[STORED_NONCE_SIZE:], _CHUNK_AAD.pack(index, last))
@@ -0,0 +1,87 @@
+# tests/conftest.py
+import os
+import socket
+import subprocess
+import sys
+import time
+
+import pytest
+
+ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+SERVER_MAIN = os.path.join(ROOT, 'server', 'main.py')
+
+# Os testes usam o cliente direto; o servidor roda em outro processo, pela linha de comando
+sys.path.insert(0, os.path.join(ROOT, 'client'))
+# Depois do cliente: só os módulos que existem apenas no servidor (lock_manager, flush_scheduler) vêm daqui
+sys.path.append(os.path.join(ROOT, 'server'))
+
+from main import FileClient  # noqa: E402
+
+# Espera máxima para o servidor começar a aceitar conexões (segundos)
+STARTUP_TIMEOUT = 15
+
+
+def _free_port():
+    with socket.socket() as sock:
+        sock.bind(('localhost', 0))
+        return sock.getsockname()[1]
+
+
+def _wait_listening(process, port):
+    deadline = time.monotonic() + STARTUP_TIMEOUT
+    while time.monotonic() < deadline:
+        if process.poll() is not None:
+            raise RuntimeError("O servidor terminou antes de aceitar conexões")
+        try:
+            socket.create_connection(('localhost', port), timeout=0.2).close()
+            return
+        except OSError:
+            time.sleep(0.05)
+    raise RuntimeError("O servidor não começou a aceitar conexões a tempo")
+
+
+@pytest.fixture(params=['threads', 'asyncio'])
+def server(request, tmp_path_factory):
+    """Servidor com os dois motores, cada um em um diretório de trabalho vazio; retorna a porta"""
+    workdir = tmp_path_factory.mktemp('server')
+    port = _free_port()
+    log = open(workdir / 'server.log', 'wb')
+    process = subprocess.Popen(
+        [sys.executable, SERVER_MAIN, '--port', str(port), '--engine', request.param],
+        cwd=workdir, stdout=log, stderr=subprocess.STDOUT
+    )
+    try:
+        _wait_listening(process, port)
+        yield port
+    finally:
+        process.terminate()
+        process.wait(timeout=10)
+        log.close()
+        # Chave pública guardada por host:porta; a porta pode voltar com outro servidor
+        FileClient._server_keys.clear()
+
+
+@pytest.fixture
+def connect(server, tmp_path):
+    """Abre sessões autenticadas (login e troca de chaves) no servidor; fecha todas no fim"""
+    clients = []
+    known_servers = str(tmp_path / 'known_servers.json')
+
+    def open_session(username='alice', password='senha'):
+        client = FileClient(port=server, known_servers_path=known_servers)
+        clients.append(client)
+        client.connect()
+        if not client.login(username, password):
+            # Primeiro uso do nome: registra e entra por uma conexão nova
+            assert client.register(username, password)
+            client.close()
+            client = FileClient(port=server, known_servers_path=known_servers)
+            clients.append(client)
+            client.connect()
+            assert client.login(username, password)
+        assert client.perform_key_exchange('DH', 'AES-GCM')
+        return client
+
+    yield open_session
+    for client in clients:
+        client.close()
@@ -0,0 +1,118 @@
+# tests/test_multiplexing.py
+import os
+import threading
+
+import pytest
+from cryptography.exceptions import InvalidTag
+
+from crypto_utils import SessionCipher
+from framing import FRAME_DATA, FRAME_ENCRYPTED, FRAME_HEADER_SIZE, encode_json, open_frame, sealed_frame
+from main import PendingRequest
+
+# Grande o bastante para o download ainda estar em andamento quando a listagem responder
+BIG_FILE_SIZE = 32 * 1024 * 1024
+
+
+def _write_file(path, data):
+    with open(path, 'wb') as f:
+        f.write(data)
+    return str(path)
+
+
+def test_replies_arrive_out_of_order(connect, tmp_path):
+    client = connect()
+    data = os.urandom(BIG_FILE_SIZE)
+    assert client.upload_file(_write_file(tmp_path / 'big.bin', data), delta=False)
+
+    finished = []
+    lock = threading.Lock()
+
+    def record(name):
+        def callback(_):
+            with lock:
+                finished.append(name)
+        return callback
+
+    # O download é pedido primeiro, mas a listagem, bem mais curta, responde antes dele
+    download = client.download_file_async('big.bin', str(tmp_path / 'copy.bin'))
+    download.add_done_callback(record('download'))
+    listing = client.list_files_async()
+    listing.add_done_callback(record('list'))
+
+    assert listing.result(timeout=30) == ['big.bin']
+    assert download.result(timeout=60)
+    assert finished == ['list', 'download']
+    with open(tmp_path / 'copy.bin', 'rb') as f:
+        assert f.read() == data
+
+
+def test_pipelined_replies_reach_their_requests(connect, tmp_path):
+    client = connect()
+    data = os.urandom(1024 * 1024)
+    assert client.upload_file(_write_file(tmp_path / 'data.bin', data), delta=False)
+
+    # Todos enviados antes de qualquer resposta; cada uma tem de voltar para o id certo
+    offsets = [(i * 37 * 1024, 1000 + i) for i in range(16)]
+    futures = [client.download_range_async('data.bin', offset, length) for offset, length in offsets]
+    listings = [client.list_files_async() for _ in range(4)]
+
+    for (offset, length), future in zip(offsets, futures):
+        assert future.result(timeout=30) == data[offset:offset + length]
+    for listing in listings:
+        assert listing.result(timeout=30) == ['data.bin']
+
+
+@pytest.mark.parametrize('cipher_type', ['AES-GCM', 'ChaCha20-Poly1305'])
+def test_tampered_frame_is_rejected(cipher_type):
+    session = SessionCipher(os.urandom(32), cipher_type)
+    frame = bytes(sealed_frame(FRAME_DATA, b'conteudo do arquivo', session, stream=7))
+    payload = frame[FRAME_HEADER_SIZE:]
+    assert open_frame(session, FRAME_DATA, 0, 7, payload) == b'conteudo do arquivo'
+
+    tampered = bytearray(payload)
+    tampered[-1] ^= 0x01
+    with pytest.raises(InvalidTag):
+        open_frame(session, FRAME_DATA, 0, 7, bytes(tampered))
+    # O corpo intacto também é recusado fora do tipo, id ou flags com que foi cifrado
+    with pytest.raises(InvalidTag):
+        open_frame(session, FRAME_DATA, 0, 8, payload)
+    with pytest.raises(InvalidTag):
+        open_frame(session, FRAME_ENCRYPTED, 0, 7, payload)
+
+
+def test_server_drops_session_on_tampered_frame(connect):
+    client = connect()
+    assert client.list_files() == []
+
+    # Requisição de listagem com um bit trocado no corpo cifrado
+    stream, future = client._register(PendingRequest(lambda response: response))
+    frame = sealed_frame(FRAME_ENCRYPTED, encode_json({'action': 'list'}), client.session, stream)
+    payload = bytearray(frame[FRAME_HEADER_SIZE:])
+    payload[-1] ^= 0x01
+    client.channel.send(FRAME_ENCRYPTED, bytes(payload), stream=stream)
+
+    # O servidor encerra a conexão em vez de responder; a requisição falha
+    with pytest.raises(ConnectionError):
+        future.result(timeout=30)
+
+    # A conta continua utilizável por uma sessão nova
+    assert connect().list_files() == []
+
+
+def test_rejected_download_part_keeps_session(connect, tmp_path):
+    client = connect()
+    data = os.urandom(3 * 1024 * 1024)
+    assert client.upload_file(_write_file(tmp_path / 'part.bin', data), delta=False)
+    _write_file(tmp_path / 'part_copy.bin', bytes(len(data)))
+
+    # Tamanho total diferente do esperado: o trecho falha, mas os blocos dele ainda chegam
+    part = client._download_part_async('part.bin', str(tmp_path / 'part_copy.bin'), 0, 1024 * 1024, len(data) + 1)
+    listing = client.list_files_async()
+    with pytest.raises(ValueError):
+        part.result(timeout=30)
+    assert listing.result(timeout=30) == ['part.bin']
+
+    # Os blocos descartados não derrubam a sessão
+    assert client.download_file('part.bin', str(tmp_path / 'copy.bin'))
+    with open(tmp_path / 'copy.bin', 'rb') as f:
+        assert f.read() == data
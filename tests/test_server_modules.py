@@ -0,0 +1,82 @@
+# tests/test_server_modules.py
+import os
+import threading
+import time
+
+import pytest
+
+from flush_scheduler import FlushScheduler
+from lock_manager import LockManager
+
+
+def test_exclusive_lock_waits_for_shared(tmp_path):
+    locks = LockManager(str(tmp_path / 'locks'))
+    acquired = threading.Event()
+
+    def writer():
+        with locks.acquire(exclusive=['alice/a.txt']):
+            acquired.set()
+
+    with locks.acquire(shared=['alice/a.txt']):
+        thread = threading.Thread(target=writer)
+        thread.start()
+        assert not acquired.wait(0.3)
+    assert acquired.wait(5)
+    thread.join()
+
+
+def test_shared_locks_do_not_block_each_other(tmp_path):
+    locks = LockManager(str(tmp_path / 'locks'))
+    with locks.acquire(shared=['alice']):
+        with locks.acquire(shared=['alice']) as second:
+            assert second.fds
+
+
+def test_repeated_stripes_are_locked_once(tmp_path):
+    # Com uma faixa só, chaves diferentes caem na mesma; pedir as duas não pode travar o próprio pedido
+    locks = LockManager(str(tmp_path / 'locks'), stripes=1)
+    with locks.acquire(shared=['alice', 'bob'], exclusive=['alice/a.txt']) as held:
+        assert len(held.fds) == 1
+
+
+@pytest.mark.parametrize('use_syncfs', [True, False])
+def test_flush_scheduler_syncs_and_reports_errors(tmp_path, use_syncfs):
+    kwargs = {} if use_syncfs else {'syncfs': None}
+    flusher = FlushScheduler(**kwargs)
+    path = tmp_path / 'data.bin'
+    path.write_bytes(b'conteudo')
+
+    flusher.sync(files=[str(path)], directories=[str(tmp_path)])
+    # O erro vai só para o pedido com o caminho ausente; os seguintes continuam funcionando
+    with pytest.raises(FileNotFoundError):
+        flusher.sync(files=[str(tmp_path / 'ausente.bin')])
+    flusher.sync(files=[str(path)])
+
+
+def test_flush_scheduler_batches_concurrent_requests(tmp_path):
+    calls = []
+    release = threading.Event()
+
+    def syncfs(fd):
+        calls.append(fd)
+        release.wait(5)
+
+    flusher = FlushScheduler(syncfs=syncfs)
+    paths = []
+    for i in range(8):
+        path = tmp_path / f'{i}.bin'
+        path.write_bytes(os.urandom(16))
+        paths.append(str(path))
+
+    # O primeiro lote fica preso no syncfs; os pedidos que chegam enquanto isso vão todos no segundo
+    threads = [threading.Thread(target=flusher.sync, kwargs={'files': [p]}) for p in paths]
+    threads[0].start()
+    while not calls:
+        time.sleep(0.01)
+    for thread in threads[1:]:
+        thread.start()
+    time.sleep(0.3)
+    release.set()
+    for thread in threads:
+        thread.join(5)
+    assert len(calls) == 2
@@ -0,0 +1,44 @@
+# tests/test_tickets.py
+import os
+
+from main import FileClient
+
+
+def test_parallel_upload_refreshes_expired_ticket(connect, tmp_path):
+    client = connect()
+    data = os.urandom(12 * 1024 * 1024 + 7)
+    path = tmp_path / 'parallel.bin'
+    path.write_bytes(data)
+
+    # Ticket vencido: é renovado pela sessão em andamento antes de abrir as conexões extras
+    old_ticket = client.ticket['ticket']
+    client.ticket['expires'] = 0
+    assert client.upload_parallel(str(path))
+    assert client.ticket['ticket'] != old_ticket
+    assert client.download_parallel('parallel.bin', str(tmp_path / 'copy.bin'))
+    assert (tmp_path / 'copy.bin').read_bytes() == data
+
+
+def test_refreshed_ticket_resumes_new_connection(connect, server, tmp_path):
+    client = connect()
+    assert client.refresh_ticket()
+
+    resumed = FileClient(port=server, known_servers_path=client.known_servers_path)
+    try:
+        resumed.connect()
+        assert resumed.resume(dict(client.ticket))
+        assert resumed.list_files() == []
+    finally:
+        resumed.close()
+
+
+def test_parallel_transfer_falls_back_without_ticket(connect, tmp_path):
+    client = connect()
+    data = os.urandom(12 * 1024 * 1024)
+    (tmp_path / 'single.bin').write_bytes(data)
+    assert client.upload_file(str(tmp_path / 'single.bin'), delta=False)
+
+    # Ticket que o servidor não aceita: a transferência segue só pela conexão atual
+    client.ticket['ticket'] = '00' * (len(client.ticket['ticket']) // 2)
+    assert client.download_parallel('single.bin', str(tmp_path / 'copy.bin'))
+    assert (tmp_path / 'copy.bin').read_bytes() == data
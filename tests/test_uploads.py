@@ -0,0 +1,108 @@
+# tests/test_uploads.py
+import hashlib
+import os
+import time
+from concurrent.futures import ThreadPoolExecutor
+
+from constants import CHUNK_SIZE
+from main import PendingRequest
+
+# Uploads simultâneos do mesmo nome e quantas vezes cada conexão repete o seu
+CONCURRENT_UPLOADS = 6
+ROUNDS = 5
+
+
+def _write_file(path, data):
+    with open(path, 'wb') as f:
+        f.write(data)
+    return str(path)
+
+
+def _sha256(data):
+    return hashlib.sha256(data).hexdigest()
+
+
+def _wait_received(client, upload_id, minimum, timeout=10):
+    """Status do upload assim que o servidor registrar ao menos minimum bytes recebidos"""
+    deadline = time.monotonic() + timeout
+    while True:
+        status = client._request({'action': 'upload_status', 'upload_id': upload_id})
+        assert status['status'] == 'success'
+        missing = sum(length for _, length in status['missing'])
+        if status['size'] - missing >= minimum or time.monotonic() > deadline:
+            return status
+        time.sleep(0.05)
+
+
+def test_resumable_upload_survives_dropped_connection(connect, tmp_path):
+    data = os.urandom(6 * 1024 * 1024 + 123)
+    path = _write_file(tmp_path / 'resumable.bin', data)
+    stat = os.stat(path)
+    begin = {
+        'action': 'upload_begin',
+        'filename': 'resumable.bin',
+        'size': stat.st_size,
+        'tag': f"{stat.st_size}:{stat.st_mtime_ns}"
+    }
+
+    # Primeira conexão: começa o trecho único do arquivo e cai depois de um terço dele
+    first = connect()
+    response = first._request(begin)
+    assert response['status'] == 'success'
+    upload_id = response['upload_id']
+    stream, _ = first._register(PendingRequest(lambda response: response))
+    first._send_encrypted_message({
+        'action': 'upload_range',
+        'upload_id': upload_id,
+        'offset': 0,
+        'length': len(data)
+    }, stream)
+    sent = len(data) // 3 // CHUNK_SIZE * CHUNK_SIZE
+    with open(path, 'rb', buffering=0) as f:
+        first._send_chunks(first._read_chunks(f, sent), stream)
+    first.close()
+
+    # O que chegou antes da queda fica registrado para a retomada
+    second = connect()
+    status = _wait_received(second, upload_id, sent)
+    assert status['size'] == len(data)
+    assert status['missing'] == [[sent, len(data) - sent]]
+    assert second._request(begin)['upload_id'] == upload_id
+
+    # A retomada envia só o que falta e publica o arquivo inteiro
+    assert second.upload_resumable(path)
+    entry = second.list_page('resumable.bin', limit=1, details=True)['entries'][0]
+    assert entry['size'] == len(data)
+    assert entry['sha256'] == _sha256(data)
+    assert second.download_file('resumable.bin', str(tmp_path / 'copy.bin'))
+    with open(tmp_path / 'copy.bin', 'rb') as f:
+        assert f.read() == data
+
+
+def test_concurrent_same_name_uploads_keep_index_consistent(connect, tmp_path):
+    clients = [connect() for _ in range(CONCURRENT_UPLOADS)]
+    versions = [os.urandom(256 * 1024 + i) for i in range(CONCURRENT_UPLOADS)]
+    paths = []
+    for i, data in enumerate(versions):
+        directory = tmp_path / f'version{i}'
+        directory.mkdir()
+        paths.append(_write_file(directory / 'shared.bin', data))
+
+    def upload(i):
+        return all(clients[i].upload_file(paths[i], delta=False) for _ in range(ROUNDS))
+
+    with ThreadPoolExecutor(CONCURRENT_UPLOADS) as executor:
+        assert all(executor.map(upload, range(CONCURRENT_UPLOADS)))
+
+    # Índice e conteúdo publicados são da mesma versão, seja qual for a última
+    reader = clients[0]
+    entries = reader.list_page('', details=True)['entries']
+    assert [entry['name'] for entry in entries] == ['shared.bin']
+    assert reader.download_file('shared.bin', str(tmp_path / 'copy.bin'))
+    with open(tmp_path / 'copy.bin', 'rb') as f:
+        content = f.read()
+    assert content in versions
+    assert entries[0]['size'] == len(content)
+    assert entries[0]['sha256'] == _sha256(content)
+    # Nenhum arquivo temporário de upload sobra visível para o usuário
+    assert reader.list_files() == ['shared.bin']